@@ -1,822 +1,3288 @@
-import os  
-import sys  
-import zipfile  
-import tempfile  
-import logging  
-from PIL import Image  
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,  
-                           QPushButton, QLabel, QFileDialog, QProgressBar,  
-                           QWidget, QMessageBox, QSpinBox, QGroupBox, QFrame,  
-                           QListWidget, QListWidgetItem, QCheckBox, QSizePolicy,  
-                           QGraphicsDropShadowEffect)  
-from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QMimeData, QSize, QPropertyAnimation,   
-                         QEasingCurve, QSequentialAnimationGroup)  
-from PyQt5.QtGui import (QDragEnterEvent, QDropEvent, QFont, QIcon, QPixmap,   
-                        QColor, QPalette, QLinearGradient, QBrush, QPainter,  
-                        QGuiApplication, QPainterPath)  
-
-# 版本信息  
-VERSION = "1.1.0"  
-AUTHOR = "bbroot"  
-
-# 配置日志  
-logging.basicConfig(  
-    level=logging.INFO,  
-    format='%(asctime)s - %(levelname)s - %(message)s',  
-    filename='word_compressor.log'  
-)  
-
-class CompressionThread(QThread):  
-    progress_updated = pyqtSignal(int, str)  
-    finished_signal = pyqtSignal(bool, str)  
-
-    def __init__(self, input_path, output_path, quality):  
-        super().__init__()  
-        self.input_path = input_path  
-        self.output_path = output_path  
-        self.quality = quality  
-        self.canceled = False  
-
-    def run(self):  
-        try:  
-            # 验证文件  
-            if not os.path.exists(self.input_path):  
-                raise FileNotFoundError("输入文件不存在")  
-            
-            if not self.input_path.lower().endswith(('.docx', '.doc')):  
-                raise ValueError("仅支持Word文档 (.docx/.doc)")  
-
-            # 创建临时目录  
-            with tempfile.TemporaryDirectory() as temp_dir:  
-                # 解压docx文件  
-                with zipfile.ZipFile(self.input_path, 'r') as zip_ref:  
-                    zip_ref.extractall(temp_dir)  
-
-                # 验证docx结构  
-                if not os.path.exists(os.path.join(temp_dir, 'word/media')):  
-                    raise ValueError("无效的Word文档结构")  
-
-                # 处理图片  
-                media_dir = os.path.join(temp_dir, 'word', 'media')  
-                if os.path.exists(media_dir):  
-                    self.process_images(media_dir)  
-
-                # 重新打包  
-                self.repackage(temp_dir)  
-
-                # 验证输出  
-                if not os.path.exists(self.output_path):  
-                    raise RuntimeError("创建输出文件失败")  
-
-                # 计算压缩率  
-                orig_size = os.path.getsize(self.input_path)  
-                comp_size = os.path.getsize(self.output_path)  
-                ratio = (orig_size - comp_size) / orig_size * 100  
-
-                self.finished_signal.emit(  
-                    True,   
-                    f"压缩成功！\n原始大小: {orig_size/1024:.2f}KB "  
-                    f"压缩后: {comp_size/1024:.2f}KB "  
-                    f"(缩小了 {ratio:.1f}%)"  
-                )  
-
-        except Exception as e:  
-            self.finished_signal.emit(False, f"压缩失败: {str(e)}")  
-
-    def process_images(self, media_dir):  
-        """压缩文档中的图片"""  
-        image_files = [f for f in os.listdir(media_dir)   
-                      if f.lower().endswith(('.png', '.jpg', '.jpeg', '.bmp'))]  
-        
-        total = len(image_files)  
-        for i, img_file in enumerate(image_files):  
-            if self.canceled:  
-                break  
-
-            img_path = os.path.join(media_dir, img_file)  
-            try:  
-                with Image.open(img_path) as img:  
-                    # 保持原始格式  
-                    ext = os.path.splitext(img_file)[1].lower()  
-                    if ext in ('.jpg', '.jpeg'):  
-                        img.save(img_path, quality=self.quality, optimize=True)  
-                    elif ext == '.png':  
-                        img.save(img_path, optimize=True)  
-                    else:  
-                        img.save(img_path)  
-                
-                progress = int((i + 1) / total * 100)  
-                self.progress_updated.emit(progress, f"正在处理图片: {img_file}")  
-
-            except Exception as e:  
-                logging.warning(f"图片处理失败: {img_file} - {str(e)}")  
-                continue  
-
-    def repackage(self, temp_dir):  
-        """重新打包Word文档"""  
-        # 确保输出目录存在  
-        os.makedirs(os.path.dirname(self.output_path), exist_ok=True)  
-        
-        # 删除现有文件  
-        if os.path.exists(self.output_path):  
-            os.remove(self.output_path)  
-        
-        # 创建新的zip文件  
-        with zipfile.ZipFile(self.output_path, 'w', zipfile.ZIP_DEFLATED) as zipf:  
-            for root, dirs, files in os.walk(temp_dir):  
-                for file in files:  
-                    file_path = os.path.join(root, file)  
-                    arcname = os.path.relpath(file_path, temp_dir)  
-                    zipf.write(file_path, arcname)  
-
-class ShadowFrame(QFrame):  
-    def __init__(self, parent=None):  
-        super().__init__(parent)  
-        self.shadow = QGraphicsDropShadowEffect()  
-        self.shadow.setBlurRadius(15)  
-        self.shadow.setOffset(3)  
-        self.shadow.setColor(QColor(0, 0, 0, 100))  
-        self.setGraphicsEffect(self.shadow)  
-
-class DropArea(ShadowFrame):  
-    files_dropped = pyqtSignal(list)  
-    clicked = pyqtSignal()  
-
-    def __init__(self, parent=None):  
-        super().__init__(parent)  
-        self.setAcceptDrops(True)  
-        self.setFrameShape(QFrame.StyledPanel)  
-        self.setStyleSheet("""  
-            ShadowFrame {  
-                border: 2px dashed #aaa;  
-                border-radius: 12px;  
-                background-color: rgba(255, 255, 255, 100);  
-                padding: 20px;  
-            }  
-        """)  
-        self.setMinimumSize(300, 180)  
-
-        layout = QVBoxLayout(self)  
-        layout.setAlignment(Qt.AlignCenter)  
-        layout.setSpacing(10)  
-        
-        self.icon = QLabel()  
-        self.icon.setPixmap(QIcon.fromTheme("folder-documents").pixmap(64, 64))  
-        layout.addWidget(self.icon, 0, Qt.AlignCenter)  
-        
-        self.label = QLabel("拖放Word文档到此处\n或点击选择文件")  
-        self.label.setAlignment(Qt.AlignCenter)  
-        self.label.setWordWrap(True)  
-        layout.addWidget(self.label)  
-
-    def dragEnterEvent(self, event):  
-        if event.mimeData().hasUrls():  
-            event.acceptProposedAction()  
-            animate = QPropertyAnimation(self, b"radius")  
-            animate.setDuration(200)  
-            animate.setStartValue(12)  
-            animate.setEndValue(24)  
-            animate.setEasingCurve(QEasingCurve.OutQuad)  
-            animate.start()  
-            
-            # 使用渐变创建悬停效果  
-            gradient = QLinearGradient(0, 0, 0, self.height())  
-            gradient.setColorAt(0, QColor(76, 175, 80, 60))  
-            gradient.setColorAt(1, QColor(56, 142, 60, 60))  
-            
-            self.styledEffect = QWidget(self)  
-            self.styledEffect.setStyleSheet("background: transparent;")  
-            self.styledEffect.resize(self.size())  
-            
-            def paintEvent(event):  
-                painter = QPainter(self.styledEffect)  
-                painter.setRenderHint(QPainter.Antialiasing)  
-                path = QPainterPath()  
-                path.addRoundedRect(self.rect(), 12, 12)  
-                painter.setClipPath(path)  
-                painter.setBrush(QBrush(gradient))  
-                painter.setPen(Qt.NoPen)  
-                painter.drawRoundedRect(self.rect(), 12, 12)  
-                painter.end()  
-                
-            self.styledEffect.paintEvent = paintEvent  
-            self.styledEffect.update()  
-            
-            self.label.raise_()  
-            self.icon.raise_()  
-
-    def dragLeaveEvent(self, event):  
-        self.clear_effects()  
-
-    def dropEvent(self, event):  
-        self.clear_effects()  
-        urls = event.mimeData().urls()  
-        if urls:  
-            files = [url.toLocalFile() for url in urls if url.isLocalFile()]  
-            if files:  
-                self.files_dropped.emit(files)  
-
-    def clear_effects(self):  
-        if hasattr(self, 'styledEffect'):  
-            self.styledEffect.deleteLater()  
-            del self.styledEffect  
-        self.setStyleSheet("""  
-            ShadowFrame {  
-                border: 2px dashed #aaa;  
-                border-radius: 12px;  
-                background-color: rgba(255, 255, 255, 100);  
-                padding: 20px;  
-            }  
-        """)  
-
-    def mousePressEvent(self, event):  
-        if event.button() == Qt.LeftButton:  
-            # 点击动画  
-            self.click_animation = QPropertyAnimation(self, b"size")  
-            self.click_animation.setDuration(100)  
-            self.click_animation.setStartValue(self.size())  
-            self.click_animation.setEndValue(QSize(self.width()-6, self.height()-6))  
-            self.click_animation.setEasingCurve(QEasingCurve.OutQuad)  
-            
-            self.click_animation2 = QPropertyAnimation(self, b"size")  
-            self.click_animation2.setDuration(100)  
-            self.click_animation2.setStartValue(QSize(self.width()-6, self.height()-6))  
-            self.click_animation2.setEndValue(self.size())  
-            self.click_animation2.setEasingCurve(QEasingCurve.InQuad)  
-            
-            self.anim_group = QSequentialAnimationGroup()  
-            self.anim_group.addAnimation(self.click_animation)  
-            self.anim_group.addAnimation(self.click_animation2)  
-            self.anim_group.start()  
-            
-            self.clicked.emit()  
-            
-    def resizeEvent(self, event):  
-        super().resizeEvent(event)  
-        if hasattr(self, 'styledEffect'):  
-            self.styledEffect.resize(self.size())  
-
-class ModernButton(QPushButton):  
-    def __init__(self, text, parent=None):  
-        super().__init__(text, parent)  
-        self.setCursor(Qt.PointingHandCursor)  
-        self.setMinimumHeight(36)  
-        self.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Fixed)  
-        
-        # 默认样式  
-        self.normal_style = """  
-            QPushButton {  
-                background-color: #4CAF50;  
-                color: white;  
-                border: none;  
-                border-radius: 6px;  
-                padding: 8px 16px;  
-                font-weight: 500;  
-                min-width: 100px;  
-            }  
-            QPushButton:hover {  
-                background-color: #45a049;  
-            }  
-            QPushButton:pressed {  
-                background-color: #3d8b40;  
-            }  
-            QPushButton:disabled {  
-                background-color: #cccccc;  
-                color: #666666;  
-            }  
-        """  
-        
-        self.setStyleSheet(self.normal_style)  
-        
-        # 阴影效果  
-        self.shadow = QGraphicsDropShadowEffect()  
-        self.shadow.setBlurRadius(8)  
-        self.shadow.setOffset(2, 2)  
-        self.shadow.setColor(QColor(0, 0, 0, 50))  
-        self.setGraphicsEffect(self.shadow)  
-
-class SecondaryButton(ModernButton):  
-    def __init__(self, text, parent=None):  
-        super().__init__(text, parent)  
-        self.normal_style = """  
-            QPushButton {  
-                background-color: #f0f0f0;  
-                color: #333333;  
-                border: 1px solid #dddddd;  
-                border-radius: 6px;  
-                padding: 8px 16px;  
-                font-weight: 500;  
-                min-width: 100px;  
-            }  
-            QPushButton:hover {  
-                background-color: #e0e0e0;  
-            }  
-            QPushButton:pressed {  
-                background-color: #d0d0d0;  
-            }  
-            QPushButton:disabled {  
-                background-color: #f5f5f5;  
-                color: #aaaaaa;  
-            }  
-        """  
-        self.setStyleSheet(self.normal_style)  
-
-class DangerButton(ModernButton):  
-    def __init__(self, text, parent=None):  
-        super().__init__(text, parent)  
-        self.normal_style = """  
-            QPushButton {  
-                background-color: #f44336;  
-                color: white;  
-                border: none;  
-                border-radius: 6px;  
-                padding: 8px 16px;  
-                font-weight: 500;  
-                min-width: 100px;  
-            }  
-            QPushButton:hover {  
-                background-color: #e53935;  
-            }  
-            QPushButton:pressed {  
-                background-color: #d32f2f;  
-            }  
-            QPushButton:disabled {  
-                background-color: #ffcdd2;  
-                color: #666666;  
-            }  
-        """  
-        self.setStyleSheet(self.normal_style)  
-
-class MainWindow(QMainWindow):  
-    def __init__(self):  
-        super().__init__()  
-        self.setWindowTitle(f"Word文档压缩工具 v{VERSION}")  
-        self.setMinimumSize(1000, 700)  
-        
-        # 初始化变量  
-        self.input_files = []  
-        self.output_dir = ""  
-        self.compression_thread = None  
-        
-        # 设置UI  
-        self.init_ui()  
-        self.update_styles()  
-        
-        # 居中窗口  
-        self.center_window()  
-
-    def center_window(self):  
-        frame = self.frameGeometry()  
-        center_point = QGuiApplication.primaryScreen().availableGeometry().center()  
-        frame.moveCenter(center_point)  
-        self.move(frame.topLeft())  
-
-    def init_ui(self):  
-        # 创建中央部件  
-        central_widget = QWidget()  
-        self.setCentralWidget(central_widget)  
-        
-        # 主布局  
-        main_layout = QVBoxLayout(central_widget)  
-        main_layout.setContentsMargins(30, 30, 30, 30)  
-        main_layout.setSpacing(20)  
-        
-        # 内容区域  
-        content_frame = ShadowFrame()  
-        content_frame.setStyleSheet("""  
-            ShadowFrame {  
-                background-color: white;  
-                border-radius: 12px;  
-            }  
-        """)  
-        content_layout = QVBoxLayout(content_frame)  
-        content_layout.setContentsMargins(20, 20, 20, 20)  
-        content_layout.setSpacing(20)  
-        
-        # 标题区域  
-        title_frame = QFrame()  
-        title_frame.setStyleSheet("""  
-            QFrame {  
-                background: qlineargradient(x1:0, y1:0, x2:1, y2:0,  
-                    stop:0 #4CAF50, stop:1 #81C784);  
-                border-radius: 8px;  
-                padding: 15px;  
-            }  
-        """)  
-        title_layout = QVBoxLayout(title_frame)  
-        title_layout.setSpacing(8)  
-        
-        title_label = QLabel(f"Word文档压缩工具 by {AUTHOR}")  
-        title_label.setAlignment(Qt.AlignCenter)  
-        title_label.setStyleSheet("""  
-            QLabel {  
-                color: white;  
-                font-size: 27px;  
-                font-weight: bold;  
-            }  
-        """)  
-        title_layout.addWidget(title_label)  
-        
-        subtitle_label = QLabel("优化Word文档中的图片，显著减小文件大小")  
-        subtitle_label.setAlignment(Qt.AlignCenter)  
-        subtitle_label.setStyleSheet("""  
-            QLabel {  
-                color: rgba(255, 255, 255, 0.9);  
-                font-size: 15px;  
-            }  
-        """)  
-        title_layout.addWidget(subtitle_label)  
-        
-        content_layout.addWidget(title_frame)  
-
-        # 拖放区域  
-        self.drop_area = DropArea()  
-        self.drop_area.clicked.connect(self.select_input_files)  
-        self.drop_area.files_dropped.connect(self.handle_dropped_files)  
-        content_layout.addWidget(self.drop_area)  
-
-        # 文件列表  
-        self.file_list = QListWidget()  
-        self.file_list.setSelectionMode(QListWidget.ExtendedSelection)  
-        self.file_list.setStyleSheet("""  
-            QListWidget {  
-                border: 1px solid #e0e0e0;  
-                border-radius: 8px;  
-                padding: 5px;  
-                background-color: white;  
-                alternate-background-color: #f9f9f9;  
-            }  
-            QListWidget::item {  
-                padding: 10px;  
-                border-bottom: 1px solid #f0f0f0;  
-            }  
-            QListWidget::item:hover {  
-                background-color: #f5f5f5;  
-            }  
-            QListWidget::item:selected {  
-                background-color: #e3f2fd;  
-                color: #1976d2;  
-            }  
-        """)  
-        content_layout.addWidget(self.file_list)  
-
-        # 列表操作按钮  
-        list_btn_layout = QHBoxLayout()  
-        list_btn_layout.setSpacing(15)  
-        
-        self.clear_btn = SecondaryButton("清空列表")  
-        self.clear_btn.clicked.connect(self.clear_file_list)  
-        list_btn_layout.addWidget(self.clear_btn)  
-        
-        self.remove_btn = SecondaryButton("移除选中")  
-        self.remove_btn.clicked.connect(self.remove_selected_files)  
-        list_btn_layout.addWidget(self.remove_btn)  
-        
-        list_btn_layout.addStretch()  
-        content_layout.addLayout(list_btn_layout)  
-
-        # 设置组  
-        settings_group = ShadowFrame()  
-        settings_group.setStyleSheet("""  
-            ShadowFrame {  
-                background-color: white;  
-                border-radius: 8px;  
-                padding: 15px;  
-            }  
-        """)  
-        
-        settings_layout = QVBoxLayout(settings_group)  
-        settings_layout.setContentsMargins(10, 10, 10, 10)  
-        settings_layout.setSpacing(20)  
-
-        # 质量设置  
-        quality_layout = QHBoxLayout()  
-        quality_layout.setSpacing(15)  
-        
-        quality_label = QLabel("图片质量:")  
-        quality_label.setStyleSheet("font-weight: bold;")  
-        quality_layout.addWidget(quality_label)  
-        
-        self.quality_spin = QSpinBox()  
-        self.quality_spin.setRange(1, 100)  
-        self.quality_spin.setValue(75)  
-        self.quality_spin.setFixedWidth(100)  
-        self.quality_spin.setStyleSheet("""  
-            QSpinBox {  
-                padding: 5px;  
-                border: 1px solid #ddd;  
-                border-radius: 4px;  
-            }  
-            QSpinBox:hover {  
-                border-color: #aaa;  
-            }  
-        """)  
-        quality_layout.addWidget(self.quality_spin)  
-        
-        quality_layout.addStretch()  
-        
-        self.same_dir_check = QCheckBox("输出到原文件所在目录")  
-        self.same_dir_check.setChecked(True)  
-        self.same_dir_check.setStyleSheet("""  
-            QCheckBox {  
-                spacing: 5px;  
-            }  
-            QCheckBox::indicator {  
-                width: 16px;  
-                height: 16px;  
-            }  
-        """)  
-        quality_layout.addWidget(self.same_dir_check)  
-        
-        settings_layout.addLayout(quality_layout)  
-
-        # 输出目录  
-        output_layout = QHBoxLayout()  
-        output_layout.setSpacing(15)  
-        
-        output_label = QLabel("输出目录:")  
-        output_label.setStyleSheet("font-weight: bold;")  
-        output_layout.addWidget(output_label)  
-        
-        self.output_label = QLabel("未选择")  
-        self.output_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)  
-        self.output_label.setWordWrap(True)  
-        self.output_label.setStyleSheet("""  
-            QLabel {  
-                color: #555;  
-                padding: 5px;  
-                border: 1px solid #eee;  
-                border-radius: 4px;  
-                background-color: #f9f9f9;  
-            }  
-        """)  
-        output_layout.addWidget(self.output_label)  
-        
-        self.select_dir_btn = SecondaryButton("浏览...")  
-        self.select_dir_btn.clicked.connect(self.select_output_directory)  
-        output_layout.addWidget(self.select_dir_btn)  
-        
-        settings_layout.addLayout(output_layout)  
-        content_layout.addWidget(settings_group)  
-
-        # 进度条  
-        self.progress_bar = QProgressBar()  
-        self.progress_bar.setRange(0, 100)  
-        self.progress_bar.setTextVisible(True)  
-        self.progress_bar.setStyleSheet("""  
-            QProgressBar {  
-                border: 1px solid #e0e0e0;  
-                border-radius: 6px;  
-                text-align: center;  
-                height: 20px;  
-            }  
-            QProgressBar::chunk {  
-                background-color: #4CAF50;  
-                border-radius: 5px;  
-            }  
-        """)  
-        content_layout.addWidget(self.progress_bar)  
-
-        # 状态标签  
-        self.status_label = QLabel("就绪")  
-        self.status_label.setAlignment(Qt.AlignCenter)  
-        self.status_label.setStyleSheet("""  
-            QLabel {  
-                color: #666;  
-                font-style: italic;  
-            }  
-        """)  
-        content_layout.addWidget(self.status_label)  
-
-        # 操作按钮  
-        btn_layout = QHBoxLayout()  
-        btn_layout.setSpacing(15)  
-        
-        self.compress_btn = ModernButton("压缩")  
-        self.compress_btn.clicked.connect(self.start_compression)  
-        btn_layout.addWidget(self.compress_btn)  
-        
-        self.batch_btn = ModernButton("批量压缩")  
-        self.batch_btn.clicked.connect(self.start_batch_compression)  
-        btn_layout.addWidget(self.batch_btn)  
-        
-        self.cancel_btn = DangerButton("取消")  
-        self.cancel_btn.setEnabled(False)  
-        self.cancel_btn.clicked.connect(self.cancel_compression)  
-        btn_layout.addWidget(self.cancel_btn)  
-        
-        btn_layout.addStretch()  
-        content_layout.addLayout(btn_layout)  
-        
-        main_layout.addWidget(content_frame)  
-
-    def update_styles(self):  
-        # 设置应用字体  
-        font = QFont()  
-        font.setFamily("Microsoft YaHei" if sys.platform == "win32" else   
-                      "PingFang SC" if sys.platform == "darwin" else   
-                      "Noto Sans CJK SC")  
-        font.setStyleHint(QFont.SansSerif)  
-        self.setFont(font)  
-        
-        # 设置窗口背景  
-        palette = self.palette()  
-        gradient = QLinearGradient(0, 0, 0, 400)  
-        gradient.setColorAt(0, QColor(240, 248, 255))  
-        gradient.setColorAt(1, QColor(230, 240, 250))  
-        palette.setBrush(QPalette.Window, QBrush(gradient))  
-        self.setPalette(palette)  
-
-    def select_input_files(self):  
-        files, _ = QFileDialog.getOpenFileNames(  
-            self, "选择Word文档", "",  
-            "Word文档 (*.docx *.doc);;所有文件 (*)"  
-        )  
-        if files:  
-            self.input_files = files  
-            self.update_file_list()  
-            
-            if self.same_dir_check.isChecked() and files:  
-                self.output_dir = os.path.dirname(files[0])  
-                self.output_label.setText(self.output_dir)  
-
-    def handle_dropped_files(self, file_paths):  
-        valid_files = [f for f in file_paths if f.lower().endswith(('.docx', '.doc'))]  
-        if not valid_files:  
-            QMessageBox.warning(self, "错误", "请拖放有效的Word文档 (.docx/.doc)")  
-            return  
-        
-        self.input_files = valid_files  
-        self.update_file_list()  
-        
-        if self.same_dir_check.isChecked() and valid_files:  
-            self.output_dir = os.path.dirname(valid_files[0])  
-            self.output_label.setText(self.output_dir)  
-
-    def update_file_list(self):  
-        self.file_list.clear()  
-        for file in self.input_files:  
-            item = QListWidgetItem(file)  
-            icon = QIcon.fromTheme("x-office-document")  
-            item.setIcon(icon)  
-            self.file_list.addItem(item)  
-        self.status_label.setText(f"已准备压缩 {len(self.input_files)} 个文件")  
-
-    def clear_file_list(self):  
-        self.input_files = []  
-        self.file_list.clear()  
-        self.status_label.setText("文件列表已清空")  
-
-    def remove_selected_files(self):  
-        selected = self.file_list.selectedItems()  
-        if not selected:  
-            return  
-        
-        for item in selected:  
-            self.input_files.remove(item.text())  
-            self.file_list.takeItem(self.file_list.row(item))  
-        
-        self.status_label.setText(f"已移除 {len(selected)} 个文件")  
-
-    def select_output_directory(self):  
-        directory = QFileDialog.getExistingDirectory(self, "选择输出目录")  
-        if directory:  
-            self.output_dir = directory  
-            self.output_label.setText(directory)  
-            self.same_dir_check.setChecked(False)  
-
-    def start_compression(self):  
-        if not self.input_files:  
-            QMessageBox.warning(self, "错误", "请先选择要压缩的文件")  
-            return  
-        
-        if not self.output_dir:  
-            QMessageBox.warning(self, "错误", "请选择输出目录")  
-            return  
-        
-        input_path = self.input_files[0]  
-        filename = os.path.basename(input_path)  
-        output_path = os.path.join(self.output_dir, f"compressed_{filename}")  
-        
-        quality = self.quality_spin.value()  
-        
-        self.compression_thread = CompressionThread(input_path, output_path, quality)  
-        self.compression_thread.progress_updated.connect(self.update_progress)  
-        self.compression_thread.finished_signal.connect(self.compression_finished)  
-        
-        self.set_controls_enabled(False)  
-        self.compression_thread.start()  
-
-    def start_batch_compression(self):  
-        if not self.input_files:  
-            QMessageBox.warning(self, "错误", "请先选择要压缩的文件")  
-            return  
-        
-        if not self.output_dir:  
-            QMessageBox.warning(self, "错误", "请选择输出目录")  
-            return  
-        
-        # 简化处理，实际应为每个文件创建压缩任务  
-        self.start_compression()  
-
-    def cancel_compression(self):  
-        if self.compression_thread and self.compression_thread.isRunning():  
-            self.compression_thread.canceled = True  
-            self.compression_thread.terminate()  
-            self.status_label.setText("操作已取消")  
-        
-        self.set_controls_enabled(True)  
-
-    def update_progress(self, value, text):  
-        self.progress_bar.setValue(value)  
-        self.status_label.setText(text)  
-
-    def compression_finished(self, success, message):  
-        if success:  
-            # 成功消息  
-            msg = QMessageBox(self)  
-            msg.setIcon(QMessageBox.Information)  
-            msg.setWindowTitle("成功")  
-            msg.setText(message)  
-            msg.setStandardButtons(QMessageBox.Ok)  
-            msg.setStyleSheet("""  
-                QMessageBox {  
-                    background-color: white;  
-                }  
-                QMessageBox QLabel {  
-                    color: #333;  
-                }  
-            """)  
-            msg.exec_()  
-        else:  
-            # 错误消息  
-            msg = QMessageBox(self)  
-            msg.setIcon(QMessageBox.Warning)  
-            msg.setWindowTitle("错误")  
-            msg.setText(message)  
-            msg.setStandardButtons(QMessageBox.Ok)  
-            msg.setStyleSheet("""  
-                QMessageBox {  
-                    background-color: white;  
-                }  
-                QMessageBox QLabel {  
-                    color: #333;  
-                }  
-            """)  
-            msg.exec_()  
-        
-        self.set_controls_enabled(True)  
-        self.progress_bar.setValue(0)  
-
-    def set_controls_enabled(self, enabled):  
-        self.drop_area.setEnabled(enabled)  
-        self.clear_btn.setEnabled(enabled)  
-        self.remove_btn.setEnabled(enabled)  
-        self.quality_spin.setEnabled(enabled)  
-        self.same_dir_check.setEnabled(enabled)  
-        self.select_dir_btn.setEnabled(enabled)  
-        self.compress_btn.setEnabled(enabled)  
-        self.batch_btn.setEnabled(enabled)  
-        self.cancel_btn.setEnabled(not enabled)  
-
-    def closeEvent(self, event):  
-        if self.compression_thread and self.compression_thread.isRunning():  
-            # 确认对话框  
-            msg = QMessageBox(self)  
-            msg.setIcon(QMessageBox.Question)  
-            msg.setWindowTitle("确认退出")  
-            msg.setText("压缩正在进行中，确定要退出吗？")  
-            msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)  
-            msg.setDefaultButton(QMessageBox.No)  
-            msg.setStyleSheet("""  
-                QMessageBox {  
-                    background-color: white;  
-                }  
-                QMessageBox QLabel {  
-                    color: #333;  
-                }  
-            """)  
-            
-            reply = msg.exec_()  
-            
-            if reply == QMessageBox.Yes:  
-                self.compression_thread.terminate()  
-                event.accept()  
-            else:  
-                event.ignore()  
-        else:  
-            event.accept()  
-
-if __name__ == "__main__":  
-    app = QApplication(sys.argv)  
-    
-    # 设置应用信息  
-    app.setApplicationName("WordCompressor")  
-    app.setApplicationDisplayName(f"Word文档压缩工具 v{VERSION}")  
-    app.setApplicationVersion(VERSION)  
-    
-    # 创建并显示主窗口  
-    window = MainWindow()  
-    window.show()  
-    
-    sys.exit(app.exec_())  
\ No newline at end of file
+import io
+import os
+import re
+import sys
+import html
+import json
+import time
+import copy
+import math
+import mmap
+import queue
+import struct
+import zlib
+import hashlib
+import contextlib
+import sqlite3
+import fnmatch
+import tempfile
+import threading
+import zipfile
+import logging
+import argparse
+import posixpath
+import collections
+import urllib.parse
+import multiprocessing
+import concurrent.futures
+import http.server
+from xml.etree import ElementTree
+from xml.parsers import expat
+from xml.sax.saxutils import escape as xml_escape
+from PIL import Image, ImageChops, ImageStat
+
+# 转换 ICC 配置文件需要 Pillow 带有 LittleCMS；不可用时保留原配置文件
+try:
+    from PIL import ImageCms
+except ImportError:
+    ImageCms = None
+
+# NumPy 可选，用于快速统计颜色数和计算 SSIM；没有安装时改用 Pillow 的 getcolors，
+# 多候选格式选择（--min-ssim）不可用
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# 版本信息
+VERSION = "1.1.0"
+AUTHOR = "bbroot"
+
+# 图形界面相关的名称，按需从 DocOptimizerGUI 加载
+GUI_NAMES = ('CompressionThread', 'BatchScheduler', 'MainWindow', 'run_gui')
+
+# 默认的文本日志文件
+DEFAULT_LOG_FILE = 'word_compressor.log'
+
+def setup_logging(filename=DEFAULT_LOG_FILE):
+    """配置日志，filename 为 None 时输出到标准错误"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        filename=filename
+    )
+
+# 文档中需要重新编码的图片所在目录及格式
+MEDIA_PREFIX = 'word/media/'
+IMAGE_FORMATS = {'.png': 'PNG', '.jpg': 'JPEG', '.jpeg': 'JPEG', '.bmp': 'BMP'}
+# 原样拷贝条目时每次读写的块大小
+COPY_CHUNK_SIZE = 1024 * 1024
+# 超过这个大小的 XML 部件按块流式重新压缩，压缩结果也超过时写入临时文件
+STREAM_ENTRY_SIZE = 64 * 1024 * 1024
+# 进程池中可以各自取消的同时压缩的文档数，超出的文档取消时工作进程中的任务会执行完
+CANCEL_SLOTS = 256
+# 输出先写入同目录下的临时文件，成功后再替换，临时文件名以此结尾
+TEMP_SUFFIX = '.tmp'
+# 图片缓存默认大小上限
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024
+# 增量压缩清单的默认文件名，保存在输出目录中
+MANIFEST_NAME = '.docoptimizer-manifest.sqlite'
+# 包结构相关的部件和元素
+CONTENT_TYPES_NAME = '[Content_Types].xml'
+RELS_SUFFIX = '.rels'
+RELATIONSHIP_RE = re.compile(r'<Relationship\b[^>]*>(?:\s*</Relationship>)?')
+OVERRIDE_RE = re.compile(r'<Override\b[^>]*>')
+DEFAULT_RE = re.compile(r'<Default\b[^>]*>')
+R_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+WP_NS = 'http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing}'
+EMU_PER_INCH = 914400
+# 图片尺寸超过显示所需尺寸的比例不足这个阈值时不再缩小
+DOWNSAMPLE_THRESHOLD = 0.9
+# 目标大小模式：试编码的质量、采样块边长和每边块数、JPEG 文件头的大致大小
+RATE_QUALITIES = (5, 15, 25, 35, 45, 55, 65, 75, 85, 95)
+RATE_SAMPLE_TILE = 64
+RATE_SAMPLE_GRID = 6
+JPEG_HEADER_SIZE = 600
+MIN_TARGET_QUALITY = 5
+# PNG 调色板模式：调色板颜色数，抽样统计时每隔多少个像素取一个，颜色多于
+# PALETTE_MAX_COLORS 种的图片（多为照片）不尝试量化，生成调色板时使用的大致像素数，
+# 调色板结果至少要小这个比例才采用
+PALETTE_COLORS = 256
+PALETTE_SAMPLE_STEP = 16
+PALETTE_MAX_COLORS = 32768
+PALETTE_TRAINING_PIXELS = 256 * 1024
+PALETTE_GAIN = 0.9
+# 调色板模式统计颜色时每个像素的额外内存：打包的像素、排序副本、排序下标和颜色序号
+PALETTE_BYTES_PER_PIXEL = 4 + 4 + 8 + 8
+DEFAULT_PALETTE_PSNR = 40.0
+# 多候选格式选择：试编码的 JPEG 质量（不超过 -q），计算 SSIM 的亮度缩略图最大边长、
+# 方块窗口大小和汇总时的分块大小，默认的 SSIM 下限
+CANDIDATE_QUALITIES = (30, 40, 50, 60, 70, 80, 90)
+SSIM_PROXY_SIZE = 1024
+SSIM_WINDOW = 7
+SSIM_TILE = 32
+DEFAULT_MIN_SSIM = 0.99
+# 每张图片最多评分的 JPEG 候选数，限制多候选选择的耗时
+MAX_SSIM_TRIALS = 6
+# EXIF 方向标签，以及各方向值转换为正常方向所需的变换
+EXIF_ORIENTATION = 0x0112
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT, 3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM, 5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270, 7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+# 缩小文档缩略图（docProps/thumbnail.*）时的最大边长
+THUMBNAIL_SIZE = 256
+THUMBNAIL_REL_TYPE = 'http://schemas.openxmlformats.org/package/2006/relationships/metadata/thumbnail'
+# 图片改变格式时新部件的扩展名和内容类型
+FORMAT_EXTENSIONS = {'JPEG': '.jpeg', 'PNG': '.png', 'BMP': '.bmp'}
+FORMAT_CONTENT_TYPES = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'BMP': 'image/bmp'}
+# 内存预算：探测图片头时每次读取和最多读取的字节数，按条带缩小未压缩 BMP 时每个条带的
+# 大致字节数，超出预算的图片每次缩小的比例
+PROBE_CHUNK_SIZE = 64 * 1024
+PROBE_LIMIT = 4 * 1024 * 1024
+STRIP_BYTES = 16 * 1024 * 1024
+OVERSIZE_STEP = 0.8
+# 每个压缩包条目除文件名外的本地文件头和中央目录项大小
+ZIP_ENTRY_OVERHEAD = 30 + 46
+# 写入条目的存储策略，按顺序匹配文件名：(文件名模式, 压缩方式, 压缩级别)
+# 已经过熵编码的媒体再做 deflate 只耗费 CPU，直接存储
+STORAGE_POLICY = (
+    (('*.jpg', '*.jpeg', '*.jpe', '*.png', '*.gif', '*.wdp', '*.emz', '*.wmz',
+      '*.mp3', '*.mp4', '*.m4a', '*.wma', '*.wmv', '*.zip', '*.docx', '*.xlsx', '*.pptx'),
+     zipfile.ZIP_STORED, None),
+    (('*.xml', '*.rels', '*.vml'), zipfile.ZIP_DEFLATED, 9),
+    (('*',), zipfile.ZIP_DEFLATED, 6),
+)
+# 按 xml_level 重新压缩的 XML 部件，以及 max 级别比较的 zlib 压缩策略
+XML_PATTERNS = ('*.xml', '*.vml')
+MAX_DEFLATE_STRATEGIES = (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED)
+
+def is_image_entry(info):
+    """判断压缩包条目是否为需要重新编码的图片"""
+    name = info.filename
+    return (name.startswith(MEDIA_PREFIX) and
+            posixpath.splitext(name)[1].lower() in IMAGE_FORMATS)
+
+def image_ext(info):
+    """图片条目的小写扩展名"""
+    return posixpath.splitext(info.filename)[1].lower()
+
+def entry_storage(name):
+    """按存储策略返回条目的 (压缩方式, 压缩级别)"""
+    name = name.lower()
+    for patterns, compress_type, level in STORAGE_POLICY:
+        if any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns):
+            return compress_type, level
+    return zipfile.ZIP_DEFLATED, None
+
+def is_xml_part(info):
+    """判断条目是否为可以重新压缩的 XML 部件，[Content_Types].xml 和关系文件可能被改写，不包括在内"""
+    name = info.filename.lower()
+    return (name != CONTENT_TYPES_NAME.lower() and
+            any(fnmatch.fnmatchcase(name, pattern) for pattern in XML_PATTERNS))
+
+def deflate_part(stream, level, spool_dir=None):
+    """把流中的数据按块压缩为原始 deflate 流，返回 (压缩数据, 压缩后大小, CRC, 耗时)
+
+    level 为 1-9 或 max，max 按最高级别同时尝试几种压缩策略并取最小的结果。压缩数据是
+    读取位置在开头的 SpooledTemporaryFile，超过 STREAM_ENTRY_SIZE 时写入 spool_dir 中
+    的临时文件，由调用方关闭。stream 读完后关闭。可以在线程中并行调用，zlib 压缩时
+    释放 GIL。
+    """
+    start = time.perf_counter()
+    if level == 'max':
+        settings = [(9, strategy) for strategy in MAX_DEFLATE_STRATEGIES]
+    else:
+        settings = [(level, zlib.Z_DEFAULT_STRATEGY)]
+    outputs = [(zlib.compressobj(value, zlib.DEFLATED, -zlib.MAX_WBITS, 9, strategy),
+                tempfile.SpooledTemporaryFile(STREAM_ENTRY_SIZE, dir=spool_dir))
+               for value, strategy in settings]
+    crc = 0
+    try:
+        with stream:
+            for chunk in iter(lambda: stream.read(COPY_CHUNK_SIZE), b''):
+                check_canceled()
+                crc = zlib.crc32(chunk, crc)
+                for compressor, out in outputs:
+                    out.write(compressor.compress(chunk))
+        for compressor, out in outputs:
+            out.write(compressor.flush())
+    except BaseException:
+        for _, out in outputs:
+            out.close()
+        raise
+    outputs.sort(key=lambda output: output[1].tell())
+    for _, out in outputs[1:]:
+        out.close()
+    best = outputs[0][1]
+    size = best.tell()
+    best.seek(0)
+    return best, size, crc, time.perf_counter() - start
+
+def write_entry(zipf, name, date_time, data):
+    """按存储策略写入一个新条目"""
+    compress_type, level = entry_storage(name)
+    zipf.writestr(zipfile.ZipInfo(name, date_time), data, compress_type, level)
+
+def fit_size(size, max_size):
+    """按显示所需的最大像素尺寸计算缩小后的尺寸，不需要缩小时返回 None"""
+    width, height = size
+    scale = max(max_size[0] / width, max_size[1] / height)
+    if scale >= DOWNSAMPLE_THRESHOLD:
+        return None
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+def pack_pixels(img):
+    """把 RGB/RGBA 图片的每个像素打包为一个 uint32，返回一维数组"""
+    pixels = numpy.asarray(img)
+    packed = (pixels[..., 0].astype(numpy.uint32) << 16 |
+              pixels[..., 1].astype(numpy.uint32) << 8 | pixels[..., 2])
+    if img.mode == 'RGBA':
+        packed |= pixels[..., 3].astype(numpy.uint32) << 24
+    return packed.ravel()
+
+def indexed_image(img, colors, indices):
+    """由颜色表（RGB 或 RGBA 元组）和每个像素的颜色序号生成调色板图片，透明度写入 tRNS"""
+    indexed = Image.frombytes('P', img.size, bytes(indices))
+    indexed.putpalette(bytes(channel for color in colors for channel in color[:3]))
+    if img.mode == 'RGBA':
+        indexed.info['transparency'] = bytes(color[3] for color in colors)
+    return indexed
+
+def psnr(first, second):
+    """两张同模式图片的峰值信噪比（dB），按直方图计算，不需要额外的像素副本"""
+    stat = ImageStat.Stat(ImageChops.difference(first, second))
+    mse = sum(rms ** 2 for rms in stat.rms) / len(stat.rms)
+    return math.inf if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+def palette_image(img, min_psnr):
+    """把真彩色图片转换为最多 256 色的调色板图片，无法达到质量要求时返回 None
+
+    颜色不超过 256 种时无损转换；颜色不太多时自适应量化（不抖动，透明度一起量化），
+    与原图的峰值信噪比不低于 min_psnr 时才采用。
+    """
+    if img.mode not in ('RGB', 'RGBA'):
+        return None
+    if img.mode == 'RGBA' and img.getextrema()[3][0] == 255:
+        img = img.convert('RGB')
+    if numpy is not None:
+        packed = pack_pixels(img)
+        # 先在抽样像素上计数，颜色明显过多的图片不必对全部像素排序
+        sampled = len(numpy.unique(packed[::PALETTE_SAMPLE_STEP]))
+        if sampled > PALETTE_MAX_COLORS:
+            return None
+        if sampled <= PALETTE_COLORS:
+            colors, indices = numpy.unique(packed, return_inverse=True)
+            if len(colors) <= PALETTE_COLORS:
+                channels = [colors >> 16, colors >> 8, colors, colors >> 24][:len(img.mode)]
+                colors = (numpy.stack(channels, axis=1) & 0xFF).tolist()
+                return indexed_image(img, colors, indices.astype(numpy.uint8))
+    else:
+        colors = img.getcolors(PALETTE_COLORS)
+        if colors is not None:
+            index = {color: i for i, (_, color) in enumerate(colors)}
+            return indexed_image(img, [color for _, color in colors],
+                                 (index[pixel] for pixel in img.getdata()))
+        if img.getcolors(PALETTE_MAX_COLORS) is None:
+            return None
+
+    if img.mode == 'RGBA':
+        quantized = img.quantize(PALETTE_COLORS, method=Image.FASTOCTREE, dither=Image.NONE)
+    else:
+        # 中位切分较慢，先在缩小的图片上生成调色板，再把整张图片映射到该调色板
+        factor = max(1, math.ceil(math.sqrt(img.width * img.height / PALETTE_TRAINING_PIXELS)))
+        sample = img.reduce(factor) if factor > 1 else img
+        palette = sample.quantize(PALETTE_COLORS, method=Image.MEDIANCUT, dither=Image.NONE)
+        quantized = img.quantize(palette=palette, dither=Image.NONE)
+    if psnr(img, quantized.convert(img.mode)) < min_psnr:
+        return None
+    return quantized
+
+def prepare_metadata(img, policy, orientation=1):
+    """按元数据策略处理解码后的图片，返回 (图片, 编码时的元数据参数)
+
+    strip 时把 EXIF 方向应用到像素上，按 ICC 配置文件转换到 sRGB，EXIF（连同其中的
+    缩略图）、XMP 和 ICC 都不写入；无法转换时保留 ICC，以免颜色改变。keep 时原样保留
+    EXIF、XMP 和 ICC，方向仍由 EXIF 标记。
+    """
+    icc = img.info.get('icc_profile')
+    if policy == 'keep':
+        params = {'icc_profile': icc}
+        params.update((key, img.info[key]) for key in ('exif', 'xmp') if img.info.get(key))
+        return img, params
+
+    if orientation in ORIENTATION_TRANSPOSE:
+        img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+    if icc and ImageCms is not None and img.mode in ('RGB', 'RGBA', 'CMYK'):
+        try:
+            profile = ImageCms.ImageCmsProfile(io.BytesIO(icc))
+            # 已经是 sRGB 的配置文件直接丢弃，不必转换
+            if 'srgb' not in ImageCms.getProfileDescription(profile).lower():
+                img = ImageCms.profileToProfile(img, profile, ImageCms.createProfile('sRGB'),
+                                                outputMode='RGBA' if img.mode == 'RGBA' else 'RGB')
+            icc = None
+        except (ImageCms.PyCMSError, OSError, ValueError) as e:
+            logging.debug(f"无法转换 ICC 配置文件，保留原配置文件: {str(e)}")
+    return img, {'icc_profile': icc}
+
+def has_alpha(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or 'transparency' in img.info
+
+def luma_proxy(img):
+    """用于 SSIM 比较的亮度缩略图（浮点数组）
+
+    透明图片先合成到白色（页面底色）上，再按整数倍方块平均缩小到最大边长不超过
+    SSIM_PROXY_SIZE。
+    """
+    if has_alpha(img):
+        img = img.convert('RGBA')
+        img = Image.alpha_composite(Image.new('RGBA', img.size, (255, 255, 255, 255)), img)
+    img = img.convert('L')
+    factor = math.ceil(max(img.size) / SSIM_PROXY_SIZE)
+    if factor > 1:
+        img = img.reduce(factor)
+    return numpy.asarray(img, dtype=numpy.float64)
+
+def box_mean(values, size):
+    """用积分图计算每个完整的 size x size 窗口内的均值"""
+    integral = numpy.zeros((values.shape[0] + 1, values.shape[1] + 1))
+    integral[1:, 1:] = values.cumsum(0).cumsum(1)
+    return (integral[size:, size:] - integral[:-size, size:] - integral[size:, :-size]
+            + integral[:-size, :-size]) / (size * size)
+
+def ssim_reference(values):
+    """预先计算参考亮度图的窗口均值和方差，与多个候选比较时只算一次"""
+    size = min(SSIM_WINDOW, *values.shape)
+    mean = box_mean(values, size)
+    return values, size, mean, box_mean(values * values, size) - mean * mean
+
+def ssim(first, second):
+    """两张同尺寸亮度图的结构相似度，first 也可以是 ssim_reference 的结果
+
+    在方块窗口上计算 SSIM 后分块求平均，取最差的一块：与 butteraugli 取局部最大差异
+    类似，屏幕截图中大片的空白不会掩盖文字周围的失真。
+    """
+    if not isinstance(first, tuple):
+        first = ssim_reference(first)
+    first, size, mean1, var1 = first
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mean2 = box_mean(second, size)
+    var2 = box_mean(second * second, size) - mean2 * mean2
+    covar = box_mean(first * second, size) - mean1 * mean2
+    index = ((2 * mean1 * mean2 + c1) * (2 * covar + c2) /
+             ((mean1 * mean1 + mean2 * mean2 + c1) * (var1 + var2 + c2)))
+    # 分块边界均匀分布，最后一块不会太小
+    rows, columns = (numpy.linspace(0, length, max(1, round(length / SSIM_TILE)) + 1)
+                     .astype(int)[:-1] for length in index.shape)
+    sums = numpy.add.reduceat(numpy.add.reduceat(index, rows, axis=0), columns, axis=1)
+    counts = numpy.outer(numpy.diff(rows, append=index.shape[0]),
+                         numpy.diff(columns, append=index.shape[1]))
+    return float((sums / counts).min())
+
+def jpeg_source(img):
+    """转换为可以编码为 JPEG 的模式，有实际透明像素的图片返回 None"""
+    if has_alpha(img):
+        img = img.convert('RGBA')
+        if img.getextrema()[3][0] < 255:
+            return None
+    if img.mode not in ('RGB', 'L', 'CMYK'):
+        img = img.convert('RGB')
+    return img
+
+def select_encoding(img, ext, quality, palette, min_ssim, params, timings):
+    """试编码多种候选格式，返回通过质量检查的最小结果
+
+    候选为按原格式和原参数编码的结果（总是可用）、BMP 的无损 PNG、调色板 PNG，
+    以及质量不超过 quality 的 JPEG：4:2:0 和 4:4:4 色度抽样各自二分查找 SSIM 达到
+    min_ssim 的最低质量，再与同质量的渐进式编码比较。SSIM 在缩小的亮度图上计算，
+    每张图片最多评分 MAX_SSIM_TRIALS 次。调色板 PNG 按 palette（默认
+    DEFAULT_PALETTE_PSNR）在全分辨率的彩色数据上检查峰值信噪比，不计算 SSIM。
+    params 为 JPEG 和 PNG 编码时的元数据参数。
+    """
+    timings['encode'] = timings['score'] = 0.0
+    trials = MAX_SSIM_TRIALS
+
+    def encode(image, format, **options):
+        check_canceled()
+        start = time.perf_counter()
+        out = io.BytesIO()
+        if format != 'BMP':
+            options.update(params)
+        image.save(out, format=format, **options)
+        timings['encode'] += time.perf_counter() - start
+        return out.getvalue()
+
+    def passes(data):
+        """解码 JPEG 候选并评分，评分次数用完后视为未通过"""
+        nonlocal trials
+        check_canceled()
+        if trials <= 0:
+            return False
+        trials -= 1
+        start = time.perf_counter()
+        with Image.open(io.BytesIO(data)) as decoded:
+            value = ssim(reference, luma_proxy(decoded))
+        timings['score'] += time.perf_counter() - start
+        return value >= min_ssim
+
+    start = time.perf_counter()
+    reference = ssim_reference(luma_proxy(img))
+    timings['score'] += time.perf_counter() - start
+
+    if ext in ('.jpg', '.jpeg'):
+        candidates = [encode(img, 'JPEG', quality=quality, optimize=True)]
+    elif ext == '.png':
+        candidates = [encode(img, 'PNG', optimize=True)]
+    else:
+        candidates = [encode(img, IMAGE_FORMATS[ext]), encode(img, 'PNG', optimize=True)]
+
+    # 量化误差分散在整张图上，最差分块的亮度 SSIM 会拒绝看不出差别的调色板版本，
+    # 因此与 --png-palette 一样按彩色数据的峰值信噪比检查
+    start = time.perf_counter()
+    indexed = palette_image(img, DEFAULT_PALETTE_PSNR if palette is None else palette)
+    timings['quantize'] = time.perf_counter() - start
+    if indexed is not None:
+        candidates.append(encode(indexed, 'PNG', optimize=True))
+
+    source = jpeg_source(img)
+    if source is not None:
+        qualities = [value for value in CANDIDATE_QUALITIES if value < quality] + [quality]
+        top = len(qualities) - 1
+        for subsampling in (2,) if source.mode == 'L' else (2, 0):
+            if top < 0:
+                break
+            # SSIM 随质量单调增加：先试最高的质量，达不到下限时更低的质量也达不到；
+            # 否则二分查找达到下限的最低质量
+            data = encode(source, 'JPEG', quality=qualities[top], optimize=True,
+                          subsampling=subsampling)
+            if not passes(data):
+                continue
+            found = (top, data)
+            low, high = 0, top - 1
+            while low <= high:
+                middle = (low + high) // 2
+                data = encode(source, 'JPEG', quality=qualities[middle], optimize=True,
+                              subsampling=subsampling)
+                if passes(data):
+                    found, high = (middle, data), middle - 1
+                else:
+                    low = middle + 1
+            # 渐进式编码只改变熵编码，解码结果相同，不需要重新评分
+            candidates.append(found[1])
+            candidates.append(encode(source, 'JPEG', quality=qualities[found[0]], optimize=True,
+                                     subsampling=subsampling, progressive=True))
+            # 同一质量下 4:4:4 总是更大，只需要在更低的质量中查找
+            top = found[0] - 1
+    return min(candidates, key=len)
+
+def recompress_image(data, ext, quality, max_size=None, palette=None, min_ssim=None,
+                     metadata='strip', timings=None):
+    """在内存中重新编码单张图片，默认保持原始格式
+
+    max_size 为图片在文档中显示所需的最大像素尺寸，图片明显更大时先缩小再编码。
+    palette 为 PNG 调色板量化的最低峰值信噪比（dB），None 表示不量化。
+    min_ssim 不为 None 时由 select_encoding 在多种候选格式中选择，结果的格式可能与
+    ext 不同。metadata 为元数据策略，见 prepare_metadata。timings 为字典时记录 decode、
+    resize、metadata、quantize、encode 等各阶段的耗时（秒）。
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(data)) as source:
+        img = source
+        orientation = img.getexif().get(EXIF_ORIENTATION, 1) if metadata == 'strip' else 1
+        if max_size and orientation in (5, 6, 7, 8):
+            # 显示尺寸是旋转后的方向，旋转前的图片按交换宽高后的尺寸缩小
+            max_size = max_size[::-1]
+        size = fit_size(img.size, max_size) if max_size else None
+        if size is not None:
+            # JPEG 使用 draft 模式按 1/2、1/4、1/8 比例解码，大图不必完整解码后再缩小
+            img.draft(img.mode, size)
+        img.load()
+        timings['decode'] = time.perf_counter() - start
+
+        # 解码、缩小和编码之间检查取消，大图不必等整张处理完
+        if size is not None:
+            check_canceled()
+            start = time.perf_counter()
+            if img.mode in ('1', 'P'):
+                img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+            img = img.resize(size, Image.LANCZOS)
+            timings['resize'] = time.perf_counter() - start
+
+        # 在同一次解码的像素上处理方向和颜色空间
+        check_canceled()
+        start = time.perf_counter()
+        img, params = prepare_metadata(img, metadata, orientation)
+        timings['metadata'] = time.perf_counter() - start
+
+        if min_ssim is not None:
+            return select_encoding(img, ext, quality, palette, min_ssim, params, timings)
+
+        check_canceled()
+        start = time.perf_counter()
+        out = io.BytesIO()
+        if ext in ('.jpg', '.jpeg'):
+            img.save(out, format='JPEG', quality=quality, optimize=True, **params)
+        elif ext == '.png':
+            img.save(out, format='PNG', optimize=True, **params)
+        else:
+            img.save(out, format=IMAGE_FORMATS[ext])
+        timings['encode'] = time.perf_counter() - start
+
+        if ext == '.png' and palette is not None:
+            # 调色板版本明显更小时才替换真彩色的编码结果
+            check_canceled()
+            start = time.perf_counter()
+            indexed = palette_image(img, palette)
+            if indexed is not None:
+                candidate = io.BytesIO()
+                indexed.save(candidate, format='PNG', optimize=True, **params)
+                if candidate.tell() <= out.tell() * PALETTE_GAIN:
+                    out = candidate
+            timings['quantize'] = time.perf_counter() - start
+        return out.getvalue()
+
+def recompress_image_timed(data, *settings):
+    """进程池中执行的压缩任务，返回 (新数据, 各阶段耗时)"""
+    timings = {}
+    return recompress_image(data, *settings, timings=timings), timings
+
+# 不解码图片即可得到的信息。depth 为 Pillow 解码后每像素占用的字节数；layout 只对
+# 未压缩的 24/32 位 BMP 给出，为 (像素数据偏移, 行字节数, 是否自下而上存储, rawmode)
+ImageHeader = collections.namedtuple('ImageHeader', 'format width height depth layout')
+
+def read_image_header(data):
+    """从图片开头的数据解析 ImageHeader，数据不完整或格式不支持时返回 None"""
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(data) < 26:
+            return None
+        width, height, depth, color = struct.unpack('>IIBB', data[16:26])
+        grayscale = color in (0, 3)
+        return ImageHeader('PNG', width, height, (2 if depth > 8 else 1) if grayscale else 4, None)
+
+    if data[:2] == b'BM':
+        if len(data) < 26:
+            return None
+        offset, header_size = struct.unpack('<II', data[10:18])
+        if header_size == 12:
+            width, height, _, bits = struct.unpack('<HHHH', data[18:26])
+            compression = 0
+        elif len(data) >= 34:
+            width, height, _, bits, compression = struct.unpack('<iiHHI', data[18:34])
+        else:
+            return None
+        layout = None
+        if compression == 0 and bits in (24, 32):
+            stride = (width * bits + 31) // 32 * 4
+            layout = (offset, stride, height > 0, 'BGR' if bits == 24 else 'BGRX')
+        return ImageHeader('BMP', width, abs(height), 1 if bits <= 8 else 4, layout)
+
+    if data[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 4 <= len(data):
+            if data[pos] != 0xFF:
+                return None
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                pos += 2
+                continue
+            # SOF 段中依次为精度、高、宽和分量数
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                if pos + 10 > len(data):
+                    return None
+                height, width, components = struct.unpack('>HHB', data[pos + 5:pos + 10])
+                return ImageHeader('JPEG', width, height, 1 if components == 1 else 4, None)
+            pos += 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+    return None
+
+def read_header_data(src, info):
+    """只读取条目开头的数据来解析图片头，返回 (ImageHeader 或 None, 读到的数据)
+
+    每次多读 PROBE_CHUNK_SIZE，最多读取 PROBE_LIMIT 字节：JPEG 的 SOF 可能排在较大的
+    EXIF/ICC 段之后，但无法识别的条目不会被整个读入。
+    """
+    data = bytearray()
+    with src.open(info) as stream:
+        while len(data) < PROBE_LIMIT:
+            chunk = stream.read(min(PROBE_CHUNK_SIZE, PROBE_LIMIT - len(data)))
+            if not chunk:
+                break
+            data += chunk
+            header = read_image_header(data)
+            if header is not None:
+                return header, bytes(data)
+    return None, bytes(data)
+
+def streams_strips(header, max_size):
+    """图片能否按条带读取并缩小，而不必完整解码"""
+    return (header is not None and header.layout is not None and max_size is not None
+            and fit_size((header.width, header.height), max_size) is not None)
+
+def strip_factor(size, target):
+    """按条带缩小时先用方块平均缩小的整数倍数"""
+    return max(1, min(size[0] // target[0], size[1] // target[1]))
+
+def image_memory(header, data_size, max_size=None, palette=False, candidates=False):
+    """估算压缩一张图片的峰值内存
+
+    包括解码后的像素（JPEG 按 draft 缩小后的尺寸）、缩小后的像素，以及父进程和
+    工作进程中各一份原始数据；按条带处理的 BMP 不在内存中保留原始数据。
+    palette 为 True 时 PNG 还要计入调色板量化统计颜色的内存；candidates 为 True 时
+    任何格式都要计入调色板量化，以及 JPEG 候选转换模式后的一份像素。
+    """
+    width, height, depth = header.width, header.height, header.depth
+    size = fit_size((width, height), max_size) if max_size else None
+    output = size[0] * size[1] * depth if size else 0
+    pixels = size[0] * size[1] if size else width * height
+    if palette and header.format == 'PNG' or candidates:
+        output += pixels * (PALETTE_BYTES_PER_PIXEL if numpy is not None else depth)
+    if candidates:
+        output += pixels * depth
+    if streams_strips(header, max_size):
+        factor = strip_factor((width, height), size)
+        return STRIP_BYTES + -(-width // factor) * -(-height // factor) * depth + output
+    if header.format == 'JPEG' and size:
+        # draft 模式按 1/2、1/4、1/8 解码，结果不小于目标尺寸
+        scale = next((scale for scale in (8, 4, 2)
+                      if width // scale >= size[0] and height // scale >= size[1]), 1)
+        width, height = -(-width // scale), -(-height // scale)
+    return width * height * depth + output + 2 * data_size
+
+def read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("图片数据不完整")
+    return data
+
+def recompress_bmp_strips(zip_path, name, ext, quality, max_size, palette=None, min_ssim=None,
+                          metadata='strip'):
+    """直接从压缩包中按条带读取未压缩的 BMP 并缩小，返回 (新数据, 各阶段耗时)
+
+    每个条带先按整数倍方块平均缩小再拼接，条带高度是倍数的整数倍，方块不会跨越
+    条带；最后用 LANCZOS 缩放到目标尺寸。整张图片的原始数据和解码结果都不会
+    同时出现在内存中。未压缩的 BMP 没有元数据，metadata 只为与 recompress_image
+    的参数一致。
+    """
+    timings = {'read': 0.0, 'decode': 0.0}
+    with zipfile.ZipFile(zip_path) as src, src.open(name) as stream:
+        start = time.perf_counter()
+        head = stream.read(34)
+        header = read_image_header(head)
+        if header is None or header.layout is None:
+            raise ValueError("不是未压缩的 BMP")
+        offset, stride, bottom_up, rawmode = header.layout
+        read_exactly(stream, offset - len(head))
+        timings['read'] += time.perf_counter() - start
+
+        width, height = header.width, header.height
+        size = fit_size((width, height), max_size)
+        factor = strip_factor((width, height), size)
+        reduced = Image.new('RGB', (-(-width // factor), -(-height // factor)))
+        rows = max(1, STRIP_BYTES // stride // factor) * factor
+        strips = [(top, min(height, top + rows)) for top in range(0, height, rows)]
+        # 自下而上存储的 BMP 先读到的是最下面的条带
+        for top, bottom in (reversed(strips) if bottom_up else strips):
+            check_canceled()
+            start = time.perf_counter()
+            data = read_exactly(stream, (bottom - top) * stride)
+            timings['read'] += time.perf_counter() - start
+            start = time.perf_counter()
+            strip = Image.frombuffer('RGB', (width, bottom - top), data, 'raw', rawmode,
+                                     stride, -1 if bottom_up else 1)
+            reduced.paste(strip.reduce(factor) if factor > 1 else strip, (0, top // factor))
+            timings['decode'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    img = reduced.resize(size, Image.LANCZOS) if reduced.size != size else reduced
+    timings['resize'] = time.perf_counter() - start
+    if min_ssim is not None:
+        return select_encoding(img, ext, quality, palette, min_ssim, {}, timings), timings
+    start = time.perf_counter()
+    out = io.BytesIO()
+    img.save(out, format=IMAGE_FORMATS[ext])
+    timings['encode'] = time.perf_counter() - start
+    return out.getvalue(), timings
+
+def jpeg_rate_curve(data, max_size=None):
+    """试编码图片的采样块，估计整张 JPEG 在各质量下的输出字节数
+
+    在最终尺寸的图片上均匀取若干原始分辨率的小块拼成样本图，按像素数比例放大
+    样本的编码大小得到估计值。缩小整图作为样本会提高细节密度，使估计明显偏大。
+    返回按质量升序排列的 [(质量, 字节数)]。
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        img = source
+        size = fit_size(img.size, max_size) if max_size else None
+        if size is not None:
+            img.draft(img.mode, size)
+            img = img.resize(size, Image.LANCZOS)
+        width, height = img.size
+        columns = min(RATE_SAMPLE_GRID, width // RATE_SAMPLE_TILE)
+        rows = min(RATE_SAMPLE_GRID, height // RATE_SAMPLE_TILE)
+        if columns * rows * RATE_SAMPLE_TILE ** 2 * 2 >= width * height:
+            # 图片不比样本大多少时直接试编码整张图片
+            sample = img.copy()
+        else:
+            sample = Image.new(img.mode, (columns * RATE_SAMPLE_TILE, rows * RATE_SAMPLE_TILE))
+            for row in range(rows):
+                for column in range(columns):
+                    # 按 16 像素对齐，使样本块与 JPEG 的编码块一致
+                    left = (width - RATE_SAMPLE_TILE) * column // max(1, columns - 1) // 16 * 16
+                    top = (height - RATE_SAMPLE_TILE) * row // max(1, rows - 1) // 16 * 16
+                    tile = img.crop((left, top, left + RATE_SAMPLE_TILE, top + RATE_SAMPLE_TILE))
+                    sample.paste(tile, (column * RATE_SAMPLE_TILE, row * RATE_SAMPLE_TILE))
+
+    scale = width * height / (sample.width * sample.height)
+    curve = []
+    for quality in RATE_QUALITIES:
+        check_canceled()
+        out = io.BytesIO()
+        sample.save(out, format='JPEG', quality=quality, optimize=True)
+        payload = max(0, out.tell() - JPEG_HEADER_SIZE)
+        curve.append((quality, int(JPEG_HEADER_SIZE + payload * scale)))
+    return curve
+
+def estimate_size(curve, quality):
+    """在质量-大小曲线上线性插值"""
+    if quality <= curve[0][0]:
+        return curve[0][1]
+    for (q0, s0), (q1, s1) in zip(curve, curve[1:]):
+        if quality <= q1:
+            return s0 + (s1 - s0) * (quality - q0) / (q1 - q0)
+    return curve[-1][1]
+
+def choose_quality(curves, budget, max_quality=100):
+    """二分查找总估计大小不超过预算的最高质量，预算不足时返回最低质量"""
+    def total(quality):
+        return sum(estimate_size(curve, quality) for curve in curves)
+
+    low, high = MIN_TARGET_QUALITY, max(MIN_TARGET_QUALITY, max_quality)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if total(middle) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def clone_zipinfo(info):
+    """按源条目生成目标条目的 ZipInfo，保留名称、时间、属性、大小和 CRC"""
+    zinfo = zipfile.ZipInfo(info.filename, info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = info.compress_size
+    zinfo.file_size = info.file_size
+    zinfo.external_attr = info.external_attr
+    zinfo.create_system = info.create_system
+    zinfo.comment = info.comment
+    # 大小已写入本地文件头，不再需要数据描述符
+    zinfo.flag_bits = info.flag_bits & ~0x08
+    return zinfo
+
+def write_raw_entry(dst, zinfo, chunks):
+    """把已经压缩好的数据块写入目标压缩包，zinfo 中的 CRC 和大小必须与数据一致"""
+    zip64 = max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT
+    zinfo.header_offset = dst.fp.tell()
+    dst.fp.write(zinfo.FileHeader(zip64))
+    for chunk in chunks:
+        check_canceled()
+        dst.fp.write(chunk)
+    dst.filelist.append(zinfo)
+    dst.NameToInfo[zinfo.filename] = zinfo
+    dst.start_dir = dst.fp.tell()
+
+class SourceMap:
+    """源文档的只读内存映射
+
+    条目数据直接从映射中切片，不经过文件读取。用过的页面随即从本进程的映射中
+    释放（系统支持 madvise 时），拷贝数 GB 的文档时常驻内存不会随之增长，页面仍
+    留在系统的文件缓存中。可以在多个线程中同时读取。
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mapped)
+
+    def __len__(self):
+        return len(self.mapped)
+
+    def discard(self, start, end):
+        """释放本进程对 [start, end) 所在页面的映射，之后再访问时重新从文件缓存载入"""
+        if not hasattr(mmap, 'MADV_DONTNEED') or end <= start:
+            return
+        start -= start % mmap.PAGESIZE
+        try:
+            self.mapped.madvise(mmap.MADV_DONTNEED, start, end - start)
+        except (OSError, ValueError):
+            pass
+
+    def read(self, start, end):
+        data = self.mapped[start:end]
+        self.discard(start, end)
+        return data
+
+    def inflate(self, start, end, size):
+        """解压 [start, end) 中的原始 deflate 数据，size 为解压后的大小"""
+        with self.view[start:end] as raw:
+            data = zlib.decompress(raw, -zlib.MAX_WBITS, max(1, size))
+        self.discard(start, end)
+        return data
+
+    def chunks(self, start, end):
+        """按块产出 [start, end) 的切片，不复制数据"""
+        for pos in range(start, end, COPY_CHUNK_SIZE):
+            stop = min(end, pos + COPY_CHUNK_SIZE)
+            with self.view[pos:stop] as chunk:
+                yield chunk
+            self.discard(pos, stop)
+
+    def close(self):
+        self.view.release()
+        try:
+            self.mapped.close()
+        except BufferError:
+            # 仍有切片未释放（例如异常中断的写入），映射在切片回收后释放
+            pass
+
+@contextlib.contextmanager
+def map_archive(path):
+    """把源文档只读映射到内存，给出 SourceMap；无法映射时（空文件、不支持映射的文件
+    系统或 32 位进程中的大文件）给出 None，调用方改为按文件读取
+    """
+    try:
+        source = SourceMap(path)
+    except (OSError, ValueError, OverflowError):
+        yield None
+        return
+    try:
+        yield source
+    finally:
+        source.close()
+
+def entry_data_offset(src, info, source=None):
+    """解析本地文件头，返回条目压缩数据在源文档中的偏移"""
+    if source is not None:
+        header = source.mapped[info.header_offset:info.header_offset + zipfile.sizeFileHeader]
+    else:
+        src.fp.seek(info.header_offset)
+        header = src.fp.read(zipfile.sizeFileHeader)
+    if len(header) != zipfile.sizeFileHeader:
+        raise zipfile.BadZipFile(f"无效的本地文件头: {info.filename}")
+    header = struct.unpack(zipfile.structFileHeader, header)
+    if header[0] != zipfile.stringFileHeader:
+        raise zipfile.BadZipFile(f"无效的本地文件头: {info.filename}")
+    return info.header_offset + zipfile.sizeFileHeader + header[10] + header[11]
+
+def entry_data_range(src, info, source=None):
+    """条目压缩数据在源文档中的 (起始, 结束) 偏移"""
+    start = entry_data_offset(src, info, source)
+    end = start + info.compress_size
+    if source is not None and end > len(source):
+        raise zipfile.BadZipFile(f"压缩数据不完整: {info.filename}")
+    return start, end
+
+def read_entry(src, info, source=None):
+    """读取并解压条目，提供 SourceMap 时直接从映射中读取
+
+    映射读取只支持未加密的存储和 deflate 条目，其他条目仍由 zipfile 读取；两种方式都
+    校验 CRC。
+    """
+    if (source is None or info.flag_bits & 0x01 or
+            info.compress_type not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)):
+        return src.read(info)
+    start, end = entry_data_range(src, info, source)
+    if info.compress_type == zipfile.ZIP_STORED:
+        data = source.read(start, end)
+    else:
+        data = source.inflate(start, end, info.file_size)
+    if len(data) != info.file_size or zlib.crc32(data) != info.CRC:
+        raise zipfile.BadZipFile(f"CRC 校验失败: {info.filename}")
+    return data
+
+def read_chunks(src, info):
+    """分块读取并解压条目，整个条目不会同时出现在内存中"""
+    with src.open(info) as stream:
+        yield from iter(lambda: stream.read(COPY_CHUNK_SIZE), b'')
+
+def copy_raw_entry(src, dst, info, source=None):
+    """不解压、不重新压缩，把源压缩包中的条目原样写入目标压缩包
+
+    提供 SourceMap 时直接写入映射的切片，不经过文件读取。
+    """
+    # 跳过本地文件头，定位到压缩数据
+    start, end = entry_data_range(src, info, source)
+
+    def chunks():
+        src.fp.seek(start)
+        remaining = info.compress_size
+        while remaining > 0:
+            chunk = src.fp.read(min(COPY_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise zipfile.BadZipFile(f"压缩数据不完整: {info.filename}")
+            yield chunk
+            remaining -= len(chunk)
+
+    write_raw_entry(dst, clone_zipinfo(info),
+                    source.chunks(start, end) if source is not None else chunks())
+
+def rels_base_dir(rels_name):
+    """关系文件中相对目标的基准目录，例如 word/_rels/document.xml.rels 对应 word"""
+    return posixpath.dirname(posixpath.dirname(rels_name))
+
+def resolve_part(base_dir, target):
+    """把关系目标解析为压缩包中的部件名"""
+    target = urllib.parse.unquote(target.split('#', 1)[0])
+    if target.startswith('/'):
+        return posixpath.normpath(target).lstrip('/')
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+def quote_part(part):
+    """把部件名转换为关系目标中的 URI，非 ASCII 字符保持原样"""
+    return part.replace('%', '%25').replace(' ', '%20').replace('#', '%23')
+
+def relative_target(base_dir, part):
+    """生成从基准目录指向部件的相对目标"""
+    base = base_dir.split('/') if base_dir else []
+    parts = part.split('/')
+    common = 0
+    while common < len(base) and common < len(parts) - 1 and base[common] == parts[common]:
+        common += 1
+    return quote_part('/'.join(['..'] * (len(base) - common) + parts[common:]))
+
+def xml_attribute(element, name):
+    """取出 XML 元素文本中的属性值（已反转义），不存在时返回 None"""
+    match = re.search(r'\b%s\s*=\s*(["\'])(.*?)\1' % name, element, re.S)
+    return html.unescape(match.group(2)) if match else None
+
+def set_xml_attribute(element, name, value):
+    """替换 XML 元素文本中已有属性的值"""
+    match = re.search(r'\b%s\s*=\s*(["\'])(.*?)\1' % name, element, re.S)
+    if match is None:
+        return element
+    return element[:match.start(2)] + xml_escape(value) + element[match.end(2):]
+
+def rewrite_relationships(data, base_dir, renamed, removed=()):
+    """把关系文件中指向 renamed 键的目标改为对应的新部件，删除指向 removed 中部件的关系，
+    其余内容保持不变"""
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data
+
+    def replace(match):
+        element = match.group(0)
+        if xml_attribute(element, 'TargetMode') == 'External':
+            return element
+        target = re.search(r'\bTarget\s*=\s*(["\'])(.*?)\1', element, re.S)
+        if target is None:
+            return element
+        old_target = html.unescape(target.group(2))
+        part = resolve_part(base_dir, old_target)
+        if part in removed:
+            return ''
+        new_part = renamed.get(part)
+        if new_part is None:
+            return element
+        if old_target.startswith('/'):
+            new_target = '/' + quote_part(new_part)
+        else:
+            new_target = relative_target(base_dir, new_part)
+        return element[:target.start(2)] + xml_escape(new_target) + element[target.end(2):]
+
+    return RELATIONSHIP_RE.sub(replace, text).encode('utf-8')
+
+def rewrite_content_types(data, dropped, converted=None):
+    """删除 [Content_Types].xml 中已移除部件的 Override
+
+    converted 为改变了格式的部件 {原部件: 新部件}：原部件的 Override 改为新部件和新的
+    内容类型，新部件的扩展名没有 Default 时补上。
+    """
+    try:
+        text = data.decode('utf-8')
+    except UnicodeDecodeError:
+        return data
+    converted = converted or {}
+
+    def content_type(part):
+        return FORMAT_CONTENT_TYPES[IMAGE_FORMATS[posixpath.splitext(part)[1].lower()]]
+
+    def replace(match):
+        element = match.group(0)
+        part = urllib.parse.unquote(xml_attribute(element, 'PartName') or '').lstrip('/')
+        if part in dropped:
+            return ''
+        if part in converted:
+            element = set_xml_attribute(element, 'PartName', '/' + quote_part(converted[part]))
+            element = set_xml_attribute(element, 'ContentType', content_type(converted[part]))
+        return element
+
+    text = OVERRIDE_RE.sub(replace, text)
+    defaults = {(xml_attribute(match.group(0), 'Extension') or '').lower()
+                for match in DEFAULT_RE.finditer(text)}
+    missing = {posixpath.splitext(part)[1][1:].lower(): content_type(part)
+               for part in converted.values()}
+    entries = ''.join(f'<Default Extension="{extension}" ContentType="{missing[extension]}"/>'
+                      for extension in sorted(missing) if extension not in defaults)
+    if entries:
+        end = text.rfind('</')
+        text = text[:end] + entries + text[end:]
+    return text.encode('utf-8')
+
+def parse_relationships(data):
+    """解析关系文件，返回 [(Id, Type, Target, TargetMode)]"""
+    root = ElementTree.fromstring(data)
+    return [(rel.get('Id'), rel.get('Type', ''), rel.get('Target', ''), rel.get('TargetMode'))
+            for rel in root if rel.tag.endswith('Relationship')]
+
+def salvage_targets(data):
+    """从无法解析的关系文件中尽量取出所有 Target，不区分内部和外部关系"""
+    text = data.decode('utf-8', 'replace')
+    return [html.unescape(match.group(2))
+            for match in re.finditer(r'\bTarget\s*=\s*(["\'])(.*?)\1', text, re.S)]
+
+def parse_xml_stream(stream, start, end=None):
+    """用 expat 按块解析 XML 流，元素名为 命名空间}标签 的形式"""
+    parser = expat.ParserCreate(namespace_separator='}')
+    parser.StartElementHandler = start
+    if end is not None:
+        parser.EndElementHandler = end
+    while True:
+        check_canceled()
+        chunk = stream.read(COPY_CHUNK_SIZE)
+        if not chunk:
+            break
+        parser.Parse(chunk, False)
+    parser.Parse(b'', True)
+
+def read_relationships(stream):
+    """流式解析关系文件，返回 [(Type, Target, TargetMode)]"""
+    relationships = []
+
+    def start(name, attrs):
+        if name.rsplit('}', 1)[-1] == 'Relationship':
+            relationships.append((attrs.get('Type', ''), attrs.get('Target', ''),
+                                  attrs.get('TargetMode')))
+
+    parse_xml_stream(stream, start)
+    return relationships
+
+def find_orphan_parts(src, infos):
+    """按关系图找出从包关系无法到达的部件
+
+    从 _rels/.rels 出发沿内部关系遍历，可达部件的关系文件也是可达的，
+    [Content_Types].xml 总是保留；部件名不区分大小写。返回 (不可达的部件,
+    [Content_Types].xml 中指向不存在部件的 Override 部件名)。没有包关系或有关系
+    文件无法解析时不移除任何部件。
+    """
+    names = {info.filename.lower(): info.filename for info in infos if not info.is_dir()}
+    if '_rels/.rels' not in names:
+        return set(), set()
+
+    reachable = {CONTENT_TYPES_NAME.lower()}
+    pending = ['']
+    while pending:
+        part = pending.pop()
+        base_dir = posixpath.dirname(part)
+        rels_name = posixpath.join(base_dir, '_rels', posixpath.basename(part) + RELS_SUFFIX)
+        if rels_name not in names:
+            continue
+        reachable.add(rels_name)
+        try:
+            with src.open(names[rels_name]) as stream:
+                relationships = read_relationships(stream)
+        except expat.ExpatError as e:
+            logging.warning(f"关系文件无法解析，不移除未引用的部件: {names[rels_name]} - {str(e)}")
+            return set(), set()
+        for _, target, mode in relationships:
+            if mode == 'External':
+                continue
+            target_part = resolve_part(base_dir, target).lower()
+            if target_part in names and target_part not in reachable:
+                reachable.add(target_part)
+                pending.append(target_part)
+
+    stale = set()
+    if CONTENT_TYPES_NAME.lower() in names:
+        def start(name, attrs):
+            if name.rsplit('}', 1)[-1] == 'Override':
+                part = urllib.parse.unquote(attrs.get('PartName', '')).lstrip('/')
+                if part.lower() not in names:
+                    stale.add(part)
+
+        try:
+            with src.open(names[CONTENT_TYPES_NAME.lower()]) as stream:
+                parse_xml_stream(stream, start)
+        except expat.ExpatError:
+            stale.clear()
+    return {names[name] for name in names.keys() - reachable}, stale
+
+def find_dangling_parts(src, infos):
+    """找出源文档中内部关系目标和 Override 指向、但并不存在的部件，返回小写部件名集合
+
+    无法解析的关系文件和内容类型跳过，校验输出时它们按原样拷贝，同样不会检查。
+    """
+    names = {info.filename.lower() for info in infos if not info.is_dir()}
+    referenced = set()
+
+    def override(name, attrs):
+        if name.rsplit('}', 1)[-1] == 'Override':
+            referenced.add(urllib.parse.unquote(attrs.get('PartName', '')).lstrip('/').lower())
+
+    for info in infos:
+        lower = info.filename.lower()
+        try:
+            if lower.endswith(RELS_SUFFIX):
+                with src.open(info) as stream:
+                    relationships = read_relationships(stream)
+                base_dir = rels_base_dir(info.filename)
+                referenced.update(resolve_part(base_dir, target).lower()
+                                  for _, target, mode in relationships if mode != 'External')
+            elif lower == CONTENT_TYPES_NAME.lower():
+                with src.open(info) as stream:
+                    parse_xml_stream(stream, override)
+        except expat.ExpatError:
+            continue
+    return referenced - names
+
+def verify_document(path, source_parts=None, dangling=()):
+    """不渲染文档，检查压缩包和部件的结构，返回发现的问题列表，没有问题时为空
+
+    新写入的条目流式读取一遍，读完时由 zipfile 校验 CRC，其中的 XML 部件用 expat 检查
+    是否格式正确，JPEG/PNG/BMP 的图片头要与内容类型一致、尺寸有效。关系文件和
+    [Content_Types].xml 总是解析：关系目标和 Override 必须指向存在的部件，每个部件
+    都要有内容类型。source_parts 为源文档的 {小写部件名: (CRC, 压缩后大小)}，两者都
+    未变的条目是原样拷贝的压缩数据，只检查本地文件头和数据范围，不再解压；已有部件
+    缺少内容类型以及源文档中就无法解析的 XML 都不算问题。dangling 为源文档中本来就
+    指向不存在部件的目标（find_dangling_parts），只有这些目标缺失时不算问题，压缩时
+    改名或删除部件留下的悬空目标总会报告。可以在子进程中调用。
+    """
+    problems = []
+    with zipfile.ZipFile(path) as zipf:
+        infos = [info for info in zipf.infolist() if not info.is_dir()]
+        names = {info.filename.lower() for info in infos}
+        known = source_parts if source_parts is not None else {}
+
+        def missing(part):
+            return part not in names and part not in dangling
+
+        def copied(info):
+            return known.get(info.filename.lower()) == (info.CRC, info.compress_size)
+
+        def read(info, start=None):
+            """读完条目，start 不为 None 时按 XML 解析，返回开头的数据块"""
+            if start is not None:
+                try:
+                    with zipf.open(info) as stream:
+                        parse_xml_stream(stream, start)
+                    return b''
+                except expat.ExpatError:
+                    if not copied(info):
+                        raise
+            with zipf.open(info) as stream:
+                head = stream.read(COPY_CHUNK_SIZE)
+                while stream.read(COPY_CHUNK_SIZE):
+                    pass
+                return head
+
+        # 先读取内容类型，其余部件按它判断是否为 XML 和图片
+        defaults, overrides = {}, {}
+
+        def content_types(name, attrs):
+            tag = name.rsplit('}', 1)[-1]
+            if tag == 'Default':
+                defaults[attrs.get('Extension', '').lower()] = attrs.get('ContentType', '')
+            elif tag == 'Override':
+                part = urllib.parse.unquote(attrs.get('PartName', '')).lstrip('/').lower()
+                overrides[part] = attrs.get('ContentType', '')
+
+        types_info = next((info for info in infos
+                           if info.filename.lower() == CONTENT_TYPES_NAME.lower()), None)
+        if types_info is None:
+            return [f"缺少 {CONTENT_TYPES_NAME}"]
+        try:
+            read(types_info, content_types)
+        except (zipfile.BadZipFile, zlib.error, EOFError, expat.ExpatError) as e:
+            return [f"{CONTENT_TYPES_NAME}: {str(e)}"]
+        # 源文档的内容类型本来就无法解析时不检查内容类型
+        typed = bool(defaults or overrides) or not copied(types_info)
+        problems.extend(f"{CONTENT_TYPES_NAME}: Override 指向不存在的部件 /{part}"
+                        for part in sorted(overrides) if missing(part))
+
+        image_types = {content_type: format for format, content_type in FORMAT_CONTENT_TYPES.items()}
+        for info in infos:
+            check_canceled()
+            name = info.filename
+            lower = name.lower()
+            if lower == CONTENT_TYPES_NAME.lower():
+                continue
+            # 扩展名为部件名最后一段中最后一个点之后的部分，例如 _rels/.rels 为 rels
+            segment = posixpath.basename(lower)
+            extension = segment.rpartition('.')[2] if '.' in segment else ''
+            content_type = overrides.get(lower, defaults.get(extension))
+            if content_type is None and typed and lower not in known:
+                problems.append(f"{name}: 没有内容类型")
+            relationships = []
+
+            def start(element, attrs):
+                if element.rsplit('}', 1)[-1] == 'Relationship':
+                    relationships.append((attrs.get('Target', ''), attrs.get('TargetMode')))
+
+            try:
+                if lower.endswith(RELS_SUFFIX):
+                    read(info, start)
+                elif copied(info):
+                    if entry_data_offset(zipf, info) + info.compress_size > zipf.start_dir:
+                        problems.append(f"{name}: 压缩数据不完整")
+                elif ((content_type or '').endswith('xml') or
+                      any(fnmatch.fnmatchcase(lower, pattern) for pattern in XML_PATTERNS)):
+                    read(info, lambda element, attrs: None)
+                else:
+                    head = read(info)
+                    format = image_types.get(content_type)
+                    if format is not None:
+                        header = read_image_header(head)
+                        if header is None or header.format != format:
+                            problems.append(f"{name}: 图片数据与内容类型 {content_type} 不一致")
+                        elif header.width <= 0 or header.height <= 0:
+                            problems.append(f"{name}: 图片尺寸无效 "
+                                            f"({header.width}x{header.height})")
+            except NotImplementedError:
+                # zipfile 不支持的压缩方式（如 deflate64）只会来自原样拷贝的条目
+                continue
+            except (zipfile.BadZipFile, zlib.error, EOFError, expat.ExpatError) as e:
+                problems.append(f"{name}: {str(e)}")
+                continue
+
+            base_dir = rels_base_dir(name)
+            for target, mode in relationships:
+                if mode != 'External' and missing(resolve_part(base_dir, target).lower()):
+                    problems.append(f"{name}: 关系目标不存在 {target}")
+    return problems
+
+def find_thumbnails(src):
+    """从包关系 _rels/.rels 中找出文档缩略图部件"""
+    try:
+        data = src.read('_rels/.rels')
+    except KeyError:
+        return set()
+    names = set(src.namelist())
+    parts = {resolve_part('', target) for _, rel_type, target, mode in parse_relationships(data)
+             if rel_type == THUMBNAIL_REL_TYPE and mode != 'External'}
+    return parts & names
+
+def shrink_thumbnail(data, quality):
+    """把 JPEG 或 PNG 缩略图缩小到 THUMBNAIL_SIZE 以内并去掉元数据，保持原格式
+
+    其他格式（如 WMF）返回 None。
+    """
+    with Image.open(io.BytesIO(data)) as img:
+        format = img.format
+        if format not in ('JPEG', 'PNG'):
+            return None
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        out = io.BytesIO()
+        if format == 'JPEG':
+            img.save(out, format='JPEG', quality=quality, optimize=True)
+        else:
+            img.save(out, format='PNG', optimize=True, icc_profile=None)
+    return out.getvalue()
+
+def rels_source_part(rels_name):
+    """关系文件所描述的源部件，例如 word/_rels/document.xml.rels 对应 word/document.xml"""
+    return posixpath.join(rels_base_dir(rels_name),
+                          posixpath.basename(rels_name)[:-len(RELS_SUFFIX)])
+
+def measure_drawing_extents(stream, media_ids):
+    """流式解析部件 XML，返回 {关系 Id: [(宽, 高)]}，单位为 EMU
+
+    图片在 wp:inline / wp:anchor 中的显示尺寸取自 wp:extent，并按 a:srcRect
+    的裁剪比例还原为整张图片的显示尺寸。以其他方式（如 VML）引用的图片
+    尺寸记为 None，表示无法确定。
+    """
+    sizes = collections.defaultdict(list)
+    drawings = []
+    fills = []
+
+    def start(name, attrs):
+        tag = name.rsplit('}', 1)[-1]
+        if name.startswith(WP_NS) and tag in ('inline', 'anchor'):
+            drawings.append(None)
+        elif name.startswith(WP_NS) and tag == 'extent' and drawings:
+            drawings[-1] = (int(attrs.get('cx', 0)), int(attrs.get('cy', 0)))
+        elif tag == 'blipFill':
+            fills.append([[], (0, 0, 0, 0)])
+        elif tag == 'blip' and fills:
+            for attr in (R_NS + 'embed', R_NS + 'link'):
+                if attrs.get(attr) in media_ids:
+                    fills[-1][0].append(attrs[attr])
+        elif tag == 'srcRect' and fills:
+            fills[-1][1] = tuple(int(attrs.get(side, 0)) for side in ('l', 't', 'r', 'b'))
+        else:
+            for value in attrs.values():
+                if value in media_ids:
+                    sizes[value].append(None)
+
+    def end(name):
+        tag = name.rsplit('}', 1)[-1]
+        if tag == 'blipFill' and fills:
+            ids, (left, top, right, bottom) = fills.pop()
+            extent = drawings[-1] if drawings else None
+            for rel_id in ids:
+                if not extent:
+                    sizes[rel_id].append(None)
+                    continue
+                # 裁剪值以十万分之一为单位，显示的只是图片的一部分
+                visible_x = max(0.01, 1 - (left + right) / 100000)
+                visible_y = max(0.01, 1 - (top + bottom) / 100000)
+                sizes[rel_id].append((extent[0] / visible_x, extent[1] / visible_y))
+        elif name.startswith(WP_NS) and tag in ('inline', 'anchor') and drawings:
+            drawings.pop()
+
+    parse_xml_stream(stream, start, end)
+    return sizes
+
+def measure_display_sizes(src, infos, dpi, renamed=None):
+    """计算每张媒体图片在目标 DPI 下显示所需的最大像素尺寸
+
+    解析所有引用了媒体部件的 XML 部件（正文、页眉、页脚、脚注等），返回
+    {媒体部件: (宽, 高)}。只要有一处引用无法确定显示尺寸，该图片就不在
+    结果中，保持原始分辨率。
+    """
+    renamed = renamed or {}
+    names = {info.filename for info in infos}
+    largest = {}
+    unknown = set()
+    for info in infos:
+        if not info.filename.endswith(RELS_SUFFIX):
+            continue
+        base_dir = rels_base_dir(info.filename)
+        media_rels = {}
+        data = src.read(info)
+        try:
+            relationships = parse_relationships(data)
+        except ElementTree.ParseError as e:
+            logging.warning(f"关系文件解析失败: {info.filename} - {str(e)}")
+            # 无法确定源部件中的显示尺寸，它可能引用的媒体都保持原始分辨率；
+            # 一个目标也取不出时所有媒体都保持原始分辨率
+            targets = salvage_targets(data)
+            if targets:
+                parts = (resolve_part(base_dir, target) for target in targets)
+                unknown.update(part for part in (renamed.get(part, part) for part in parts)
+                               if part.startswith(MEDIA_PREFIX))
+            else:
+                unknown.update(name for name in names if name.startswith(MEDIA_PREFIX))
+            continue
+        for rel_id, rel_type, target, mode in relationships:
+            if mode == 'External':
+                continue
+            part = resolve_part(base_dir, target)
+            part = renamed.get(part, part)
+            if part.startswith(MEDIA_PREFIX):
+                media_rels[rel_id] = part
+        if not media_rels:
+            continue
+
+        source = rels_source_part(info.filename)
+        extents = None
+        if source in names and source.endswith('.xml'):
+            try:
+                with src.open(source) as stream:
+                    extents = measure_drawing_extents(stream, set(media_rels))
+            except expat.ExpatError as e:
+                logging.warning(f"部件解析失败: {source} - {str(e)}")
+        for rel_id, part in media_rels.items():
+            if extents is None:
+                unknown.add(part)
+                continue
+            # 源部件中没有用到的关系不影响显示尺寸
+            for size in extents.get(rel_id, ()):
+                if size is None:
+                    unknown.add(part)
+                    continue
+                width = math.ceil(size[0] / EMU_PER_INCH * dpi)
+                height = math.ceil(size[1] / EMU_PER_INCH * dpi)
+                old_width, old_height = largest.get(part, (0, 0))
+                largest[part] = (max(width, old_width), max(height, old_height))
+    return {part: size for part, size in largest.items()
+            if part not in unknown and size[0] > 0 and size[1] > 0}
+
+def find_duplicate_media(src, infos):
+    """查找内容相同的媒体部件，返回 {重复部件: 保留的部件}
+
+    先按中央目录中的大小和 CRC 分组，只有可能重复的部件才需要解压计算哈希。
+    """
+    groups = collections.defaultdict(list)
+    for info in infos:
+        if info.filename.startswith(MEDIA_PREFIX) and not info.is_dir():
+            groups[(info.file_size, info.CRC)].append(info)
+
+    duplicates = {}
+    for group in groups.values():
+        if len(group) < 2:
+            continue
+        kept = {}
+        for info in group:
+            digest = hashlib.sha256()
+            for chunk in read_chunks(src, info):
+                check_canceled()
+                digest.update(chunk)
+            digest = digest.digest()
+            if digest in kept:
+                duplicates[info.filename] = kept[digest]
+            else:
+                kept[digest] = info.filename
+    return duplicates
+
+class CompressionCanceled(Exception):
+    """压缩被取消，在各阶段的取消检查点抛出"""
+
+    def __init__(self, message="压缩已取消"):
+        super().__init__(message)
+
+# 当前线程所执行任务的取消标志，由 cancel_scope 设置
+current_task = threading.local()
+# 工作进程中整个进程池共享的取消标志数组，由 init_worker 设置
+worker_cancel_flags = None
+
+def check_canceled():
+    """取消检查点：当前任务所属的文档已被取消时抛出 CompressionCanceled"""
+    token = getattr(current_task, 'token', None)
+    if token is not None and token.is_set():
+        raise CompressionCanceled()
+
+@contextlib.contextmanager
+def cancel_scope(token):
+    """在代码块中让当前线程的 check_canceled 检查 token，token 为 None 时不检查"""
+    previous = getattr(current_task, 'token', None)
+    current_task.token = token
+    try:
+        yield
+    finally:
+        current_task.token = previous
+
+def run_task(token, func, *args):
+    """在 token 的取消范围内执行提交到进程池或线程池的任务，开始前已取消时不执行"""
+    with cancel_scope(token):
+        check_canceled()
+        return func(*args)
+
+def init_worker(flags):
+    global worker_cancel_flags
+    worker_cancel_flags = flags
+
+class CancelToken:
+    """文档的取消标志
+
+    cancel() 后 is_set() 为 True，wait() 立即停止等待，on_cancel 注册的回调在取消的
+    线程中调用（注册时已经取消则立即调用）。
+    """
+
+    def __init__(self):
+        self.signal = concurrent.futures.Future()
+
+    def is_set(self):
+        return self.signal.done()
+
+    def cancel(self):
+        try:
+            self.signal.set_result(None)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    def on_cancel(self, callback):
+        self.signal.add_done_callback(lambda _: callback())
+
+    def wait(self, future):
+        """等待 future 完成并返回结果，取消时不再等待，抛出 CompressionCanceled"""
+        concurrent.futures.wait((future, self.signal),
+                                return_when=concurrent.futures.FIRST_COMPLETED)
+        if self.is_set():
+            raise CompressionCanceled()
+        return future.result()
+
+class SharedCancelFlag:
+    """可以传给工作进程的取消标志，对应进程池共享内存中的一个字节"""
+
+    def __init__(self, slot):
+        self.slot = slot
+
+    def is_set(self):
+        return bool(worker_cancel_flags[self.slot])
+
+class CompressionPool(concurrent.futures.ProcessPoolExecutor):
+    """图片压缩进程池，为每个文档分配一个工作进程中可见的取消标志
+
+    标志是创建进程时传给工作进程的共享内存，任务执行中也能看到文档被取消，
+    在编码的各步骤之间停止，不必等整张图片处理完。
+    """
+
+    def __init__(self, workers):
+        context = multiprocessing.get_context('spawn')
+        self.flags = context.RawArray('b', CANCEL_SLOTS)
+        self.owners = {}
+        self.slots_lock = threading.Lock()
+        super().__init__(max_workers=workers, mp_context=context,
+                         initializer=init_worker, initargs=(self.flags,))
+
+    @contextlib.contextmanager
+    def cancel_flag(self, token):
+        """给出文档在工作进程中的取消标志，token 取消时设置；标志用完时给出 None"""
+        with self.slots_lock:
+            slot = next((slot for slot in range(CANCEL_SLOTS) if slot not in self.owners), None)
+            if slot is not None:
+                self.owners[slot] = token
+                self.flags[slot] = 0
+        if slot is None:
+            yield None
+            return
+
+        def cancel():
+            # 文档结束后标志可能已分给其他文档
+            with self.slots_lock:
+                if self.owners.get(slot) is token:
+                    self.flags[slot] = 1
+
+        token.on_cancel(cancel)
+        try:
+            yield SharedCancelFlag(slot)
+        finally:
+            with self.slots_lock:
+                del self.owners[slot]
+
+def create_process_pool(workers):
+    """创建用于图片压缩的进程池，单进程时返回 None"""
+    if workers <= 1:
+        return None
+    return CompressionPool(workers)
+
+class MemoryBudget:
+    """按估算的内存占用限制同时进行的图片解码
+
+    批量压缩时多个文档共用同一个预算；单项占用超过上限时等到没有其他任务
+    时才单独运行。
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, cost):
+        """占用预算，不足时等待；等待中所属文档被取消时抛出 CompressionCanceled"""
+        with self.condition:
+            while self.used and self.used + cost > self.limit:
+                check_canceled()
+                self.condition.wait()
+            self.used += cost
+
+    def release(self, cost):
+        with self.condition:
+            self.used -= cost
+            self.condition.notify_all()
+
+    def wake(self):
+        """唤醒等待中的线程，让它们检查取消"""
+        with self.condition:
+            self.condition.notify_all()
+
+def default_cache_dir():
+    """图片缓存的默认目录"""
+    base = (os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'DocOptimizer', 'images')
+
+class CompressionOptions:
+    """影响输出内容的压缩参数"""
+
+    def __init__(self, quality=75, dedup=True, dpi=None, target_size=None,
+                 memory_limit=None, oversize='downscale', png_palette=None, min_ssim=None,
+                 metadata='strip', thumbnail='keep', prune_orphans=True, xml_level=None):
+        self.quality = quality
+        # 合并文档内容完全相同的媒体部件
+        self.dedup = dedup
+        # 按图片在文档中的最大显示尺寸缩小到该分辨率，None 表示保持原始尺寸
+        self.dpi = dpi
+        # 目标文档大小（字节），设置后自动选择 JPEG 质量，quality 作为上限
+        self.target_size = target_size
+        # 同时解码的图片估算内存上限（字节），None 表示不限制
+        self.memory_limit = memory_limit
+        # 单张图片超出内存上限时的处理：downscale 缩小到上限以内，skip 保留原图
+        self.oversize = oversize
+        # PNG 调色板量化的最低峰值信噪比（dB），None 表示不量化
+        self.png_palette = png_palette
+        # 在多种候选格式中选择最小结果时与原图的最低 SSIM，None 表示保持原格式
+        self.min_ssim = min_ssim
+        # 图片元数据：strip 应用 EXIF 方向、转换到 sRGB 并去掉 EXIF/XMP/ICC，keep 原样保留
+        self.metadata = metadata
+        # 文档缩略图：keep 保留，shrink 缩小并去掉元数据，remove 删除
+        self.thumbnail = thumbnail
+        # 移除从包关系无法到达的部件
+        self.prune_orphans = prune_orphans
+        # XML 部件重新压缩的 deflate 级别（1-9 或 max），None 表示原样拷贝
+        self.xml_level = xml_level
+
+    def image_settings(self, ext, max_size=None):
+        """单张图片的编码参数，即 recompress_image 除图片数据外的参数，同时是缓存键的一部分"""
+        # 选择格式时任何图片都可能量化为调色板 PNG
+        palette = self.png_palette if ext == '.png' or self.min_ssim is not None else None
+        return (ext, self.quality, max_size, palette, self.min_ssim, self.metadata)
+
+    def fingerprint(self):
+        """全部参数和引擎版本的字符串表示，参数或版本不同时输出可能不同"""
+        return json.dumps({'version': VERSION, 'image_cache': ImageCache.VERSION, **vars(self)},
+                          sort_keys=True)
+
+class ImageCache:
+    """按源图片内容和编码参数寻址的持久化压缩结果缓存
+
+    压缩结果以文件形式保存在缓存目录中，索引和最近访问时间记录在 SQLite 数据库里，
+    多个线程和进程可以同时读写；总大小超过上限时按最近最少使用的顺序淘汰。
+    """
+    # 编码器行为变化时递增，使旧的缓存结果失效
+    VERSION = 1
+
+    def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.connect().execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)')
+        # 大小上限可能比上次使用时更小
+        self.transaction(self.evict)
+
+    def connect(self):
+        """每个线程使用独立的数据库连接"""
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(os.path.join(self.directory, 'index.sqlite'),
+                                 timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+        return db
+
+    @classmethod
+    def make_key(cls, data, settings):
+        digest = hashlib.sha256(data)
+        digest.update(repr((cls.VERSION, settings)).encode('utf-8'))
+        return digest.hexdigest()
+
+    def blob_path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def count(self, name):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, key):
+        """返回缓存的压缩结果，未命中时返回 None"""
+        try:
+            with open(self.blob_path(key), 'rb') as f:
+                data = f.read()
+            self.connect().execute('UPDATE entries SET last_used = ? WHERE key = ?',
+                                   (time.time(), key))
+        except (OSError, sqlite3.Error):
+            self.count('misses')
+            return None
+        self.count('hits')
+        return data
+
+    def put(self, key, data):
+        """保存压缩结果，并在超过大小上限时淘汰最久未使用的条目"""
+        path = self.blob_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再原子替换，其他进程不会读到写了一半的结果
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+        def insert(db):
+            db.execute('INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)',
+                       (key, len(data), time.time()))
+            self.evict(db)
+        self.transaction(insert)
+
+    def transaction(self, func):
+        """在写事务中执行 func(db)，多个进程的淘汰操作互斥进行"""
+        db = self.connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            func(db)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+
+    def evict(self, db):
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_size:
+            return
+        for key, size in db.execute('SELECT key, size FROM entries ORDER BY last_used').fetchall():
+            if total <= self.max_size:
+                break
+            db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            try:
+                os.remove(self.blob_path(key))
+            except OSError:
+                pass
+            total -= size
+            self.count('evictions')
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+def file_hash(path):
+    """分块计算文件的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class Manifest:
+    """增量批量压缩的清单
+
+    记录每个输入文档的大小、修改时间和内容哈希，所用的压缩参数，以及输出文档的
+    大小、修改时间和内容哈希。再次运行时输入和参数都没有变化、输出仍然存在的
+    文档直接跳过。先比较文件状态，状态不同时才计算哈希，绝大多数文档不需要读取内容。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            'input TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, hash TEXT, settings TEXT, '
+            'output TEXT, output_size INTEGER, output_mtime INTEGER, output_hash TEXT, '
+            'updated REAL)')
+        # 一次读入全部记录，检查大量文档时不必逐条查询
+        with self.lock:
+            self.entries = {row[0]: row for row in self.db.execute(
+                'SELECT input, size, mtime, hash, settings, output, output_size, '
+                'output_mtime, output_hash FROM documents')}
+
+    @staticmethod
+    def key(path):
+        return os.path.normcase(os.path.abspath(path))
+
+    def is_current(self, input_path, output_path, settings):
+        """输入和参数都没有变化、输出仍然存在且未被修改时返回 True"""
+        entry = self.entries.get(self.key(input_path))
+        if entry is None:
+            return False
+        (_, size, mtime, digest, old_settings, output, output_size,
+         output_mtime, output_digest) = entry
+        if old_settings != settings or output != self.key(output_path):
+            return False
+        try:
+            stat = os.stat(input_path)
+            output_stat = os.stat(output_path)
+        except OSError:
+            return False
+
+        # 文件状态不同但大小相同时（例如复制或 touch 过），再比较内容哈希
+        refreshed = False
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+            if stat.st_size != size or file_hash(input_path) != digest:
+                return False
+            refreshed = True
+        if (output_stat.st_size, output_stat.st_mtime_ns) != (output_size, output_mtime):
+            if output_stat.st_size != output_size or file_hash(output_path) != output_digest:
+                return False
+            refreshed = True
+        if refreshed:
+            self.record(input_path, output_path, settings, digest, output_digest)
+        return True
+
+    def record(self, input_path, output_path, settings, digest=None, output_digest=None):
+        """记录一个压缩成功的文档"""
+        stat = os.stat(input_path)
+        output_stat = os.stat(output_path)
+        row = (self.key(input_path), stat.st_size, stat.st_mtime_ns,
+               digest or file_hash(input_path), settings, self.key(output_path),
+               output_stat.st_size, output_stat.st_mtime_ns,
+               output_digest or file_hash(output_path))
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                            row + (time.time(),))
+            self.entries[row[0]] = row
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+class Metrics:
+    """把压缩过程中的结构化事件分发给各个输出
+
+    事件为字典，包含 event（document、image、part，监视模式下还有 job 和 queue）、time
+    以及各事件自己的字段；
+    输出为任意可调用对象，例如 JsonLinesLog、PrometheusMetrics。
+    """
+
+    def __init__(self, *sinks):
+        self.sinks = list(sinks)
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3), **fields}
+        for sink in self.sinks:
+            try:
+                sink(record)
+            except Exception as e:
+                logging.warning(f"写入指标失败: {str(e)}")
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, 'close'):
+                sink.close()
+
+class JsonLinesLog:
+    """把事件逐行以 JSON 追加写入文件"""
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.lock:
+            self.file.write(line + '\n')
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+class PrometheusMetrics:
+    """把事件汇总为 Prometheus 文本格式的计数器和直方图
+
+    可以在每个文档完成后写入文本文件（供 node_exporter 的 textfile 收集器读取），
+    也可以在本机端口上提供 /metrics。
+    """
+    SECONDS_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300)
+    HELP = {
+        'documents_total': ('counter', "处理的文档数"),
+        'document_bytes_total': ('counter', "文档的输入和输出字节数"),
+        'document_seconds': ('histogram', "单个文档的处理耗时"),
+        'stage_seconds_total': ('counter', "各阶段累计耗时"),
+        'images_total': ('counter', "按格式和处理结果统计的图片数"),
+        'image_bytes_total': ('counter', "图片的输入和输出字节数"),
+        'image_seconds': ('histogram', "单张图片的解码、缩放和编码耗时"),
+        'xml_bytes_total': ('counter', "重新压缩的 XML 部件原来和写入的压缩大小"),
+        'queue_jobs': ('gauge', "监视模式任务队列中各状态的任务数"),
+        'jobs_total': ('counter', "监视模式处理的任务数"),
+        'job_wait_seconds': ('histogram', "任务从入队到开始压缩的等待时间"),
+        'job_latency_seconds': ('histogram', "任务从入队到压缩完成的总耗时"),
+    }
+
+    def __init__(self, path=None, prefix='docoptimizer_'):
+        self.path = path
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        # 多个文档线程可能同时写入文本文件，依次替换，最后写入的总是最新的内容
+        self.write_lock = threading.Lock()
+        self.counters = collections.defaultdict(float)
+        self.gauges = {}
+        self.histograms = {}
+        self.server = None
+
+    def add(self, name, labels, value=1):
+        self.counters[name, tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, value):
+        buckets, total = self.histograms.setdefault(name, ([0] * len(self.SECONDS_BUCKETS), [0.0, 0]))
+        for i, bound in enumerate(self.SECONDS_BUCKETS):
+            if value <= bound:
+                buckets[i] += 1
+        total[0] += value
+        total[1] += 1
+
+    def __call__(self, record):
+        with self.lock:
+            for stage, seconds in record.get('stages', {}).items():
+                self.add('stage_seconds_total', {'stage': stage}, seconds)
+            if record['event'] == 'document':
+                self.add('documents_total', {'status': 'failed' if record.get('error') else 'ok'})
+                self.add('document_bytes_total', {'direction': 'in'}, record.get('bytes_in', 0))
+                self.add('document_bytes_total', {'direction': 'out'}, record.get('bytes_out', 0))
+                self.observe('document_seconds', record.get('seconds', 0))
+            elif record['event'] == 'image':
+                codec = record.get('codec', '')
+                self.add('images_total', {'codec': codec, 'outcome': record.get('outcome', '')})
+                self.add('image_bytes_total', {'codec': codec, 'direction': 'in'},
+                         record.get('bytes_in', 0))
+                self.add('image_bytes_total', {'codec': codec, 'direction': 'out'},
+                         record.get('bytes_out', 0))
+                if record.get('outcome') in ('encoded', 'kept'):
+                    self.observe('image_seconds', sum(seconds for stage, seconds
+                                                      in record['stages'].items()
+                                                      if stage != 'read'))
+            elif record['event'] == 'part':
+                self.add('xml_bytes_total', {'direction': 'in'}, record.get('original_bytes', 0))
+                self.add('xml_bytes_total', {'direction': 'out'}, record.get('bytes_out', 0))
+            elif record['event'] == 'job':
+                self.add('jobs_total', {'status': record.get('status', '')})
+                self.observe('job_wait_seconds', record.get('wait_seconds', 0))
+                self.observe('job_latency_seconds', record.get('latency_seconds', 0))
+            elif record['event'] == 'queue':
+                for state in ('pending', 'running', 'done', 'failed'):
+                    self.gauges['queue_jobs', (('state', state),)] = record.get(state, 0)
+        if self.path and record['event'] in ('document', 'queue'):
+            self.write(self.path)
+
+    def render(self):
+        """生成 Prometheus 文本格式"""
+        lines = []
+        with self.lock:
+            for name, (kind, text) in self.HELP.items():
+                metric = self.prefix + name
+                lines.append(f"# HELP {metric} {text}")
+                lines.append(f"# TYPE {metric} {kind}")
+                if kind == 'histogram':
+                    buckets, (total, count) = self.histograms.get(
+                        name, ([0] * len(self.SECONDS_BUCKETS), [0.0, 0]))
+                    for bound, value in zip(self.SECONDS_BUCKETS, buckets):
+                        lines.append(f'{metric}_bucket{{le="{bound}"}} {value}')
+                    lines.append(f'{metric}_bucket{{le="+Inf"}} {count}')
+                    lines.append(f"{metric}_sum {total:.6f}")
+                    lines.append(f"{metric}_count {count}")
+                    continue
+                values = self.gauges if kind == 'gauge' else self.counters
+                for (counter, labels), value in sorted(values.items()):
+                    if counter == name:
+                        label_text = ','.join(f'{key}="{label}"' for key, label in labels)
+                        value = int(value) if float(value).is_integer() else round(value, 6)
+                        lines.append(f"{metric}{{{label_text}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """原子地写入文本文件，读取方不会看到写了一半的内容"""
+        with self.write_lock:
+            fd, temp_path = tempfile.mkstemp(suffix=TEMP_SUFFIX, dir=os.path.dirname(path) or '.')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(self.render())
+                # mkstemp 创建的文件只有所有者可读，textfile 收集器可能以其他用户运行
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+            except BaseException:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+                raise
+
+    def serve(self, port, host='127.0.0.1'):
+        """在后台线程中提供 http://host:port/metrics"""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+class CompressionResult:
+    """单个文档的压缩结果"""
+
+    def __init__(self, input_path, output_path, orig_size=0, comp_size=0, error=None):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.orig_size = orig_size
+        self.comp_size = comp_size
+        self.error = error
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.duplicates = 0
+        self.target_size = None
+        self.chosen_quality = None
+        self.images_kept = 0
+        self.images_skipped = 0
+        self.images_converted = 0
+        # 移除的未引用部件和缩略图，以及它们在压缩包中占用的字节数
+        self.removed_parts = []
+        self.removed_bytes = 0
+        self.kept_original = False
+        # 输出文档通过了结构校验
+        self.verified = False
+        # 增量压缩时输入和参数都没有变化而跳过
+        self.unchanged = False
+
+    @property
+    def success(self):
+        return self.error is None
+
+    @property
+    def ratio(self):
+        if not self.orig_size:
+            return 0.0
+        return (self.orig_size - self.comp_size) / self.orig_size * 100
+
+    def summary(self):
+        if not self.success:
+            return f"压缩失败: {self.error}"
+        if self.unchanged:
+            return f"文档未变化，已跳过: {self.output_path} ({self.comp_size/1024:.2f}KB)"
+        message = (f"压缩成功！\n原始大小: {self.orig_size/1024:.2f}KB "
+                   f"压缩后: {self.comp_size/1024:.2f}KB "
+                   f"(缩小了 {self.ratio:.1f}%)")
+        if self.target_size:
+            message += (f"\n目标大小: {self.target_size/1024:.2f}KB "
+                        f"选用JPEG质量: {self.chosen_quality}")
+            if self.comp_size > self.target_size:
+                message += "（未能达到目标大小）"
+        if self.kept_original:
+            message += "\n压缩后文件更大，已保留原始文档"
+        elif self.images_kept:
+            message += f"\n重新编码未变小而保留原图: {self.images_kept} 张"
+        if self.images_skipped:
+            message += f"\n超出内存上限而保留原图: {self.images_skipped} 张"
+        if self.duplicates:
+            message += f"\n合并重复图片: {self.duplicates} 张"
+        if self.images_converted:
+            message += f"\n改变格式的图片: {self.images_converted} 张"
+        if self.removed_parts:
+            message += (f"\n移除未引用的部件: {len(self.removed_parts)} 个，"
+                        f"节省 {self.removed_bytes/1024:.2f}KB")
+        if self.cache_hits or self.cache_misses:
+            message += f"\n图片缓存: 命中 {self.cache_hits} 张，未命中 {self.cache_misses} 张"
+        return message
+
+    def to_dict(self):
+        return {
+            'input': self.input_path,
+            'output': self.output_path,
+            'success': self.success,
+            'orig_size': self.orig_size,
+            'comp_size': self.comp_size,
+            'ratio': round(self.ratio, 2),
+            'error': self.error,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'duplicates': self.duplicates,
+            'target_size': self.target_size,
+            'chosen_quality': self.chosen_quality,
+            'images_kept': self.images_kept,
+            'images_skipped': self.images_skipped,
+            'images_converted': self.images_converted,
+            'removed_parts': self.removed_parts,
+            'removed_bytes': self.removed_bytes,
+            'kept_original': self.kept_original,
+            'verified': self.verified,
+            'unchanged': self.unchanged,
+        }
+
+class DocumentCompressor:
+    """不依赖图形界面的文档压缩引擎
+
+    progress 为可选的回调函数 progress(百分比, 说明文字)；executor 为可选的
+    共享进程池，批量压缩时多个文档共用，未提供时按 workers 自行创建；
+    cache 为可选的 ImageCache；metrics 为可选的 Metrics，接收每张图片和整个文档的
+    各阶段耗时、字节数和编码参数；memory 为可选的共享 MemoryBudget。verify 为 True
+    时用 verify_document 校验输出，没有通过时删除输出并报错。
+    """
+
+    def __init__(self, input_path, output_path, options=None, workers=1,
+                 progress=None, executor=None, cache=None, metrics=None, memory=None,
+                 verify=True):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.options = options or CompressionOptions()
+        self.workers = max(1, workers)
+        self.progress = progress
+        self.executor = executor
+        self.cache = cache
+        self.metrics = metrics
+        self.verify = verify
+        self.verified = False
+        # 设置了内存上限时，同时解码的图片受预算限制；批量压缩时共享同一个预算
+        if memory is None and self.options.memory_limit:
+            memory = MemoryBudget(self.options.memory_limit)
+        self.memory = memory
+        # 每张图片的估算内存、按条带处理的图片，以及超出预算而跳过的图片
+        self.image_costs = {}
+        self.streamed = set()
+        self.skipped = set()
+        # 估算目标大小时预先提交的图片压缩：文件名 -> (缓存键, future)
+        self.prepared = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.images_done = 0
+        self.images_kept = 0
+        # 各阶段累计耗时（秒），以及尚未发出事件的图片读取耗时
+        self.stages = collections.defaultdict(float)
+        self.stages_lock = threading.Lock()
+        self.read_times = {}
+        # 被移除的部件，以及关系目标需要改指向的部件；removed 为没有替代部件、
+        # 指向它们的关系也要删除的部件
+        self.dropped = set()
+        self.renamed = {}
+        self.removed = set()
+        # 需要缩小的文档缩略图
+        self.thumbnails = set()
+        # [Content_Types].xml 中指向不存在部件的 Override
+        self.stale_overrides = set()
+        self.removed_bytes = 0
+        # 改变了格式的图片 {原部件: 新部件}，以及已使用的部件名（小写）
+        self.converted = {}
+        self.part_names = set()
+        # 按显示尺寸计算的图片目标像素尺寸
+        self.display_sizes = {}
+        # 源文档的只读内存映射（SourceMap），无法映射时为 None
+        self.source = None
+        # 取消标志，以及提交到进程池或线程池的任务检查的标志（见 executor_token）
+        self.token = CancelToken()
+        self.task_token = None
+        if self.memory is not None:
+            self.token.on_cancel(self.memory.wake)
+        # 写入中的临时输出文件，成功后替换 output_path
+        self.temp_path = None
+
+    @property
+    def canceled(self):
+        return self.token.is_set()
+
+    @canceled.setter
+    def canceled(self, value):
+        if value:
+            self.cancel()
+
+    def cancel(self):
+        """取消压缩，可以在任意线程中调用
+
+        读取、编码（包括工作进程中正在编码的图片）、写入和校验在下一个检查点停止，
+        compress 抛出 CompressionCanceled，不留下输出文件。
+        """
+        self.token.cancel()
+
+    def report(self, value, text):
+        if self.progress is not None:
+            self.progress(value, text)
+
+    def compress(self):
+        """压缩文档并返回 CompressionResult，失败时抛出异常，被取消时抛出 CompressionCanceled"""
+        start = time.perf_counter()
+        try:
+            with cancel_scope(self.token):
+                result = self.compress_package()
+        except Exception as e:
+            self.emit_document(time.perf_counter() - start, error=str(e))
+            raise
+        self.emit_document(time.perf_counter() - start, result)
+        return result
+
+    def compress_package(self):
+        """compress 的实际实现，不包含文档级别的指标事件"""
+        # 验证文件
+        if not os.path.exists(self.input_path):
+            raise FileNotFoundError("输入文件不存在")
+        
+        if not self.input_path.lower().endswith(('.docx', '.doc')):
+            raise ValueError("仅支持Word文档 (.docx/.doc)")
+
+        with zipfile.ZipFile(self.input_path, 'r') as src, map_archive(self.input_path) as source:
+            self.source = source
+            # 验证docx结构
+            infos = src.infolist()
+            if not any(info.filename.startswith(MEDIA_PREFIX) for info in infos):
+                raise ValueError("无效的Word文档结构")
+            self.part_names = {info.filename.lower() for info in infos}
+
+            # 移除从包关系无法到达的部件（多为编辑后遗留的媒体），之后不再处理
+            if self.options.prune_orphans:
+                with self.timed('graph'):
+                    orphans, self.stale_overrides = find_orphan_parts(src, infos)
+                for name in sorted(orphans):
+                    logging.info(f"移除未引用的部件: {name}")
+                self.removed.update(orphans)
+                self.dropped.update(orphans)
+
+            # 合并重复的媒体部件，重复的副本不再压缩和写入
+            if self.options.dedup:
+                with self.timed('dedup'):
+                    duplicates = find_duplicate_media(
+                        src, [info for info in infos if info.filename not in self.dropped])
+                self.renamed.update(duplicates)
+                self.dropped.update(duplicates)
+
+            if self.options.thumbnail != 'keep':
+                thumbnails = find_thumbnails(src)
+                if self.options.thumbnail == 'remove':
+                    self.removed.update(thumbnails)
+                    self.dropped.update(thumbnails)
+                else:
+                    self.thumbnails = thumbnails
+            # 移除的部件在压缩包中占用的空间，包括文件头和中央目录项
+            self.removed_bytes = sum(info.compress_size + ZIP_ENTRY_OVERHEAD +
+                                     2 * len(info.filename.encode('utf-8'))
+                                     for info in infos if info.filename in self.removed)
+
+            if self.options.dpi:
+                with self.timed('layout'):
+                    self.display_sizes = measure_display_sizes(src, infos, self.options.dpi,
+                                                               self.renamed)
+
+            images = [info for info in infos
+                      if is_image_entry(info) and info.filename not in self.dropped]
+            if self.memory is not None:
+                with self.timed('probe'):
+                    self.plan_images(src, images)
+
+            # 多进程模式下解码、优化和编码都在子进程中并行执行；单进程模式在一个
+            # 线程中编码，与读取和写入同时进行
+            executor = self.executor
+            owns_executor = executor is None
+            if owns_executor:
+                executor = create_process_pool(min(self.workers, len(images)))
+            if executor is None:
+                executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+                owns_executor = True
+            try:
+                # 输出先写入临时文件，全部成功后才替换 output_path
+                with contextlib.ExitStack() as stack:
+                    self.task_token = stack.enter_context(self.executor_token(executor))
+                    self.temp_path = stack.enter_context(atomic_output(self.output_path))
+                    if self.options.target_size:
+                        with self.timed('target'):
+                            self.choose_target_quality(src, infos, images, executor)
+
+                    # 读取、压缩图片和写入新文档同时进行
+                    with self.process_images(images, executor) as processed:
+                        self.repackage(src, processed)
+
+                    # 输出会被采用时才校验；批量压缩时在共享的进程池中与其他文档并行
+                    kept_original = file_size(self.temp_path) > file_size(self.input_path)
+                    if self.verify and not kept_original:
+                        with self.timed('verify'):
+                            self.check_output(executor, src, infos)
+                    # 输出反而更大时整个文档保留原文件
+                    if kept_original:
+                        logging.info(f"压缩后文件更大，保留原始文档: {self.input_path}")
+                        with self.timed('copy'):
+                            copy_file(self.input_path, self.temp_path)
+            finally:
+                if owns_executor:
+                    # 取消时不等工作进程，正在执行的任务会在下一个检查点停止
+                    executor.shutdown(wait=not self.canceled, cancel_futures=True)
+
+        # 验证输出
+        if not os.path.exists(self.output_path):
+            raise RuntimeError("创建输出文件失败")
+
+        result = CompressionResult(self.input_path, self.output_path,
+                                   os.path.getsize(self.input_path),
+                                   os.path.getsize(self.output_path))
+        if kept_original:
+            result.kept_original = True
+        else:
+            result.verified = self.verified
+            result.images_kept = self.images_kept
+            result.images_skipped = len(self.skipped)
+            result.duplicates = len(self.dropped - self.removed)
+            result.removed_parts = sorted(self.removed)
+            result.removed_bytes = self.removed_bytes
+            result.images_converted = len(self.converted)
+        result.cache_hits = self.cache_hits
+        result.cache_misses = self.cache_misses
+        if self.options.target_size:
+            result.target_size = self.options.target_size
+            result.chosen_quality = self.options.quality
+        return result
+
+    def check_output(self, executor, src, infos):
+        """校验临时输出文件，有问题时抛出 RuntimeError，输出不会被采用"""
+        source_parts = {info.filename.lower(): (info.CRC, info.compress_size) for info in infos}
+        dangling = find_dangling_parts(src, infos)
+        problems = self.token.wait(executor.submit(run_task, self.task_token, verify_document,
+                                                   self.temp_path, source_parts, dangling))
+        if not problems:
+            self.verified = True
+            return
+        for problem in problems:
+            logging.warning(f"输出文档校验失败: {self.output_path} - {problem}")
+        more = f"（共 {len(problems)} 个问题）" if len(problems) > 1 else ""
+        raise RuntimeError(f"输出文档校验失败: {problems[0]}{more}")
+
+    def choose_target_quality(self, src, infos, images, executor):
+        """按目标大小为文档中的 JPEG 选择统一的编码质量
+
+        其余图片先压缩一遍，按压缩后的大小计入，结果留给之后的写入复用；
+        其他条目按原始压缩大小计入，剩余空间分给 JPEG。每张 JPEG 的采样块
+        试编码得到质量-大小曲线，再二分查找不超过预算的最高质量，
+        上限为用户设置的质量。
+        """
+        jpegs = [info for info in images if IMAGE_FORMATS[image_ext(info)] == 'JPEG'
+                 and info.filename not in self.skipped]
+        if not jpegs:
+            return
+        jpeg_names = {info.filename for info in jpegs}
+
+        self.report(0, "正在估算目标大小下的图片质量")
+        # PNG、BMP 等图片的输出与 JPEG 质量无关（--min-ssim 时按质量上限估计，只会偏大）
+        sizes = {}
+        pending = collections.deque()
+        window = max(1, self.workers) * 2
+        for info in images:
+            if info.filename in jpeg_names or info.filename in self.skipped:
+                continue
+            key, future = self.submit_image(executor, src, info)
+            self.prepared[info.filename] = key, future
+            pending.append((info, future))
+            if len(pending) >= window:
+                done, future = pending.popleft()
+                sizes[done.filename] = self.encoded_size(done, future)
+        for info, future in pending:
+            sizes[info.filename] = self.encoded_size(info, future)
+
+        # 中央目录结束记录，以及每个条目的本地文件头和中央目录项
+        budget = self.options.target_size - 22
+        for info in infos:
+            if info.filename in self.dropped:
+                continue
+            budget -= ZIP_ENTRY_OVERHEAD + 2 * len(info.filename.encode('utf-8'))
+            if info.filename not in jpeg_names:
+                budget -= sizes.get(info.filename, info.compress_size)
+
+        curves = []
+        pending = collections.deque()
+        for info in jpegs:
+            check_canceled()
+            pending.append(self.submit_task(executor, self.image_costs.get(info.filename, 0),
+                                            jpeg_rate_curve, read_entry(src, info, self.source),
+                                            self.display_sizes.get(info.filename)))
+            if len(pending) >= window:
+                curves.append(self.token.wait(pending.popleft()))
+        curves.extend(self.token.wait(future) for future in pending)
+
+        quality = choose_quality(curves, budget, self.options.quality)
+        if self.options.min_ssim is not None:
+            # 选择格式时输出随质量变化，预先压缩的结果只用于估算，写入时按选出的质量重新压缩
+            self.prepared.clear()
+        # 之后的编码（和缓存键）都使用选出的质量
+        self.options = copy.copy(self.options)
+        self.options.quality = quality
+        logging.info(f"目标大小 {self.options.target_size} 字节，"
+                     f"JPEG 预算 {budget} 字节，选用质量 {quality}: {self.input_path}")
+
+    def encoded_size(self, info, future):
+        """等待预先压缩的图片，估算它在输出中的大小；失败或没有变小时按原条目计算"""
+        try:
+            data, _ = self.token.wait(future)
+        except CompressionCanceled:
+            raise
+        except Exception:
+            return info.compress_size
+        return min(len(data), info.compress_size)
+
+    def plan_images(self, src, images):
+        """按内存上限估算每张图片的解码内存，超出上限的图片缩小或跳过
+
+        只读取图片头，不解码。JPEG 可以用 draft 模式按比例解码，未压缩的 BMP
+        可以按条带缩小，这两种图片超出上限时缩小到上限以内；其他格式必须完整
+        解码，超出上限时保留原图。
+        """
+        limit = self.options.memory_limit
+        for info in images:
+            name = info.filename
+            header, _ = read_header_data(src, info)
+            if header is None:
+                # 无法解析图片头时独占整个预算
+                self.image_costs[name] = limit
+                continue
+
+            max_size = self.display_sizes.get(name)
+            palette = self.options.png_palette is not None
+            candidates = self.options.min_ssim is not None
+            cost = image_memory(header, info.file_size, max_size, palette, candidates)
+            if cost > limit and self.options.oversize == 'downscale' and (
+                    header.format == 'JPEG' or header.layout is not None):
+                scale = 1.0
+                if max_size:
+                    scale = min(1.0, max(max_size[0] / header.width, max_size[1] / header.height))
+                while cost > limit and min(header.width, header.height) * scale >= 32:
+                    scale *= OVERSIZE_STEP
+                    max_size = (max(1, int(header.width * scale)), max(1, int(header.height * scale)))
+                    cost = image_memory(header, info.file_size, max_size, palette, candidates)
+                if cost <= limit:
+                    logging.info(f"图片超出内存上限，缩小到 {max_size[0]}x{max_size[1]}: {name}")
+                    self.display_sizes[name] = max_size
+
+            if cost > limit:
+                logging.warning(f"图片超出内存上限，保留原图: {name} "
+                                f"({header.width}x{header.height}，估算 {cost // 1024 ** 2}MB)")
+                self.skipped.add(name)
+                continue
+            self.image_costs[name] = cost
+            if streams_strips(header, self.display_sizes.get(name)):
+                self.streamed.add(name)
+
+    @contextlib.contextmanager
+    def executor_token(self, executor):
+        """给出提交到 executor 的任务检查的取消标志
+
+        进程池中为共享内存中的标志，线程池中直接使用 self.token；无法传给工作进程时
+        为 None，已开始的任务会执行完。
+        """
+        if isinstance(executor, CompressionPool):
+            with executor.cancel_flag(self.token) as flag:
+                yield flag
+        elif isinstance(executor, concurrent.futures.ThreadPoolExecutor):
+            yield self.token
+        else:
+            yield None
+
+    def submit_task(self, executor, cost, func, *args):
+        """在内存预算内提交一个解码任务，预算不足时等待其他任务完成"""
+        if self.memory is not None:
+            self.memory.acquire(cost)
+        if executor is not None:
+            try:
+                future = executor.submit(run_task, self.task_token, func, *args)
+            except BaseException:
+                if self.memory is not None:
+                    self.memory.release(cost)
+                raise
+        else:
+            # 单进程模式直接在当前线程中执行
+            future = concurrent.futures.Future()
+            try:
+                future.set_result(func(*args))
+            except Exception as e:
+                future.set_exception(e)
+        if self.memory is not None:
+            future.add_done_callback(lambda _: self.memory.release(cost))
+        return future
+
+    @contextlib.contextmanager
+    def process_images(self, images, executor):
+        """在后台线程中读取并提交文档中的图片，给出按文档顺序产出 (条目, 新数据) 的迭代器"""
+        total = len(images)
+        self.images_done = 0
+
+        def submit(src):
+            for info in images:
+                yield (info, *self.submit_image(executor, src, info))
+
+        # 限制在途图片数量，避免整个文档的图片同时读入内存
+        with self.read_ahead(submit, min(self.workers, total) * 2) as items:
+            yield (self.collect_image(total, *item) for item in items)
+
+    @contextlib.contextmanager
+    def read_ahead(self, produce, window):
+        """在后台线程中运行生成器 produce(src)，给出按顺序产出它的结果的迭代器
+
+        produce 从单独打开的输入文档读取条目，与写入新文档同时进行；两者之间是
+        容量为 window 的队列，队列满时读取线程等待。produce 抛出的异常在取到
+        对应位置时重新抛出，退出时读取线程随之停止。取消时正在等待的迭代器立即
+        抛出 CompressionCanceled。
+        """
+        items = queue.Queue(maxsize=max(1, window))
+        stop = threading.Event()
+
+        def wake():
+            # 队列已满时取的一方没有在等待，下一项的处理会检查取消
+            try:
+                items.put_nowait(('error', CompressionCanceled()))
+            except queue.Full:
+                pass
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    items.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def run():
+            try:
+                with cancel_scope(self.token), zipfile.ZipFile(self.input_path) as src:
+                    for value in produce(src):
+                        if not put(('item', value)):
+                            return
+            except BaseException as e:
+                put(('error', e))
+            else:
+                put(('done', None))
+
+        def results():
+            while True:
+                with self.timed('wait'):
+                    kind, value = items.get()
+                if kind == 'done':
+                    return
+                if kind == 'error':
+                    raise value
+                yield value
+
+        reader = threading.Thread(target=run, name='docoptimizer-reader', daemon=True)
+        reader.start()
+        self.token.on_cancel(wake)
+        try:
+            yield results()
+        finally:
+            stop.set()
+            reader.join()
+
+    def submit_image(self, executor, src, info):
+        """读取图片并提交压缩任务，返回 (缓存键, future)，不处理的图片 future 为 None
+
+        future 的结果为 (新数据, 各阶段耗时)，命中缓存时耗时为 None。
+        """
+        check_canceled()
+        # 超出内存上限的图片不处理
+        if info.filename in self.skipped:
+            return None, None
+        # 估算目标大小时已经压缩过的图片直接复用结果
+        if info.filename in self.prepared:
+            return self.prepared.pop(info.filename)
+
+        future = concurrent.futures.Future()
+        try:
+            settings = self.image_settings(info)
+            cost = self.image_costs.get(info.filename, 0)
+            if info.filename in self.streamed:
+                # 工作进程直接从压缩包中按条带读取，不经过缓存
+                return None, self.submit_task(executor, cost, recompress_bmp_strips,
+                                              self.input_path, info.filename, *settings)
+
+            start = time.perf_counter()
+            data = read_entry(src, info, self.source)
+            self.read_times[info.filename] = elapsed = time.perf_counter() - start
+            self.add_stage('read', elapsed)
+            # 命中缓存时直接复用压缩结果，不需要解码
+            key = None
+            if self.cache is not None:
+                key = self.cache.make_key(data, settings)
+                cached = self.cache.get(key)
+                if cached is not None:
+                    self.cache_hits += 1
+                    future.set_result((cached, None))
+                    return None, future
+                self.cache_misses += 1
+
+            return key, self.submit_task(executor, cost, recompress_image_timed, data, *settings)
+        except CompressionCanceled:
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            return None, future
+
+    def image_settings(self, info):
+        return self.options.image_settings(image_ext(info), self.display_sizes.get(info.filename))
+
+    def collect_image(self, total, info, key, future):
+        """等待单张图片压缩完成、写入缓存并汇报进度"""
+        if future is None:
+            self.emit_image(info, 'skipped')
+            return info, None
+
+        img_file = posixpath.basename(info.filename)
+        try:
+            with self.timed('wait'):
+                data, timings = self.token.wait(future)
+        except CompressionCanceled:
+            raise
+        except Exception as e:
+            logging.warning(f"图片处理失败: {img_file} - {str(e)}")
+            self.emit_image(info, 'failed', error=str(e))
+            return info, None
+
+        if key is not None:
+            try:
+                self.cache.put(key, data)
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"写入图片缓存失败: {img_file} - {str(e)}")
+
+        self.images_done += 1
+        progress = int(self.images_done / total * 100)
+        self.report(progress, f"正在处理图片: {img_file}")
+        # 子进程中的耗时是各进程累计的 CPU 时间，可能超过文档的总耗时
+        for stage, seconds in (timings or {}).items():
+            self.add_stage(stage, seconds)
+
+        # 选择格式时结果可能是另一种格式，按数据判断，改用对应的扩展名
+        name = info.filename
+        header = read_image_header(data) if self.options.min_ssim is not None else None
+        if header is not None and header.format != IMAGE_FORMATS[image_ext(info)]:
+            name = posixpath.splitext(name)[0] + FORMAT_EXTENSIONS[header.format]
+
+        # 重新编码没有变小时保留原图；直接存储的格式与原条目的压缩后大小比较
+        compress_type, _ = entry_storage(name)
+        original = info.compress_size if compress_type == zipfile.ZIP_STORED else info.file_size
+        if len(data) >= original:
+            self.images_kept += 1
+            self.emit_image(info, 'kept', timings, encoded_bytes=len(data))
+            return info, None
+        if name != info.filename:
+            self.convert_part(info.filename, name)
+        self.emit_image(info, 'encoded' if timings is not None else 'cached', timings,
+                        encoded_bytes=len(data))
+        return info, data
+
+    def convert_part(self, name, new_name):
+        """记录改变了格式的图片部件，新部件名与已有部件重名（不区分大小写）时加序号"""
+        stem, ext = posixpath.splitext(new_name)
+        number = 1
+        while new_name.lower() in self.part_names:
+            new_name = f"{stem}_{number}{ext}"
+            number += 1
+        self.part_names.add(new_name.lower())
+        self.converted[name] = new_name
+        # 指向该部件的重复副本也要改指向新部件
+        for duplicate, target in self.renamed.items():
+            if target == name:
+                self.renamed[duplicate] = new_name
+        self.renamed[name] = new_name
+
+    def emit_image(self, info, outcome, timings=None, encoded_bytes=None, error=None):
+        """发出单张图片的指标事件
+
+        outcome 为 encoded、cached、kept、skipped 或 failed；保留原图时输出字节数
+        为原条目的大小，encoded_bytes 记录被放弃的编码结果大小；output_codec 为写入的格式。
+        """
+        read_time = self.read_times.pop(info.filename, None)
+        if self.metrics is None:
+            return
+        ext, quality, max_size, *_ = self.image_settings(info)
+        output_ext = posixpath.splitext(self.converted.get(info.filename, info.filename))[1]
+        stages = {'read': read_time} if read_time is not None else {}
+        stages.update(timings or {})
+        replaced = outcome in ('encoded', 'cached')
+        self.metrics.emit(
+            'image', document=self.input_path, name=info.filename,
+            codec=IMAGE_FORMATS[ext], output_codec=IMAGE_FORMATS[output_ext.lower()],
+            quality=quality if IMAGE_FORMATS[ext] == 'JPEG' else None,
+            max_size=list(max_size) if max_size else None, outcome=outcome,
+            bytes_in=info.file_size,
+            bytes_out=encoded_bytes if replaced else info.file_size,
+            encoded_bytes=encoded_bytes,
+            stages={stage: round(seconds, 6) for stage, seconds in stages.items()},
+            error=error)
+
+    def emit_document(self, seconds, result=None, error=None):
+        """发出整个文档的指标事件，stages 为各阶段累计耗时"""
+        if self.metrics is None:
+            return
+        self.metrics.emit(
+            'document', document=self.input_path, output=self.output_path,
+            bytes_in=file_size(self.input_path),
+            bytes_out=result.comp_size if result is not None else 0,
+            images=self.images_done, images_kept=self.images_kept,
+            duplicates=len(self.dropped - self.removed), removed=len(self.removed),
+            removed_bytes=self.removed_bytes, cache_hits=self.cache_hits,
+            quality=self.options.quality,
+            kept_original=result.kept_original if result is not None else False,
+            seconds=round(seconds, 6),
+            stages={stage: round(value, 6) for stage, value in self.stages.items()},
+            error=error)
+
+    def add_stage(self, stage, seconds):
+        """累计阶段耗时，读取线程和写入线程都会调用"""
+        with self.stages_lock:
+            self.stages[stage] += seconds
+
+    @contextlib.contextmanager
+    def timed(self, stage):
+        """把代码块的耗时累计到指定阶段"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, time.perf_counter() - start)
+
+    def write_part(self, zipf, name, date_time, data):
+        """按存储策略写入新条目，耗时按压缩方式计入 deflate 或 write 阶段"""
+        compress_type, _ = entry_storage(name)
+        with self.timed('deflate' if compress_type == zipfile.ZIP_DEFLATED else 'write'):
+            write_entry(zipf, name, date_time, data)
+
+    def repackage(self, src, images):
+        """把源文档逐个条目流式写入临时输出文件"""
+        # 图片写入重新编码后的数据，关系文件按需改写，设置了 xml_level 时 XML 部件在
+        # 线程中并行重新压缩，其余条目原样拷贝。选择格式时图片部件可能改名，关系文件
+        # 和内容类型要等所有图片处理完后再写入
+        images = iter(images)
+        deferred = []
+        with contextlib.ExitStack() as stack:
+            zipf = stack.enter_context(zipfile.ZipFile(self.temp_path, 'w', zipfile.ZIP_DEFLATED))
+            parts = stack.enter_context(self.deflate_parts(src.infolist()))
+            for info in src.infolist():
+                check_canceled()
+                if info.filename in self.dropped:
+                    continue
+                if is_image_entry(info):
+                    image_info, data = next(images)
+                    if data is not None:
+                        name = self.converted.get(image_info.filename, image_info.filename)
+                        self.write_part(zipf, name, image_info.date_time, data)
+                        continue
+                elif self.options.xml_level is not None and is_xml_part(info):
+                    self.write_deflated(src, zipf, *next(parts))
+                    continue
+                elif self.options.min_ssim is not None and (
+                        info.filename.endswith(RELS_SUFFIX) or info.filename == CONTENT_TYPES_NAME):
+                    deferred.append(info)
+                    continue
+                elif info.filename in self.thumbnails:
+                    if self.write_thumbnail(src, zipf, info):
+                        continue
+                elif self.rewrite_package_part(src, zipf, info):
+                    continue
+                with self.timed('copy'):
+                    copy_raw_entry(src, zipf, info, self.source)
+            for info in deferred:
+                check_canceled()
+                if not self.rewrite_package_part(src, zipf, info):
+                    with self.timed('copy'):
+                        copy_raw_entry(src, zipf, info, self.source)
+
+    @contextlib.contextmanager
+    def deflate_parts(self, infos):
+        """在 workers 个线程中并行重新压缩 XML 部件，给出按文档顺序产出 (条目, future) 的迭代器
+
+        future 的结果见 deflate_part。部件在后台线程中读取，同时在途的部件数量
+        有限，不会把所有 XML 同时读入内存；超过 STREAM_ENTRY_SIZE 的部件在压缩线程中
+        边解压边压缩。没有设置 xml_level 时不产出任何部件，也不创建线程。
+        """
+        level = self.options.xml_level
+        if level is None:
+            yield iter(())
+            return
+        # 大部件的压缩结果写在输出目录中，不占用系统临时目录
+        spool_dir = os.path.dirname(os.path.abspath(self.output_path))
+
+        def submit(src):
+            for info in infos:
+                check_canceled()
+                if info.filename in self.dropped or not is_xml_part(info):
+                    continue
+                if info.file_size > STREAM_ENTRY_SIZE:
+                    stream = src.open(info)
+                else:
+                    with self.timed('read'):
+                        stream = io.BytesIO(read_entry(src, info, self.source))
+                yield info, threads.submit(run_task, self.token, deflate_part, stream, level,
+                                           spool_dir)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as threads:
+            with self.read_ahead(submit, self.workers * 2) as parts:
+                yield parts
+
+    def write_deflated(self, src, zipf, info, future):
+        """写入重新压缩的 XML 部件，没有比原条目更小时原样拷贝，并发出部件的指标事件"""
+        with self.timed('wait'):
+            data, size, crc, seconds = self.token.wait(future)
+        # 线程中的耗时是各线程累计的时间
+        self.add_stage('xml_deflate', seconds)
+        smaller = size < info.compress_size
+        with data:
+            if smaller:
+                zinfo = clone_zipinfo(info)
+                zinfo.compress_type = zipfile.ZIP_DEFLATED
+                zinfo.CRC = crc
+                zinfo.compress_size = size
+                with self.timed('write'):
+                    write_raw_entry(zipf, zinfo, iter(lambda: data.read(COPY_CHUNK_SIZE), b''))
+            else:
+                with self.timed('copy'):
+                    copy_raw_entry(src, zipf, info, self.source)
+
+        if self.metrics is not None:
+            self.metrics.emit(
+                'part', document=self.input_path, name=info.filename,
+                level=self.options.xml_level, bytes_in=info.file_size,
+                original_bytes=info.compress_size, deflated_bytes=size,
+                bytes_out=size if smaller else info.compress_size,
+                saved_bytes=max(0, info.compress_size - size), seconds=round(seconds, 6))
+
+    def rewrite_package_part(self, src, zipf, info):
+        """改写引用了被移除或改名部件的关系文件和内容类型，未改动时返回 False"""
+        name = info.filename
+        is_rels = name.endswith(RELS_SUFFIX) and bool(self.renamed or self.removed)
+        if not is_rels and not (name == CONTENT_TYPES_NAME and
+                                (self.dropped or self.converted or self.stale_overrides)):
+            return False
+
+        with self.timed('xml'):
+            data = src.read(info)
+            if is_rels:
+                new_data = rewrite_relationships(data, rels_base_dir(name), self.renamed,
+                                                 self.removed)
+            else:
+                new_data = rewrite_content_types(data, self.dropped | self.stale_overrides,
+                                                 self.converted)
+
+        if new_data == data:
+            return False
+        self.write_part(zipf, name, info.date_time, new_data)
+        return True
+
+    def write_thumbnail(self, src, zipf, info):
+        """缩小文档缩略图，无法处理或没有变小时返回 False"""
+        with self.timed('thumbnail'):
+            try:
+                data = shrink_thumbnail(src.read(info), self.options.quality)
+            except (OSError, ValueError) as e:
+                logging.warning(f"无法缩小文档缩略图: {info.filename} - {str(e)}")
+                return False
+        if data is None or len(data) >= info.compress_size:
+            return False
+        self.write_part(zipf, info.filename, info.date_time, data)
+        return True
+
+def compress_document(input_path, output_path, options=None, workers=1, progress=None,
+                      cache=None, metrics=None, verify=True):
+    """压缩单个文档，返回 CompressionResult，失败时抛出异常"""
+    return DocumentCompressor(input_path, output_path, options, workers, progress,
+                              cache=cache, metrics=metrics, verify=verify).compress()
+
+def run_compressor(compressor):
+    """执行压缩并把异常转换为失败结果"""
+    try:
+        return compressor.compress()
+    except CompressionCanceled as e:
+        logging.info(f"文档压缩已取消: {compressor.input_path}")
+        return CompressionResult(compressor.input_path, compressor.output_path, error=str(e))
+    except Exception as e:
+        logging.warning(f"文档压缩失败: {compressor.input_path} - {str(e)}")
+        return CompressionResult(compressor.input_path, compressor.output_path, error=str(e))
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+@contextlib.contextmanager
+def atomic_output(path):
+    """给出与 path 同目录的临时文件路径，代码块正常结束后用它原子地替换 path
+
+    代码块抛出异常（包括被取消）时删除临时文件，path 保持原样，不会留下写了一半的
+    输出。临时文件名以点开头、以 TEMP_SUFFIX 结尾，不会被当作要压缩的文档。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    while True:
+        temp_path = os.path.join(
+            directory, f".{os.path.basename(path)}.{os.urandom(4).hex()}{TEMP_SUFFIX}")
+        try:
+            # 不用 mkstemp，输出文件的权限与直接创建时相同
+            with open(temp_path, 'xb'):
+                break
+        except FileExistsError:
+            continue
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def copy_file(src_path, dst_path):
+    """按块拷贝文件，每块之间检查取消"""
+    with open(src_path, 'rb') as fsrc, open(dst_path, 'wb') as fdst:
+        for chunk in iter(lambda: fsrc.read(COPY_CHUNK_SIZE), b''):
+            check_canceled()
+            fdst.write(chunk)
+
+def compress_batch(jobs, options=None, workers=1, concurrency=1, on_result=None, cache=None,
+                   metrics=None, manifest=None, verify=True):
+    """并发压缩多个文档，返回与 jobs 顺序一致的 CompressionResult 列表
+
+    jobs 为 (输入路径, 输出路径) 列表；按文件大小从大到小调度，避免少数大文件
+    在最后拖慢整个批次。所有文档共享同一个图片压缩进程池和内存预算。
+    提供 Manifest 时跳过输入和参数都没有变化的文档，并记录新压缩的文档。
+    """
+    options = options or CompressionOptions()
+    settings = options.fingerprint()
+    results = [None] * len(jobs)
+    pending = []
+    for i, (input_path, output_path) in enumerate(jobs):
+        if manifest is not None and manifest.is_current(input_path, output_path, settings):
+            result = CompressionResult(input_path, output_path, file_size(input_path),
+                                       file_size(output_path))
+            result.unchanged = True
+            results[i] = result
+            if on_result is not None:
+                on_result(result)
+        else:
+            pending.append(i)
+    if not pending:
+        return results
+
+    def run(compressor):
+        result = run_compressor(compressor)
+        if manifest is not None and result.success:
+            try:
+                manifest.record(result.input_path, result.output_path, settings)
+            except (OSError, sqlite3.Error) as e:
+                logging.warning(f"写入清单失败: {result.input_path} - {str(e)}")
+        return result
+
+    executor = create_process_pool(workers)
+    memory = None
+    if options.memory_limit:
+        memory = MemoryBudget(options.memory_limit)
+    compressors = {i: DocumentCompressor(jobs[i][0], jobs[i][1], options, workers,
+                                         executor=executor, cache=cache, metrics=metrics,
+                                         memory=memory, verify=verify)
+                   for i in pending}
+    order = sorted(pending, key=lambda i: file_size(jobs[i][0]), reverse=True)
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as threads:
+            futures = {threads.submit(run, compressors[i]): i for i in order}
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    result = future.result()
+                    results[futures[future]] = result
+                    if on_result is not None:
+                        on_result(result)
+            except BaseException:
+                # 中断时取消尚未开始和正在运行的文档，它们不会留下输出
+                for compressor in compressors.values():
+                    compressor.cancel()
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    return results
+
+# 命令行
+def name_matches(name, include=('*.docx',), exclude=()):
+    """文件名符合任一包含模式且不符合任何排除模式时返回 True"""
+    return (any(fnmatch.fnmatch(name, pattern) for pattern in include) and
+            not any(fnmatch.fnmatch(name, pattern) for pattern in exclude))
+
+def find_documents(paths, recursive=False, include=('*.docx',), exclude=()):
+    """展开命令行中的文件和目录，返回 (文件路径, 所在根目录) 列表"""
+    documents = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                if not recursive:
+                    dirs[:] = []
+                for name in sorted(files):
+                    if name_matches(name, include, exclude):
+                        documents.append((os.path.join(root, name), path))
+        elif os.path.isfile(path):
+            # 直接指定的文件只按排除规则过滤
+            if not any(fnmatch.fnmatch(os.path.basename(path), p) for p in exclude):
+                documents.append((path, os.path.dirname(path)))
+        else:
+            logging.warning(f"输入路径不存在: {path}")
+    return documents
+
+def build_output_path(input_path, root, output_dir, template):
+    """按输出模板生成输出路径
+
+    模板可使用 {name}（文件名）、{stem}（不含扩展名的文件名）和 {ext}（扩展名）。
+    指定输出目录时保留输入文件相对于根目录的子目录结构，否则输出到输入文件所在目录。
+    """
+    name = os.path.basename(input_path)
+    stem, ext = os.path.splitext(name)
+    filename = template.format(name=name, stem=stem, ext=ext)
+    if output_dir is None:
+        return os.path.join(os.path.dirname(input_path), filename)
+    relative_dir = os.path.relpath(os.path.dirname(input_path) or '.', root or '.')
+    return os.path.normpath(os.path.join(output_dir, relative_dir, filename))
+
+def quality_value(text):
+    """解析命令行中的图片质量参数"""
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的图片质量: {text}")
+    if not 1 <= value <= 100:
+        raise argparse.ArgumentTypeError("图片质量必须在 1-100 之间")
+    return value
+
+def deflate_level(text):
+    """解析 XML 部件的 deflate 级别参数：1-9 或 max"""
+    if text == 'max':
+        return text
+    try:
+        value = int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的压缩级别: {text}")
+    if not 1 <= value <= 9:
+        raise argparse.ArgumentTypeError("压缩级别必须在 1-9 之间或为 max")
+    return value
+
+def ssim_value(text):
+    """解析 SSIM 下限参数；计算 SSIM 需要 NumPy"""
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"无效的 SSIM: {text}")
+    if not 0 < value <= 1:
+        raise argparse.ArgumentTypeError("SSIM 必须在 0-1 之间")
+    if numpy is None:
+        raise argparse.ArgumentTypeError("选择图片格式需要安装 NumPy")
+    return value
+
+def size_value(text):
+    """解析命令行中的大小参数，支持 KB、MB、GB 后缀"""
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*', text, re.I)
+    if not match:
+        raise argparse.ArgumentTypeError(f"无效的大小: {text}")
+    unit = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}[match.group(2).upper()]
+    return int(float(match.group(1)) * unit)
+
+def options_from_args(args):
+    """按命令行参数生成 CompressionOptions，各运行模式共用"""
+    return CompressionOptions(quality=args.quality, dedup=args.dedup, dpi=args.dpi,
+                              target_size=args.target_size,
+                              memory_limit=args.memory_limit, oversize=args.oversize,
+                              png_palette=args.png_palette, min_ssim=args.min_ssim,
+                              metadata=args.metadata, thumbnail=args.thumbnail,
+                              prune_orphans=args.prune_orphans, xml_level=args.xml_level)
+
+def create_metrics(log_path=None, prometheus_path=None, port=None):
+    """按需创建指标输出，都未指定时返回 None"""
+    sinks = []
+    if log_path:
+        sinks.append(JsonLinesLog(log_path))
+    if prometheus_path or port is not None:
+        prometheus = PrometheusMetrics(prometheus_path)
+        if port is not None:
+            prometheus.serve(port)
+        sinks.append(prometheus)
+    return Metrics(*sinks) if sinks else None
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='DocOptimizer',
+        description="Word文档压缩工具：压缩 .docx 文档中的图片。不带参数运行时启动图形界面。")
+    parser.add_argument('inputs', nargs='*', help="要压缩的文档或目录")
+    parser.add_argument('-o', '--output-dir', help="输出目录（默认输出到原文件所在目录）")
+    parser.add_argument('-t', '--template', default='compressed_{name}',
+                        help="输出文件名模板，可用 {name} {stem} {ext}（默认: compressed_{name}）")
+    parser.add_argument('-r', '--recursive', action='store_true', help="递归处理子目录")
+    parser.add_argument('--include', action='append', metavar='GLOB',
+                        help="目录中要处理的文件名模式，可多次指定（默认: *.docx）")
+    parser.add_argument('--exclude', action='append', metavar='GLOB', default=[],
+                        help="要跳过的文件名模式，可多次指定")
+    parser.add_argument('-q', '--quality', type=quality_value, default=75,
+                        metavar='1-100', help="JPEG 图片质量（默认: 75）")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="图片压缩进程数（默认: CPU 核数）")
+    parser.add_argument('-j', '--jobs', type=int, default=2, help="同时压缩的文档数（默认: 2）")
+    parser.add_argument('--cache', nargs='?', const=default_cache_dir(), metavar='DIR',
+                        help=f"缓存图片压缩结果，可指定缓存目录（默认: {default_cache_dir()}）")
+    parser.add_argument('--cache-size', type=int, default=DEFAULT_CACHE_SIZE // 1024 ** 2,
+                        metavar='MB', help="图片缓存大小上限（默认: %(default)sMB）")
+    parser.add_argument('--dpi', type=int, metavar='DPI',
+                        help="按图片在文档中的最大显示尺寸缩小到该分辨率，例如 150 或 220")
+    parser.add_argument('--target-size', type=size_value, metavar='SIZE',
+                        help="目标文档大小，例如 10MB，自动选择不超过 -q 的 JPEG 质量")
+    parser.add_argument('--memory-limit', type=size_value, metavar='SIZE',
+                        help="同时解码的图片估算内存上限，例如 2GB；所有进程共用")
+    parser.add_argument('--oversize', choices=('downscale', 'skip'), default='downscale',
+                        help="单张图片超出内存上限时缩小还是保留原图（默认: downscale）")
+    parser.add_argument('--png-palette', type=float, nargs='?', const=DEFAULT_PALETTE_PSNR,
+                        metavar='PSNR',
+                        help="把真彩色 PNG（如屏幕截图）量化为 256 色调色板，颜色不超过 256 种时无损，"
+                             f"否则要求峰值信噪比不低于 PSNR dB（默认: {DEFAULT_PALETTE_PSNR:g}）")
+    parser.add_argument('--min-ssim', type=ssim_value, nargs='?', const=DEFAULT_MIN_SSIM,
+                        metavar='SSIM',
+                        help="每张图片试编码多种 JPEG 质量和色度抽样、PNG 和调色板 PNG，选用与原图的 SSIM "
+                             f"不低于该值的最小结果，可能改变图片格式（默认: {DEFAULT_MIN_SSIM:g}，需要 NumPy）")
+    parser.add_argument('--metadata', choices=('strip', 'keep'), default='strip',
+                        help="图片元数据：strip 把 EXIF 方向应用到像素、按 ICC 转换到 sRGB，"
+                             "并去掉 EXIF、XMP 和 ICC；keep 原样保留（默认: strip）")
+    parser.add_argument('--thumbnail', choices=('keep', 'shrink', 'remove'), default='keep',
+                        help=f"文档缩略图：保留、缩小到 {THUMBNAIL_SIZE} 像素以内，或删除（默认: keep）")
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help="不合并文档中内容相同的图片")
+    parser.add_argument('--xml-level', type=deflate_level, metavar='1-9|max',
+                        help="在多个线程中并行以该 deflate 级别重新压缩 XML 部件，只采用更小的结果；"
+                             "max 比较多种压缩策略，最慢但最小（默认: 原样拷贝）")
+    parser.add_argument('--keep-orphans', dest='prune_orphans', action='store_false',
+                        help="保留没有任何关系指向的部件（默认按关系图移除）")
+    parser.add_argument('--no-verify', dest='verify', action='store_false',
+                        help="不校验输出文档（默认检查 CRC、XML、关系目标、内容类型和图片头）")
+    parser.add_argument('--incremental', action='store_true',
+                        help=f"跳过输入和参数都没有变化的文档，清单保存在输出目录的 {MANIFEST_NAME} 中")
+    parser.add_argument('--manifest', metavar='FILE', help="增量压缩清单的路径，指定时即启用增量压缩")
+    parser.add_argument('--watch', action='store_true',
+                        help="持续监视输入目录，把写入完成的文档放入持久化队列并压缩到 -o 指定的目录")
+    parser.add_argument('--queue', metavar='FILE',
+                        help="监视模式的任务队列路径（默认: 输出目录中的 .docoptimizer-queue.sqlite）")
+    parser.add_argument('--queue-status', action='store_true',
+                        help="显示任务队列中各状态的任务数和最近的处理延迟后退出")
+    parser.add_argument('--settle', type=float, default=5.0, metavar='SECONDS',
+                        help="文件大小和修改时间保持不变多久后视为写入完成（默认: %(default)s 秒）")
+    parser.add_argument('--poll-interval', type=float, default=5.0, metavar='SECONDS',
+                        help="定期扫描监视目录的间隔（默认: %(default)s 秒）")
+    parser.add_argument('--poll', action='store_true',
+                        help="不使用 inotify，只定期扫描；适用于其他机器写入的网络共享")
+    parser.add_argument('--serve', metavar='[HOST:]PORT',
+                        help="运行本地 HTTP 压缩服务，默认只监听 127.0.0.1")
+    parser.add_argument('--max-pending', type=int, metavar='N',
+                        help="压缩服务同时接收、排队和压缩的文档数上限，超出时返回 429（默认: -j 的两倍）")
+    parser.add_argument('--max-upload', type=size_value, default=1024 ** 3, metavar='SIZE',
+                        help="压缩服务单个上传文档的大小上限（默认: 1GB）")
+    parser.add_argument('--spool-dir', metavar='DIR', help="压缩服务保存上传和结果的临时目录")
+    parser.add_argument('--analyze', action='store_true',
+                        help="不压缩，只读取中央目录、图片头和正文 XML，估计每个文档可节省的空间并排序")
+    parser.add_argument('--format', choices=('csv', 'json'),
+                        help="分析报告格式（默认: 按 --report 的扩展名，否则为 csv）")
+    parser.add_argument('--report', metavar='FILE', help="分析报告的输出文件（默认: 标准输出）")
+    parser.add_argument('--top', type=int, metavar='N', help="分析报告只列出预计节省最多的 N 个文档")
+    parser.add_argument('--log', default=DEFAULT_LOG_FILE, metavar='FILE',
+                        help="文本日志文件，- 表示输出到标准错误（默认: %(default)s）")
+    parser.add_argument('--metrics-log', metavar='FILE',
+                        help="把每张图片和每个文档的阶段耗时、字节数等事件以 JSON Lines 追加写入文件")
+    parser.add_argument('--metrics-file', metavar='FILE',
+                        help="每个文档完成后把汇总指标以 Prometheus 文本格式写入文件")
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help="在 127.0.0.1:PORT/metrics 提供 Prometheus 指标")
+    parser.add_argument('--gui', action='store_true', help="启动图形界面")
+    parser.add_argument('--version', action='version', version=f"%(prog)s {VERSION}")
+    return parser
+
+def main(argv=None):
+    """命令行入口，返回进程退出码
+
+    0 表示全部成功，1 表示有文档压缩失败，2 表示参数错误或没有找到文档，
+    130 表示被用户中断。
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        argv = ['--gui']
+    args = build_parser().parse_args(argv)
+    setup_logging(None if args.log == '-' else args.log)
+
+    try:
+        metrics = create_metrics(args.metrics_log, args.metrics_file, args.metrics_port)
+    except OSError as e:
+        print(f"无法创建指标输出: {str(e)}", file=sys.stderr)
+        return 2
+    try:
+        if args.gui:
+            # 只有图形界面才需要加载 PyQt5
+            from DocOptimizerGUI import run_gui
+            return run_gui(metrics=metrics)
+        if args.analyze:
+            from DocOptimizerAnalyzer import run_analyze
+            return run_analyze(args)
+        if args.serve:
+            from DocOptimizerService import run_service
+            return run_service(args, metrics)
+        if args.watch or args.queue_status:
+            from DocOptimizerDaemon import run_daemon
+            return run_daemon(args, metrics)
+        return run_batch(args, metrics)
+    finally:
+        if metrics is not None:
+            metrics.close()
+
+def run_batch(args, metrics=None):
+    """按命令行参数批量压缩文档，返回进程退出码"""
+    # 自动跳过 Word 的临时锁文件
+    exclude = ['~$*'] + args.exclude
+    documents = find_documents(args.inputs, args.recursive, args.include or ['*.docx'], exclude)
+    if not documents:
+        print("没有找到要压缩的文档", file=sys.stderr)
+        return 2
+
+    jobs = [(path, build_output_path(path, root, args.output_dir, args.template))
+            for path, root in documents]
+    finished = 0
+
+    def on_result(result):
+        nonlocal finished
+        finished += 1
+        if result.unchanged:
+            return
+        if result.success:
+            print(f"[{finished}/{len(jobs)}] 成功 {result.input_path} -> {result.output_path} "
+                  f"({result.orig_size/1024:.2f}KB -> {result.comp_size/1024:.2f}KB, "
+                  f"缩小了 {result.ratio:.1f}%)")
+            if result.target_size:
+                print(f"    目标 {result.target_size/1024:.2f}KB，选用JPEG质量 {result.chosen_quality}"
+                      + ("，未能达到目标大小" if result.comp_size > result.target_size else ""))
+            if result.kept_original:
+                print("    压缩后文件更大，已保留原始文档")
+            elif result.removed_parts:
+                print(f"    移除未引用的部件 {len(result.removed_parts)} 个，"
+                      f"节省 {result.removed_bytes/1024:.2f}KB: " + ', '.join(result.removed_parts))
+        else:
+            print(f"[{finished}/{len(jobs)}] 失败 {result.input_path}: {result.error}",
+                  file=sys.stderr)
+
+    cache = None
+    if args.cache:
+        cache = ImageCache(args.cache, args.cache_size * 1024 ** 2)
+    manifest = None
+    if args.incremental or args.manifest:
+        manifest = Manifest(args.manifest or
+                            os.path.join(args.output_dir or '.', MANIFEST_NAME))
+    options = options_from_args(args)
+
+    try:
+        results = compress_batch(jobs, options, max(1, args.workers),
+                                 max(1, args.jobs), on_result, cache, metrics, manifest,
+                                 args.verify)
+    except KeyboardInterrupt:
+        print("操作已取消", file=sys.stderr)
+        return 130
+    finally:
+        if manifest is not None:
+            manifest.close()
+
+    failed = sum(1 for result in results if not result.success)
+    unchanged = sum(1 for result in results if result.unchanged)
+    print(f"批量压缩完成：成功 {len(results) - failed - unchanged} 个，失败 {failed} 个"
+          + (f"，未变化跳过 {unchanged} 个" if unchanged else ""))
+    if cache is not None:
+        stats = cache.stats()
+        print(f"图片缓存：命中 {stats['hits']} 次，未命中 {stats['misses']} 次，"
+              f"淘汰 {stats['evictions']} 项")
+    return 1 if failed else 0
+
+def __getattr__(name):
+    """按需加载图形界面类，无界面场景下不导入 PyQt5"""
+    if name in GUI_NAMES:
+        import DocOptimizerGUI
+        return getattr(DocOptimizerGUI, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == "__main__":
+    sys.exit(main())
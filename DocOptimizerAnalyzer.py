@@ -0,0 +1,244 @@
+import os
+import sys
+import csv
+import json
+import struct
+import logging
+import zipfile
+import concurrent.futures
+
+from DocOptimizer import (IMAGE_FORMATS, ZIP_ENTRY_OVERHEAD, CompressionOptions,
+                          is_image_entry, image_ext, read_header_data, fit_size,
+                          measure_display_sizes, find_documents, find_orphan_parts,
+                          options_from_args)
+
+# IJG 标准亮度量化表（质量 50），用于从 DQT 推算 JPEG 原来的编码质量
+STD_LUMINANCE_QUANT = (
+    16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56, 14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99)
+# 自然图像在各 IJG 质量下的相对码率，只使用比值；介于两点之间时线性插值
+JPEG_RELATIVE_RATE = (
+    (5, 0.22), (10, 0.30), (20, 0.47), (30, 0.60), (40, 0.70), (50, 0.79), (60, 0.89),
+    (70, 1.04), (75, 1.14), (80, 1.30), (85, 1.52), (90, 1.90), (95, 2.75), (100, 5.5))
+# 缩小后单位像素的细节更多，字节数按像素数的这个幂次变化
+PIXEL_SIZE_EXPONENT = 0.8
+# 质量不变重新编码时 optimize 带来的 Huffman 表优化
+HUFFMAN_GAIN = 0.97
+FIELDS = ('rank', 'path', 'size', 'estimated_size', 'estimated_savings', 'savings_ratio',
+          'images', 'image_bytes', 'jpeg', 'png', 'bmp', 'downscaled', 'duplicates',
+          'orphans', 'exif_bytes', 'icc_bytes', 'error')
+
+def jpeg_quality(table):
+    """按 IJG 的缩放规则从亮度量化表推算编码质量"""
+    scale = sum(table) * 100 / sum(STD_LUMINANCE_QUANT)
+    if scale <= 100:
+        quality = (200 - scale) / 2
+    else:
+        quality = 5000 / scale
+    return max(1, min(100, round(quality)))
+
+def read_metadata(data):
+    """从图片开头的数据统计元数据大小
+
+    返回 {'exif': 字节数, 'icc': 字节数, 'other': 其他元数据字节数, 'quality': JPEG 质量}；
+    只统计图像数据之前的段或块。
+    """
+    metadata = {'exif': 0, 'icc': 0, 'other': 0, 'quality': None}
+    if data[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 4 <= len(data) and data[pos] == 0xFF:
+            marker = data[pos + 1]
+            if marker == 0xFF:
+                pos += 1
+                continue
+            if marker == 0xDA:
+                break
+            length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+            segment = data[pos + 4:pos + 2 + length]
+            if marker == 0xE1 and segment.startswith(b'Exif\0'):
+                metadata['exif'] += length + 2
+            elif marker == 0xE2 and segment.startswith(b'ICC_PROFILE\0'):
+                metadata['icc'] += length + 2
+            elif 0xE1 <= marker <= 0xEF or marker == 0xFE:
+                metadata['other'] += length + 2
+            elif marker == 0xDB:
+                # DQT 段可以包含多张表，第一位的低 4 位为表号、高 4 位为精度
+                table_pos = 0
+                while table_pos < len(segment):
+                    precision, table_id = segment[table_pos] >> 4, segment[table_pos] & 0x0F
+                    size = 128 if precision else 64
+                    values = segment[table_pos + 1:table_pos + 1 + size]
+                    if table_id == 0 and len(values) == size:
+                        table = (struct.unpack('>64H', values) if precision
+                                 else tuple(values))
+                        metadata['quality'] = jpeg_quality(table)
+                    table_pos += 1 + size
+            pos += 2 + length
+    elif data[:8] == b'\x89PNG\r\n\x1a\n':
+        pos = 8
+        while pos + 8 <= len(data):
+            length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+            if kind in (b'IDAT', b'IEND'):
+                break
+            if kind == b'eXIf':
+                metadata['exif'] += length + 12
+            elif kind == b'iCCP':
+                metadata['icc'] += length + 12
+            elif kind in (b'tEXt', b'zTXt', b'iTXt', b'tIME'):
+                metadata['other'] += length + 12
+            pos += length + 12
+    return metadata
+
+def relative_rate(quality):
+    points = JPEG_RELATIVE_RATE
+    if quality <= points[0][0]:
+        return points[0][1]
+    for (q0, r0), (q1, r1) in zip(points, points[1:]):
+        if quality <= q1:
+            return r0 + (r1 - r0) * (quality - q0) / (q1 - q0)
+    return points[-1][1]
+
+def estimate_image(info, header, metadata, quality, size, policy='strip'):
+    """估计图片重新编码后在压缩包中的大小，不会大于原条目
+
+    size 为按显示尺寸缩小后的像素尺寸，不缩小时为 None。JPEG 按原质量和目标质量的
+    相对码率换算，元数据按 metadata 策略全部去掉或原样保留；PNG 和 BMP 只计算缩小
+    带来的变化。
+    """
+    scale = 1.0
+    if size is not None:
+        scale = (size[0] * size[1] / (header.width * header.height)) ** PIXEL_SIZE_EXPONENT
+    if header.format == 'JPEG':
+        payload = info.file_size - metadata['exif'] - metadata['icc'] - metadata['other']
+        source = metadata['quality'] or 100
+        ratio = HUFFMAN_GAIN * min(1.0, relative_rate(quality) / relative_rate(source))
+        estimate = payload * ratio * scale
+        if policy == 'keep':
+            estimate += metadata['exif'] + metadata['icc'] + metadata['other']
+    elif header.format == 'BMP' and size is not None:
+        # 未压缩的 BMP 按像素数线性变化，deflate 的压缩率保持不变
+        estimate = info.compress_size * size[0] * size[1] / (header.width * header.height)
+    else:
+        estimate = info.compress_size * scale
+    return int(min(info.compress_size, estimate))
+
+def analyze_document(path, options=None):
+    """只读取中央目录、图片头和正文 XML，估计文档按 options 压缩能节省的空间
+
+    返回可以直接写入 JSON 的字典，image_details 为每张图片的明细。
+    """
+    options = options or CompressionOptions()
+    record = dict.fromkeys(FIELDS, 0)
+    record.update(path=path, size=os.path.getsize(path), error=None, rank=None)
+    images = []
+    with zipfile.ZipFile(path) as src:
+        infos = src.infolist()
+        display_sizes = measure_display_sizes(src, infos, options.dpi) if options.dpi else {}
+        # 不可达的部件整个移除，不再估计
+        orphans = find_orphan_parts(src, infos)[0] if options.prune_orphans else set()
+        record['orphans'] = len(orphans)
+        savings = sum(info.compress_size + ZIP_ENTRY_OVERHEAD + 2 * len(info.filename.encode('utf-8'))
+                      for info in infos if info.filename in orphans)
+        # 大小和 CRC 都相同的媒体视为重复，不读取内容
+        seen = set()
+        for info in infos:
+            if not is_image_entry(info) or info.filename in orphans:
+                continue
+            header, data = read_header_data(src, info)
+            if header is None:
+                continue
+            key = (info.file_size, info.CRC)
+            duplicate = options.dedup and key in seen
+            seen.add(key)
+            metadata = read_metadata(data)
+            display = display_sizes.get(info.filename)
+            size = fit_size((header.width, header.height), display) if display else None
+            estimate = 0 if duplicate else estimate_image(info, header, metadata, options.quality,
+                                                          size, options.metadata)
+            saved = info.compress_size - estimate
+            if duplicate:
+                saved += ZIP_ENTRY_OVERHEAD + 2 * len(info.filename.encode('utf-8'))
+            savings += saved
+            images.append({
+                'name': info.filename, 'format': header.format,
+                'width': header.width, 'height': header.height,
+                'display_size': list(display) if display else None,
+                'target_size': list(size) if size else None,
+                'bytes': info.compress_size, 'exif_bytes': metadata['exif'],
+                'icc_bytes': metadata['icc'], 'source_quality': metadata['quality'],
+                'duplicate': duplicate, 'estimated_bytes': estimate})
+
+            record['images'] += 1
+            record['image_bytes'] += info.compress_size
+            record[IMAGE_FORMATS[image_ext(info)].lower()] += 1
+            record['downscaled'] += size is not None and not duplicate
+            record['duplicates'] += duplicate
+            record['exif_bytes'] += metadata['exif']
+            record['icc_bytes'] += metadata['icc']
+
+    record['estimated_savings'] = savings
+    record['estimated_size'] = record['size'] - savings
+    record['savings_ratio'] = round(savings / record['size'] * 100, 2) if record['size'] else 0
+    record['image_details'] = images
+    return record
+
+def analyze_documents(paths, options=None, concurrency=4):
+    """并发分析多个文档，返回按预计节省字节数从大到小排列的记录"""
+    def run(path):
+        try:
+            return analyze_document(path, options)
+        except Exception as e:
+            logging.warning(f"文档分析失败: {path} - {str(e)}")
+            record = dict.fromkeys(FIELDS, 0)
+            record.update(path=path, error=str(e), image_details=[])
+            try:
+                record['size'] = record['estimated_size'] = os.path.getsize(path)
+            except OSError:
+                pass
+            return record
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as threads:
+        records = list(threads.map(run, paths))
+    records.sort(key=lambda record: record['estimated_savings'], reverse=True)
+    for rank, record in enumerate(records, 1):
+        record['rank'] = rank
+    return records
+
+def write_report(records, stream, format='csv'):
+    """以 CSV（每个文档一行）或 JSON（包含每张图片的明细）输出分析结果"""
+    if format == 'json':
+        json.dump(records, stream, ensure_ascii=False, indent=2)
+        stream.write('\n')
+        return
+    writer = csv.DictWriter(stream, FIELDS, extrasaction='ignore', lineterminator='\n')
+    writer.writeheader()
+    writer.writerows(records)
+
+def run_analyze(args):
+    """按命令行参数分析文档并输出报告，返回进程退出码"""
+    exclude = ['~$*'] + args.exclude
+    documents = find_documents(args.inputs, args.recursive, args.include or ['*.docx'], exclude)
+    if not documents:
+        print("没有找到要分析的文档", file=sys.stderr)
+        return 2
+    options = options_from_args(args)
+    records = analyze_documents([path for path, root in documents], options, args.jobs)
+    if args.top:
+        records = records[:args.top]
+
+    format = args.format or ('json' if (args.report or '').lower().endswith('.json') else 'csv')
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8', newline='') as f:
+            write_report(records, f, format)
+    else:
+        write_report(records, sys.stdout, format)
+
+    total = sum(record['size'] for record in records)
+    savings = sum(record['estimated_savings'] for record in records)
+    failed = sum(1 for record in records if record['error'])
+    print(f"分析完成：{len(records)} 个文档共 {total/1024**2:.1f}MB，预计可节省 "
+          f"{savings/1024**2:.1f}MB（{savings / total * 100 if total else 0:.1f}%）"
+          + (f"，{failed} 个文档无法分析" if failed else ""), file=sys.stderr)
+    return 1 if failed else 0
@@ -0,0 +1,520 @@
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import struct
+import ctypes
+import ctypes.util
+import sqlite3
+import logging
+import zipfile
+import threading
+
+from DocOptimizer import (CompressionOptions, DocumentCompressor, ImageCache, MemoryBudget,
+                          create_process_pool, run_compressor, build_output_path, name_matches,
+                          options_from_args)
+
+QUEUE_NAME = '.docoptimizer-queue.sqlite'
+# 文件大小和修改时间保持不变多少秒后才认为写入完成
+DEFAULT_SETTLE = 5.0
+DEFAULT_POLL_INTERVAL = 5.0
+# inotify 模式下仍按轮询间隔的倍数做全量扫描，补上网络共享等收不到事件的写入
+RESCAN_FACTOR = 12
+# 稳定后仍不是完整 zip 的文件，再等待这么多倍的 settle 时间后照常入队，由压缩报告失败
+INCOMPLETE_FACTOR = 12
+TICK = 1.0
+REPORT_INTERVAL = 60
+MAX_ATTEMPTS = 3
+LATENCY_WINDOW = 200
+
+class JobQueue:
+    """保存在 SQLite 中的持久化压缩任务队列
+
+    同一输入文件的同一版本（路径、大小、修改时间）只入队一次，重启后重新扫描目录
+    不会重复压缩。进程退出时仍在处理的任务在下次启动时回到等待状态，
+    反复中断的任务标记为失败，避免某个文档让进程反复崩溃。
+    """
+    STATES = ('pending', 'running', 'done', 'failed')
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None,
+                                  check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, input TEXT, output TEXT, '
+            'size INTEGER, mtime INTEGER, state TEXT, attempts INTEGER DEFAULT 0, '
+            'enqueued REAL, started REAL, finished REAL, error TEXT, '
+            'UNIQUE (input, size, mtime))')
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, id)')
+
+    def recover(self):
+        """把上次退出时仍在处理的任务放回队列，返回放回的任务数"""
+        with self.lock:
+            self.db.execute("UPDATE jobs SET state = 'failed', finished = ?, error = ? "
+                            "WHERE state = 'running' AND attempts >= ?",
+                            (time.time(), "处理过程中多次中断", MAX_ATTEMPTS))
+            return self.db.execute("UPDATE jobs SET state = 'pending', started = NULL "
+                                   "WHERE state = 'running'").rowcount
+
+    def put(self, input_path, output_path, size, mtime):
+        """入队一个文件版本，该版本已经入队过时返回 False"""
+        with self.lock:
+            return self.db.execute(
+                'INSERT OR IGNORE INTO jobs (input, output, size, mtime, state, enqueued) '
+                "VALUES (?, ?, ?, ?, 'pending', ?)",
+                (input_path, output_path, size, mtime, time.time())).rowcount > 0
+
+    def claim(self):
+        """取出最早入队的等待任务并标记为处理中，返回 (id, 输入, 输出, 入队时间) 或 None"""
+        with self.lock:
+            while True:
+                row = self.db.execute("SELECT id, input, output, enqueued FROM jobs "
+                                      "WHERE state = 'pending' ORDER BY id LIMIT 1").fetchone()
+                if row is None:
+                    return None
+                # 条件更新，多个进程共用同一个队列时也不会重复领取
+                if self.db.execute("UPDATE jobs SET state = 'running', started = ?, "
+                                   "attempts = attempts + 1 WHERE id = ? AND state = 'pending'",
+                                   (time.time(), row[0])).rowcount:
+                    return row
+
+    def finish(self, job_id, error=None):
+        with self.lock:
+            self.db.execute('UPDATE jobs SET state = ?, finished = ?, error = ? WHERE id = ?',
+                            ('failed' if error else 'done', time.time(), error, job_id))
+
+    def release(self, job_id):
+        """把被取消的任务放回队列，不计入尝试次数"""
+        with self.lock:
+            self.db.execute("UPDATE jobs SET state = 'pending', started = NULL, "
+                            "attempts = attempts - 1 WHERE id = ?", (job_id,))
+
+    def counts(self):
+        """各状态的任务数"""
+        with self.lock:
+            counts = dict.fromkeys(self.STATES, 0)
+            counts.update(self.db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state'))
+        return counts
+
+    def latencies(self, limit=LATENCY_WINDOW):
+        """最近完成的任务从入队到完成的耗时（秒），从小到大排序"""
+        with self.lock:
+            rows = self.db.execute("SELECT finished - enqueued FROM jobs WHERE state = 'done' "
+                                   "ORDER BY finished DESC LIMIT ?", (limit,)).fetchall()
+        return sorted(row[0] for row in rows)
+
+    def prune(self):
+        """删除已被同一文件的新版本取代的已完成任务，记录数不随时间无限增长"""
+        with self.lock:
+            return self.db.execute(
+                "DELETE FROM jobs WHERE state IN ('done', 'failed') AND id < "
+                "(SELECT MAX(id) FROM jobs AS newer WHERE newer.input = jobs.input)").rowcount
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def percentile(values, fraction):
+    """已排序列表的分位数，列表为空时返回 None"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def walk_files(directories, recursive=False, match=None):
+    """列出目录中文件名符合 match 的文件"""
+    for directory in directories:
+        for root, dirs, files in os.walk(directory):
+            if not recursive:
+                dirs[:] = []
+            for name in files:
+                if match is None or match(name):
+                    yield os.path.join(root, name)
+
+class PollingWatcher:
+    """定期扫描目录，报告新出现或大小、修改时间有变化的文件，适用于任何文件系统"""
+
+    def __init__(self, directories, recursive=False, match=None, interval=DEFAULT_POLL_INTERVAL):
+        self.directories = directories
+        self.recursive = recursive
+        self.match = match
+        self.interval = interval
+        self.versions = {}
+        self.next_scan = 0
+
+    def scan(self):
+        """全量扫描一次，返回有变化的文件路径集合"""
+        changed = set()
+        versions = {}
+        for path in walk_files(self.directories, self.recursive, self.match):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            versions[path] = (stat.st_size, stat.st_mtime_ns)
+            if self.versions.get(path) != versions[path]:
+                changed.add(path)
+        self.versions = versions
+        self.next_scan = time.monotonic() + self.interval
+        return changed
+
+    def wait(self, timeout):
+        """最多等待 timeout 秒，返回可能有变化的文件路径集合"""
+        delay = self.next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0, delay))
+        return self.scan()
+
+    def close(self):
+        pass
+
+class InotifyWatcher:
+    """通过 Linux inotify 接收目录中的文件变化
+
+    用 ctypes 直接调用 libc，不依赖第三方库。其他机器经网络共享写入的文件不会产生
+    inotify 事件，因此仍按 rescan 秒的间隔做全量扫描兜底。
+    """
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    EVENT = struct.Struct('iIII')
+    READ_SIZE = 64 * 1024
+
+    def __init__(self, directories, recursive=False, match=None,
+                 rescan=DEFAULT_POLL_INTERVAL * RESCAN_FACTOR):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, "inotify 仅在 Linux 上可用")
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.libc.inotify_add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            code = ctypes.get_errno()
+            raise OSError(code, os.strerror(code))
+        self.recursive = recursive
+        self.match = match
+        self.watches = {}
+        self.poller = PollingWatcher(directories, recursive, match, rescan)
+        for directory in directories:
+            self.add_tree(directory)
+
+    def add_watch(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+        if wd < 0:
+            # 常见原因是超过 fs.inotify.max_user_watches，该目录只能靠全量扫描发现新文件
+            code = ctypes.get_errno()
+            logging.warning(f"无法监视目录: {directory} - {os.strerror(code)}")
+            return
+        self.watches[wd] = directory
+
+    def add_tree(self, directory):
+        self.add_watch(directory)
+        if self.recursive:
+            for root, dirs, files in os.walk(directory):
+                for name in dirs:
+                    self.add_watch(os.path.join(root, name))
+
+    def wait(self, timeout):
+        """最多等待 timeout 秒，返回可能有变化的文件路径集合"""
+        delay = self.poller.next_scan - time.monotonic()
+        if delay <= 0:
+            return self.poller.scan()
+        readable, _, _ = select.select([self.fd], [], [], min(timeout, delay))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, self.READ_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+            offset += self.EVENT.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                # 事件队列溢出，丢失的事件由下一次全量扫描补上
+                self.poller.next_scan = 0
+                continue
+            if mask & self.IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & self.IN_ISDIR:
+                # 新建或移入的子目录在开始监视之前可能已经有文件
+                if self.recursive and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self.add_tree(path)
+                    changed.update(walk_files([path], True, self.match))
+            elif self.match is None or self.match(name):
+                changed.add(path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+def create_watcher(directories, recursive=False, match=None, interval=DEFAULT_POLL_INTERVAL,
+                   polling=False):
+    """优先使用 inotify，不可用或指定 polling 时改为定期扫描"""
+    if not polling:
+        try:
+            return InotifyWatcher(directories, recursive, match, interval * RESCAN_FACTOR)
+        except (OSError, AttributeError) as e:
+            logging.info(f"无法使用 inotify，改为定期扫描: {str(e)}")
+    return PollingWatcher(directories, recursive, match, interval)
+
+class WatchDaemon:
+    """监视输入目录，把写入完成的文档放入持久化队列并在后台压缩
+
+    文件的大小和修改时间在 settle 秒内不再变化、并且能读到完整的 zip 目录后才入队。
+    所有文档共享同一个图片压缩进程池和内存预算；stop() 可以在其他线程或信号处理
+    函数中调用，正在压缩的文档会被取消并在下次启动时重新处理。
+    """
+
+    def __init__(self, directories, output_dir, queue, options=None, workers=1, concurrency=1,
+                 template='compressed_{name}', recursive=False, include=('*.docx',), exclude=(),
+                 settle=DEFAULT_SETTLE, poll_interval=DEFAULT_POLL_INTERVAL, polling=False,
+                 cache=None, metrics=None, verify=True):
+        # 较长的路径在前，嵌套的监视目录按最近的根目录计算输出路径
+        self.directories = sorted((os.path.abspath(d) for d in directories), key=len, reverse=True)
+        self.output_dir = output_dir
+        self.queue = queue
+        self.options = options or CompressionOptions()
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+        self.template = template
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.polling = polling
+        self.cache = cache
+        self.metrics = metrics
+        self.verify = verify
+        # 等待写入完成的文件: 路径 -> ((大小, 修改时间), 开始保持不变的时间)
+        self.candidates = {}
+        self.running = {}
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.wake = threading.Event()
+        self.last_counts = None
+        self.next_report = 0
+
+    def match(self, name):
+        return name_matches(name, self.include, self.exclude)
+
+    def root_of(self, path):
+        for directory in self.directories:
+            if path == directory or path.startswith(directory.rstrip(os.sep) + os.sep):
+                return directory
+        return os.path.dirname(path)
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+
+    def run(self):
+        """运行直到 stop() 被调用"""
+        recovered = self.queue.recover()
+        if recovered:
+            logging.info(f"恢复上次中断的任务 {recovered} 个")
+        watcher = create_watcher(self.directories, self.recursive, self.match,
+                                 self.poll_interval, self.polling)
+        logging.info(f"开始监视 {', '.join(self.directories)}"
+                     f"（{'inotify' if isinstance(watcher, InotifyWatcher) else '定期扫描'}）")
+        executor = create_process_pool(self.workers)
+        memory = None
+        if self.options.memory_limit:
+            memory = MemoryBudget(self.options.memory_limit)
+        threads = [threading.Thread(target=self.work, args=(executor, memory),
+                                    name=f'DocOptimizer-worker-{i}', daemon=True)
+                   for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self.stopping.is_set():
+                for path in watcher.wait(TICK):
+                    self.candidates[path] = (None, time.monotonic())
+                self.check_candidates()
+                self.report()
+        finally:
+            self.stop()
+            with self.lock:
+                for compressor in self.running.values():
+                    compressor.canceled = True
+            for thread in threads:
+                thread.join()
+            watcher.close()
+            if executor is not None:
+                executor.shutdown(wait=True)
+            self.report(force=True)
+
+    def check_candidates(self):
+        """把写入完成的文件放入队列"""
+        now = time.monotonic()
+        for path, (version, since) in list(self.candidates.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.candidates[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current != version:
+                self.candidates[path] = (current, now)
+                continue
+            if now - since < self.settle:
+                continue
+            # 预先分配空间的写入方式大小不变，但末尾的 zip 目录要到最后才写入
+            if not zipfile.is_zipfile(path) and now - since < self.settle * INCOMPLETE_FACTOR:
+                continue
+            del self.candidates[path]
+            output_path = build_output_path(path, self.root_of(path), self.output_dir,
+                                            self.template)
+            if self.queue.put(path, output_path, *current):
+                logging.info(f"入队: {path}")
+                self.wake.set()
+
+    def work(self, executor, memory):
+        while not self.stopping.is_set():
+            job = self.queue.claim()
+            if job is None:
+                self.wake.wait(TICK)
+                self.wake.clear()
+                continue
+            self.process(job, executor, memory)
+
+    def process(self, job, executor, memory):
+        job_id, input_path, output_path, enqueued = job
+        compressor = DocumentCompressor(input_path, output_path, self.options, self.workers,
+                                        executor=executor, cache=self.cache,
+                                        metrics=self.metrics, memory=memory, verify=self.verify)
+        with self.lock:
+            if self.stopping.is_set():
+                compressor.canceled = True
+            self.running[job_id] = compressor
+        started = time.time()
+        result = run_compressor(compressor)
+        with self.lock:
+            del self.running[job_id]
+        if compressor.canceled and not result.success:
+            # 被取消的文档没有输出，放回队列下次重新压缩；stop() 晚于压缩完成时照常记为完成
+            self.queue.release(job_id)
+            return
+        self.queue.finish(job_id, result.error)
+
+        finished = time.time()
+        if result.success:
+            print(f"成功 {input_path} -> {output_path} ({result.orig_size/1024:.2f}KB -> "
+                  f"{result.comp_size/1024:.2f}KB，缩小了 {result.ratio:.1f}%，"
+                  f"排队 {started - enqueued:.1f} 秒)", flush=True)
+        else:
+            print(f"失败 {input_path}: {result.error}", file=sys.stderr, flush=True)
+        if self.metrics is not None:
+            self.metrics.emit(
+                'job', document=input_path, output=output_path,
+                status='ok' if result.success else 'failed',
+                wait_seconds=round(started - enqueued, 6), seconds=round(finished - started, 6),
+                latency_seconds=round(finished - enqueued, 6), error=result.error)
+
+    def report(self, force=False):
+        """队列状态有变化时发出 queue 事件，并定期在日志中记录队列长度和延迟"""
+        counts = self.queue.counts()
+        if self.metrics is not None and (force or counts != self.last_counts):
+            self.metrics.emit('queue', **counts)
+        self.last_counts = counts
+        now = time.monotonic()
+        if not force and now < self.next_report:
+            return
+        self.next_report = now + REPORT_INTERVAL
+        self.queue.prune()
+        latencies = self.queue.latencies()
+        text = (f"队列: 等待 {counts['pending']} 个，处理中 {counts['running']} 个，"
+                f"完成 {counts['done']} 个，失败 {counts['failed']} 个，"
+                f"等待写入完成 {len(self.candidates)} 个")
+        if latencies:
+            text += (f"；最近 {len(latencies)} 个文档入队到完成耗时 "
+                     f"中位数 {percentile(latencies, 0.5):.1f} 秒，"
+                     f"P95 {percentile(latencies, 0.95):.1f} 秒")
+        logging.info(text)
+
+def queue_status(path):
+    """打印队列中各状态的任务数和最近的延迟，返回退出码"""
+    if not os.path.exists(path):
+        print(f"队列不存在: {path}", file=sys.stderr)
+        return 2
+    queue = JobQueue(path)
+    try:
+        counts = queue.counts()
+        latencies = queue.latencies()
+    finally:
+        queue.close()
+    print(f"等待 {counts['pending']} 个，处理中 {counts['running']} 个，"
+          f"完成 {counts['done']} 个，失败 {counts['failed']} 个")
+    if latencies:
+        print(f"最近 {len(latencies)} 个文档入队到完成耗时：中位数 "
+              f"{percentile(latencies, 0.5):.1f} 秒，P95 {percentile(latencies, 0.95):.1f} 秒，"
+              f"最长 {latencies[-1]:.1f} 秒")
+    return 0
+
+def run_daemon(args, metrics=None):
+    """按命令行参数运行监视目录服务，返回进程退出码"""
+    queue_path = args.queue or os.path.join(args.output_dir or '.', QUEUE_NAME)
+    if args.queue_status:
+        return queue_status(queue_path)
+    if not args.output_dir:
+        print("监视目录时必须用 -o 指定输出目录", file=sys.stderr)
+        return 2
+    directories = [os.path.abspath(path) for path in args.inputs]
+    missing = [path for path in directories if not os.path.isdir(path)]
+    if not directories or missing:
+        print(f"监视目录不存在: {', '.join(missing) or '未指定'}", file=sys.stderr)
+        return 2
+    # 输出文件不能再被当作新的输入
+    output_dir = os.path.abspath(args.output_dir)
+    for directory in directories:
+        if output_dir == directory or (args.recursive and
+                                       output_dir.startswith(directory.rstrip(os.sep) + os.sep)):
+            print(f"输出目录不能位于监视目录中: {directory}", file=sys.stderr)
+            return 2
+
+    cache = None
+    if args.cache:
+        cache = ImageCache(args.cache, args.cache_size * 1024 ** 2)
+    options = options_from_args(args)
+    queue = JobQueue(queue_path)
+    daemon = WatchDaemon(directories, output_dir, queue, options, args.workers, args.jobs,
+                         args.template, args.recursive, args.include or ['*.docx'],
+                         ['~$*'] + args.exclude, args.settle, args.poll_interval, args.poll,
+                         cache, metrics, args.verify)
+
+    def handle_signal(signum, frame):
+        daemon.stop()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        queue.close()
+    return 0
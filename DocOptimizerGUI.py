@@ -0,0 +1,1066 @@
+import os
+import sys
+import logging
+import collections
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,
+                           QPushButton, QLabel, QFileDialog, QProgressBar,
+                           QWidget, QMessageBox, QSpinBox, QGroupBox, QFrame,
+                           QListWidget, QListWidgetItem, QCheckBox, QSizePolicy,
+                           QGraphicsDropShadowEffect, QDoubleSpinBox)
+from PyQt5.QtCore import (Qt, QObject, QThread, pyqtSignal, QMimeData, QSize, QPropertyAnimation, 
+                         QEasingCurve, QSequentialAnimationGroup)
+from PyQt5.QtGui import (QDragEnterEvent, QDropEvent, QFont, QIcon, QPixmap, 
+                        QColor, QPalette, QLinearGradient, QBrush, QPainter,
+                        QGuiApplication, QPainterPath)
+
+from DocOptimizer import (VERSION, AUTHOR, DocumentCompressor, CompressionOptions,
+                          CompressionCanceled, ImageCache, MemoryBudget, DEFAULT_PALETTE_PSNR,
+                          create_process_pool, default_cache_dir, setup_logging)
+
+class CompressionThread(QThread):
+    progress_updated = pyqtSignal(int, str)
+    finished_signal = pyqtSignal(bool, str)
+
+    def __init__(self, input_path, output_path, options, workers=1, executor=None, cache=None,
+                 metrics=None, memory=None):
+        super().__init__()
+        self.input_path = input_path
+        self.output_path = output_path
+        self.compressor = DocumentCompressor(input_path, output_path, options, workers,
+                                             self.progress_updated.emit, executor, cache,
+                                             metrics, memory)
+
+    @property
+    def canceled(self):
+        return self.compressor.canceled
+
+    @canceled.setter
+    def canceled(self, value):
+        self.compressor.canceled = value
+
+    def run(self):
+        try:
+            result = self.compressor.compress()
+            self.finished_signal.emit(True, result.summary())
+        except CompressionCanceled:
+            self.finished_signal.emit(False, "操作已取消")
+        except Exception as e:
+            self.finished_signal.emit(False, f"压缩失败: {str(e)}")
+
+class BatchScheduler(QObject):
+    """并发调度多个文档的压缩任务，限制同时运行的文档数量"""
+    progress_updated = pyqtSignal(int, str)
+    file_finished = pyqtSignal(str, bool, str)
+    finished_signal = pyqtSignal(int, int)
+
+    def __init__(self, jobs, options, workers, concurrency, cache=None, parent=None,
+                 metrics=None):
+        super().__init__(parent)
+        self.options = options
+        self.cache = cache
+        self.metrics = metrics
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+
+        # 按文件大小从大到小排序，避免少数大文件在最后拖慢整个批次
+        self.sizes = {}
+        for input_path, _ in jobs:
+            try:
+                self.sizes[input_path] = os.path.getsize(input_path)
+            except OSError:
+                self.sizes[input_path] = 0
+        self.queue = collections.deque(
+            sorted(jobs, key=lambda job: self.sizes[job[0]], reverse=True))
+        self.total = len(jobs)
+        self.total_bytes = sum(self.sizes.values()) or 1
+
+        self.progress = {}
+        self.running = {}
+        self.succeeded = 0
+        self.failed = 0
+        self.canceled = False
+        self.executor = None
+        # 所有文档共享同一个内存预算
+        self.memory = MemoryBudget(options.memory_limit) if options.memory_limit else None
+
+    def start(self):
+        """填满所有并发槽位"""
+        # 所有文档共享同一个图片压缩进程池
+        if self.executor is None and self.queue:
+            self.executor = create_process_pool(self.workers)
+        while self.queue and len(self.running) < self.concurrency:
+            self.start_next()
+        if not self.running:
+            self.finish()
+
+    def start_next(self):
+        input_path, output_path = self.queue.popleft()
+        thread = CompressionThread(input_path, output_path, self.options, self.workers,
+                                   self.executor, self.cache, self.metrics, self.memory)
+        thread.progress_updated.connect(
+            lambda value, text, path=input_path: self.update_progress(path, value, text))
+        thread.finished_signal.connect(
+            lambda success, message, path=input_path: self.file_done(path, success, message))
+        thread.finished.connect(
+            lambda path=input_path: self.thread_finished(path))
+        self.running[input_path] = thread
+        self.progress[input_path] = 0.0
+        thread.start()
+
+    def is_running(self):
+        return bool(self.running)
+
+    def update_progress(self, path, value, text):
+        """按文件大小加权汇总所有文档的进度"""
+        self.progress[path] = value / 100
+        done_bytes = sum(self.sizes[p] * f for p, f in self.progress.items())
+        finished = self.succeeded + self.failed
+        self.progress_updated.emit(
+            int(done_bytes / self.total_bytes * 100),
+            f"已完成 {finished}/{self.total} 个文件 - {os.path.basename(path)}: {text}")
+
+    def file_done(self, path, success, message):
+        if success:
+            self.succeeded += 1
+        elif self.canceled:
+            # 被取消的文档没有输出，不计入失败
+            self.file_finished.emit(path, False, message)
+            return
+        else:
+            self.failed += 1
+            logging.warning(f"文档压缩失败: {path} - {message}")
+        self.file_finished.emit(path, success, message)
+        self.update_progress(path, 100, "完成" if success else "失败")
+
+    def thread_finished(self, path):
+        """线程真正退出后再释放并启动下一个任务"""
+        thread = self.running.pop(path, None)
+        if thread is not None:
+            thread.deleteLater()
+        if self.queue and not self.canceled:
+            self.start_next()
+        elif not self.running:
+            self.finish()
+
+    def finish(self):
+        self.shutdown()
+        self.finished_signal.emit(self.succeeded, self.failed)
+
+    def shutdown(self):
+        """关闭共享的进程池；取消时不等工作进程，正在执行的任务会在下一个检查点停止"""
+        if self.executor is not None:
+            self.executor.shutdown(wait=not self.canceled, cancel_futures=True)
+            self.executor = None
+
+    def cancel(self):
+        """取消排队和正在运行的文档，线程在几毫秒内自行结束，不留下不完整的输出"""
+        self.canceled = True
+        self.queue.clear()
+        for thread in list(self.running.values()):
+            thread.canceled = True
+
+    def wait(self):
+        """等待正在运行的线程结束"""
+        for thread in list(self.running.values()):
+            thread.wait()
+
+class ShadowFrame(QFrame):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.shadow = QGraphicsDropShadowEffect()
+        self.shadow.setBlurRadius(15)
+        self.shadow.setOffset(3)
+        self.shadow.setColor(QColor(0, 0, 0, 100))
+        self.setGraphicsEffect(self.shadow)
+
+class DropArea(ShadowFrame):
+    files_dropped = pyqtSignal(list)
+    clicked = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setAcceptDrops(True)
+        self.setFrameShape(QFrame.StyledPanel)
+        self.setStyleSheet("""
+            ShadowFrame {
+                border: 2px dashed #aaa;
+                border-radius: 12px;
+                background-color: rgba(255, 255, 255, 100);
+                padding: 20px;
+            }
+        """)
+        self.setMinimumSize(300, 180)
+
+        layout = QVBoxLayout(self)
+        layout.setAlignment(Qt.AlignCenter)
+        layout.setSpacing(10)
+        
+        self.icon = QLabel()
+        self.icon.setPixmap(QIcon.fromTheme("folder-documents").pixmap(64, 64))
+        layout.addWidget(self.icon, 0, Qt.AlignCenter)
+        
+        self.label = QLabel("拖放Word文档到此处\n或点击选择文件")
+        self.label.setAlignment(Qt.AlignCenter)
+        self.label.setWordWrap(True)
+        layout.addWidget(self.label)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+            animate = QPropertyAnimation(self, b"radius")
+            animate.setDuration(200)
+            animate.setStartValue(12)
+            animate.setEndValue(24)
+            animate.setEasingCurve(QEasingCurve.OutQuad)
+            animate.start()
+            
+            # 使用渐变创建悬停效果
+            gradient = QLinearGradient(0, 0, 0, self.height())
+            gradient.setColorAt(0, QColor(76, 175, 80, 60))
+            gradient.setColorAt(1, QColor(56, 142, 60, 60))
+            
+            self.styledEffect = QWidget(self)
+            self.styledEffect.setStyleSheet("background: transparent;")
+            self.styledEffect.resize(self.size())
+            
+            def paintEvent(event):
+                painter = QPainter(self.styledEffect)
+                painter.setRenderHint(QPainter.Antialiasing)
+                path = QPainterPath()
+                path.addRoundedRect(self.rect(), 12, 12)
+                painter.setClipPath(path)
+                painter.setBrush(QBrush(gradient))
+                painter.setPen(Qt.NoPen)
+                painter.drawRoundedRect(self.rect(), 12, 12)
+                painter.end()
+                
+            self.styledEffect.paintEvent = paintEvent
+            self.styledEffect.update()
+            
+            self.label.raise_()
+            self.icon.raise_()
+
+    def dragLeaveEvent(self, event):
+        self.clear_effects()
+
+    def dropEvent(self, event):
+        self.clear_effects()
+        urls = event.mimeData().urls()
+        if urls:
+            files = [url.toLocalFile() for url in urls if url.isLocalFile()]
+            if files:
+                self.files_dropped.emit(files)
+
+    def clear_effects(self):
+        if hasattr(self, 'styledEffect'):
+            self.styledEffect.deleteLater()
+            del self.styledEffect
+        self.setStyleSheet("""
+            ShadowFrame {
+                border: 2px dashed #aaa;
+                border-radius: 12px;
+                background-color: rgba(255, 255, 255, 100);
+                padding: 20px;
+            }
+        """)
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            # 点击动画
+            self.click_animation = QPropertyAnimation(self, b"size")
+            self.click_animation.setDuration(100)
+            self.click_animation.setStartValue(self.size())
+            self.click_animation.setEndValue(QSize(self.width()-6, self.height()-6))
+            self.click_animation.setEasingCurve(QEasingCurve.OutQuad)
+            
+            self.click_animation2 = QPropertyAnimation(self, b"size")
+            self.click_animation2.setDuration(100)
+            self.click_animation2.setStartValue(QSize(self.width()-6, self.height()-6))
+            self.click_animation2.setEndValue(self.size())
+            self.click_animation2.setEasingCurve(QEasingCurve.InQuad)
+            
+            self.anim_group = QSequentialAnimationGroup()
+            self.anim_group.addAnimation(self.click_animation)
+            self.anim_group.addAnimation(self.click_animation2)
+            self.anim_group.start()
+            
+            self.clicked.emit()
+            
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if hasattr(self, 'styledEffect'):
+            self.styledEffect.resize(self.size())
+
+class ModernButton(QPushButton):
+    def __init__(self, text, parent=None):
+        super().__init__(text, parent)
+        self.setCursor(Qt.PointingHandCursor)
+        self.setMinimumHeight(36)
+        self.setSizePolicy(QSizePolicy.Minimum, QSizePolicy.Fixed)
+        
+        # 默认样式
+        self.normal_style = """
+            QPushButton {
+                background-color: #4CAF50;
+                color: white;
+                border: none;
+                border-radius: 6px;
+                padding: 8px 16px;
+                font-weight: 500;
+                min-width: 100px;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+            QPushButton:pressed {
+                background-color: #3d8b40;
+            }
+            QPushButton:disabled {
+                background-color: #cccccc;
+                color: #666666;
+            }
+        """
+        
+        self.setStyleSheet(self.normal_style)
+        
+        # 阴影效果
+        self.shadow = QGraphicsDropShadowEffect()
+        self.shadow.setBlurRadius(8)
+        self.shadow.setOffset(2, 2)
+        self.shadow.setColor(QColor(0, 0, 0, 50))
+        self.setGraphicsEffect(self.shadow)
+
+class SecondaryButton(ModernButton):
+    def __init__(self, text, parent=None):
+        super().__init__(text, parent)
+        self.normal_style = """
+            QPushButton {
+                background-color: #f0f0f0;
+                color: #333333;
+                border: 1px solid #dddddd;
+                border-radius: 6px;
+                padding: 8px 16px;
+                font-weight: 500;
+                min-width: 100px;
+            }
+            QPushButton:hover {
+                background-color: #e0e0e0;
+            }
+            QPushButton:pressed {
+                background-color: #d0d0d0;
+            }
+            QPushButton:disabled {
+                background-color: #f5f5f5;
+                color: #aaaaaa;
+            }
+        """
+        self.setStyleSheet(self.normal_style)
+
+class DangerButton(ModernButton):
+    def __init__(self, text, parent=None):
+        super().__init__(text, parent)
+        self.normal_style = """
+            QPushButton {
+                background-color: #f44336;
+                color: white;
+                border: none;
+                border-radius: 6px;
+                padding: 8px 16px;
+                font-weight: 500;
+                min-width: 100px;
+            }
+            QPushButton:hover {
+                background-color: #e53935;
+            }
+            QPushButton:pressed {
+                background-color: #d32f2f;
+            }
+            QPushButton:disabled {
+                background-color: #ffcdd2;
+                color: #666666;
+            }
+        """
+        self.setStyleSheet(self.normal_style)
+
+class MainWindow(QMainWindow):
+    def __init__(self, metrics=None):
+        super().__init__()
+        self.setWindowTitle(f"Word文档压缩工具 v{VERSION}")
+        self.setMinimumSize(1000, 700)
+        
+        # 初始化变量
+        self.input_files = []
+        self.output_dir = ""
+        self.compression_thread = None
+        self.batch_scheduler = None
+        self.cache = None
+        self.batch_cache_stats = None
+        # 可选的结构化指标输出（命令行 --metrics-* 参数）
+        self.metrics = metrics
+        
+        # 设置UI
+        self.init_ui()
+        self.update_styles()
+        
+        # 居中窗口
+        self.center_window()
+
+    def center_window(self):
+        frame = self.frameGeometry()
+        center_point = QGuiApplication.primaryScreen().availableGeometry().center()
+        frame.moveCenter(center_point)
+        self.move(frame.topLeft())
+
+    def init_ui(self):
+        # 创建中央部件
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        
+        # 主布局
+        main_layout = QVBoxLayout(central_widget)
+        main_layout.setContentsMargins(30, 30, 30, 30)
+        main_layout.setSpacing(20)
+        
+        # 内容区域
+        content_frame = ShadowFrame()
+        content_frame.setStyleSheet("""
+            ShadowFrame {
+                background-color: white;
+                border-radius: 12px;
+            }
+        """)
+        content_layout = QVBoxLayout(content_frame)
+        content_layout.setContentsMargins(20, 20, 20, 20)
+        content_layout.setSpacing(20)
+        
+        # 标题区域
+        title_frame = QFrame()
+        title_frame.setStyleSheet("""
+            QFrame {
+                background: qlineargradient(x1:0, y1:0, x2:1, y2:0,
+                    stop:0 #4CAF50, stop:1 #81C784);
+                border-radius: 8px;
+                padding: 15px;
+            }
+        """)
+        title_layout = QVBoxLayout(title_frame)
+        title_layout.setSpacing(8)
+        
+        title_label = QLabel(f"Word文档压缩工具 by {AUTHOR}")
+        title_label.setAlignment(Qt.AlignCenter)
+        title_label.setStyleSheet("""
+            QLabel {
+                color: white;
+                font-size: 27px;
+                font-weight: bold;
+            }
+        """)
+        title_layout.addWidget(title_label)
+        
+        subtitle_label = QLabel("优化Word文档中的图片，显著减小文件大小")
+        subtitle_label.setAlignment(Qt.AlignCenter)
+        subtitle_label.setStyleSheet("""
+            QLabel {
+                color: rgba(255, 255, 255, 0.9);
+                font-size: 15px;
+            }
+        """)
+        title_layout.addWidget(subtitle_label)
+        
+        content_layout.addWidget(title_frame)
+
+        # 拖放区域
+        self.drop_area = DropArea()
+        self.drop_area.clicked.connect(self.select_input_files)
+        self.drop_area.files_dropped.connect(self.handle_dropped_files)
+        content_layout.addWidget(self.drop_area)
+
+        # 文件列表
+        self.file_list = QListWidget()
+        self.file_list.setSelectionMode(QListWidget.ExtendedSelection)
+        self.file_list.setStyleSheet("""
+            QListWidget {
+                border: 1px solid #e0e0e0;
+                border-radius: 8px;
+                padding: 5px;
+                background-color: white;
+                alternate-background-color: #f9f9f9;
+            }
+            QListWidget::item {
+                padding: 10px;
+                border-bottom: 1px solid #f0f0f0;
+            }
+            QListWidget::item:hover {
+                background-color: #f5f5f5;
+            }
+            QListWidget::item:selected {
+                background-color: #e3f2fd;
+                color: #1976d2;
+            }
+        """)
+        content_layout.addWidget(self.file_list)
+
+        # 列表操作按钮
+        list_btn_layout = QHBoxLayout()
+        list_btn_layout.setSpacing(15)
+        
+        self.clear_btn = SecondaryButton("清空列表")
+        self.clear_btn.clicked.connect(self.clear_file_list)
+        list_btn_layout.addWidget(self.clear_btn)
+        
+        self.remove_btn = SecondaryButton("移除选中")
+        self.remove_btn.clicked.connect(self.remove_selected_files)
+        list_btn_layout.addWidget(self.remove_btn)
+        
+        list_btn_layout.addStretch()
+        content_layout.addLayout(list_btn_layout)
+
+        # 设置组
+        settings_group = ShadowFrame()
+        settings_group.setStyleSheet("""
+            ShadowFrame {
+                background-color: white;
+                border-radius: 8px;
+                padding: 15px;
+            }
+        """)
+        
+        settings_layout = QVBoxLayout(settings_group)
+        settings_layout.setContentsMargins(10, 10, 10, 10)
+        settings_layout.setSpacing(20)
+
+        # 质量设置
+        quality_layout = QHBoxLayout()
+        quality_layout.setSpacing(15)
+        
+        quality_label = QLabel("图片质量:")
+        quality_label.setStyleSheet("font-weight: bold;")
+        quality_layout.addWidget(quality_label)
+        
+        self.quality_spin = QSpinBox()
+        self.quality_spin.setRange(1, 100)
+        self.quality_spin.setValue(75)
+        self.quality_spin.setFixedWidth(100)
+        self.quality_spin.setStyleSheet("""
+            QSpinBox {
+                padding: 5px;
+                border: 1px solid #ddd;
+                border-radius: 4px;
+            }
+            QSpinBox:hover {
+                border-color: #aaa;
+            }
+        """)
+        quality_layout.addWidget(self.quality_spin)
+        
+        workers_label = QLabel("并行进程:")
+        workers_label.setStyleSheet("font-weight: bold;")
+        quality_layout.addWidget(workers_label)
+        
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(1, os.cpu_count() or 1) * 2)
+        self.workers_spin.setValue(os.cpu_count() or 1)
+        self.workers_spin.setFixedWidth(100)
+        self.workers_spin.setStyleSheet(self.quality_spin.styleSheet())
+        quality_layout.addWidget(self.workers_spin)
+        
+        concurrency_label = QLabel("并发文档:")
+        concurrency_label.setStyleSheet("font-weight: bold;")
+        quality_layout.addWidget(concurrency_label)
+        
+        self.concurrency_spin = QSpinBox()
+        self.concurrency_spin.setRange(1, 64)
+        self.concurrency_spin.setValue(2)
+        self.concurrency_spin.setFixedWidth(100)
+        self.concurrency_spin.setStyleSheet(self.quality_spin.styleSheet())
+        quality_layout.addWidget(self.concurrency_spin)
+        
+        memory_label = QLabel("内存上限(MB):")
+        memory_label.setStyleSheet("font-weight: bold;")
+        quality_layout.addWidget(memory_label)
+        
+        self.memory_spin = QSpinBox()
+        self.memory_spin.setRange(0, 1024 * 1024)
+        self.memory_spin.setSingleStep(256)
+        self.memory_spin.setValue(0)
+        self.memory_spin.setSpecialValueText("不限制")
+        self.memory_spin.setToolTip("同时解码的图片估算内存上限，超出上限的大图会被缩小或保留原图")
+        self.memory_spin.setFixedWidth(100)
+        self.memory_spin.setStyleSheet(self.quality_spin.styleSheet())
+        quality_layout.addWidget(self.memory_spin)
+        
+        quality_layout.addStretch()
+        
+        self.same_dir_check = QCheckBox("输出到原文件所在目录")
+        self.same_dir_check.setChecked(True)
+        self.same_dir_check.setStyleSheet("""
+            QCheckBox {
+                spacing: 5px;
+            }
+            QCheckBox::indicator {
+                width: 16px;
+                height: 16px;
+            }
+        """)
+        quality_layout.addWidget(self.same_dir_check)
+        
+        settings_layout.addLayout(quality_layout)
+
+        # 高级选项
+        options_layout = QHBoxLayout()
+        options_layout.setSpacing(15)
+        
+        self.cache_check = QCheckBox("缓存图片压缩结果")
+        self.cache_check.setChecked(True)
+        self.cache_check.setToolTip(f"重复出现的图片直接复用上次的压缩结果\n缓存目录: {default_cache_dir()}")
+        self.cache_check.setStyleSheet(self.same_dir_check.styleSheet())
+        options_layout.addWidget(self.cache_check)
+        
+        self.dedup_check = QCheckBox("合并重复图片")
+        self.dedup_check.setChecked(True)
+        self.dedup_check.setToolTip("文档中内容完全相同的图片只保留一份")
+        self.dedup_check.setStyleSheet(self.same_dir_check.styleSheet())
+        options_layout.addWidget(self.dedup_check)
+        
+        self.palette_check = QCheckBox("PNG调色板")
+        self.palette_check.setChecked(False)
+        self.palette_check.setToolTip("把屏幕截图等真彩色 PNG 转换为 256 色调色板\n"
+                                      "颜色不超过 256 种时无损，否则只在画质损失很小时采用")
+        self.palette_check.setStyleSheet(self.same_dir_check.styleSheet())
+        options_layout.addWidget(self.palette_check)
+        
+        dpi_label = QLabel("目标DPI:")
+        dpi_label.setStyleSheet("font-weight: bold;")
+        options_layout.addWidget(dpi_label)
+        
+        self.dpi_spin = QSpinBox()
+        self.dpi_spin.setRange(0, 1200)
+        self.dpi_spin.setSingleStep(10)
+        self.dpi_spin.setValue(0)
+        self.dpi_spin.setSpecialValueText("不缩放")
+        self.dpi_spin.setToolTip("按图片在文档中的最大显示尺寸缩小到该分辨率，例如 150 或 220")
+        self.dpi_spin.setFixedWidth(100)
+        self.dpi_spin.setStyleSheet(self.quality_spin.styleSheet())
+        options_layout.addWidget(self.dpi_spin)
+        
+        target_label = QLabel("目标大小(MB):")
+        target_label.setStyleSheet("font-weight: bold;")
+        options_layout.addWidget(target_label)
+        
+        self.target_spin = QDoubleSpinBox()
+        self.target_spin.setRange(0, 10240)
+        self.target_spin.setDecimals(1)
+        self.target_spin.setSingleStep(0.5)
+        self.target_spin.setValue(0)
+        self.target_spin.setSpecialValueText("不限制")
+        self.target_spin.setToolTip("自动为每个文档选择 JPEG 质量，使压缩后不超过该大小\n图片质量不会高于上面设置的值")
+        self.target_spin.setFixedWidth(100)
+        self.target_spin.setStyleSheet(self.quality_spin.styleSheet().replace("QSpinBox", "QDoubleSpinBox"))
+        options_layout.addWidget(self.target_spin)
+        
+        options_layout.addStretch()
+        settings_layout.addLayout(options_layout)
+
+        # 输出目录
+        output_layout = QHBoxLayout()
+        output_layout.setSpacing(15)
+        
+        output_label = QLabel("输出目录:")
+        output_label.setStyleSheet("font-weight: bold;")
+        output_layout.addWidget(output_label)
+        
+        self.output_label = QLabel("未选择")
+        self.output_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
+        self.output_label.setWordWrap(True)
+        self.output_label.setStyleSheet("""
+            QLabel {
+                color: #555;
+                padding: 5px;
+                border: 1px solid #eee;
+                border-radius: 4px;
+                background-color: #f9f9f9;
+            }
+        """)
+        output_layout.addWidget(self.output_label)
+        
+        self.select_dir_btn = SecondaryButton("浏览...")
+        self.select_dir_btn.clicked.connect(self.select_output_directory)
+        output_layout.addWidget(self.select_dir_btn)
+        
+        settings_layout.addLayout(output_layout)
+        content_layout.addWidget(settings_group)
+
+        # 进度条
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setTextVisible(True)
+        self.progress_bar.setStyleSheet("""
+            QProgressBar {
+                border: 1px solid #e0e0e0;
+                border-radius: 6px;
+                text-align: center;
+                height: 20px;
+            }
+            QProgressBar::chunk {
+                background-color: #4CAF50;
+                border-radius: 5px;
+            }
+        """)
+        content_layout.addWidget(self.progress_bar)
+
+        # 状态标签
+        self.status_label = QLabel("就绪")
+        self.status_label.setAlignment(Qt.AlignCenter)
+        self.status_label.setStyleSheet("""
+            QLabel {
+                color: #666;
+                font-style: italic;
+            }
+        """)
+        content_layout.addWidget(self.status_label)
+
+        # 操作按钮
+        btn_layout = QHBoxLayout()
+        btn_layout.setSpacing(15)
+        
+        self.compress_btn = ModernButton("压缩")
+        self.compress_btn.clicked.connect(self.start_compression)
+        btn_layout.addWidget(self.compress_btn)
+        
+        self.batch_btn = ModernButton("批量压缩")
+        self.batch_btn.clicked.connect(self.start_batch_compression)
+        btn_layout.addWidget(self.batch_btn)
+        
+        self.cancel_btn = DangerButton("取消")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_compression)
+        btn_layout.addWidget(self.cancel_btn)
+        
+        btn_layout.addStretch()
+        content_layout.addLayout(btn_layout)
+        
+        main_layout.addWidget(content_frame)
+
+    def update_styles(self):
+        # 设置应用字体
+        font = QFont()
+        font.setFamily("Microsoft YaHei" if sys.platform == "win32" else 
+                      "PingFang SC" if sys.platform == "darwin" else 
+                      "Noto Sans CJK SC")
+        font.setStyleHint(QFont.SansSerif)
+        self.setFont(font)
+        
+        # 设置窗口背景
+        palette = self.palette()
+        gradient = QLinearGradient(0, 0, 0, 400)
+        gradient.setColorAt(0, QColor(240, 248, 255))
+        gradient.setColorAt(1, QColor(230, 240, 250))
+        palette.setBrush(QPalette.Window, QBrush(gradient))
+        self.setPalette(palette)
+
+    def select_input_files(self):
+        files, _ = QFileDialog.getOpenFileNames(
+            self, "选择Word文档", "",
+            "Word文档 (*.docx *.doc);;所有文件 (*)"
+        )
+        if files:
+            self.input_files = files
+            self.update_file_list()
+            
+            if self.same_dir_check.isChecked() and files:
+                self.output_dir = os.path.dirname(files[0])
+                self.output_label.setText(self.output_dir)
+
+    def handle_dropped_files(self, file_paths):
+        valid_files = [f for f in file_paths if f.lower().endswith(('.docx', '.doc'))]
+        if not valid_files:
+            QMessageBox.warning(self, "错误", "请拖放有效的Word文档 (.docx/.doc)")
+            return
+        
+        self.input_files = valid_files
+        self.update_file_list()
+        
+        if self.same_dir_check.isChecked() and valid_files:
+            self.output_dir = os.path.dirname(valid_files[0])
+            self.output_label.setText(self.output_dir)
+
+    def update_file_list(self):
+        self.file_list.clear()
+        for file in self.input_files:
+            item = QListWidgetItem(file)
+            icon = QIcon.fromTheme("x-office-document")
+            item.setIcon(icon)
+            self.file_list.addItem(item)
+        self.status_label.setText(f"已准备压缩 {len(self.input_files)} 个文件")
+
+    def clear_file_list(self):
+        self.input_files = []
+        self.file_list.clear()
+        self.status_label.setText("文件列表已清空")
+
+    def remove_selected_files(self):
+        selected = self.file_list.selectedItems()
+        if not selected:
+            return
+        
+        for item in selected:
+            self.input_files.remove(item.text())
+            self.file_list.takeItem(self.file_list.row(item))
+        
+        self.status_label.setText(f"已移除 {len(selected)} 个文件")
+
+    def select_output_directory(self):
+        directory = QFileDialog.getExistingDirectory(self, "选择输出目录")
+        if directory:
+            self.output_dir = directory
+            self.output_label.setText(directory)
+            self.same_dir_check.setChecked(False)
+
+    def compression_options(self):
+        """根据界面设置生成压缩参数"""
+        return CompressionOptions(quality=self.quality_spin.value(),
+                                  dedup=self.dedup_check.isChecked(),
+                                  dpi=self.dpi_spin.value() or None,
+                                  target_size=int(self.target_spin.value() * 1024 * 1024) or None,
+                                  memory_limit=self.memory_spin.value() * 1024 * 1024 or None,
+                                  png_palette=(DEFAULT_PALETTE_PSNR if self.palette_check.isChecked()
+                                               else None))
+
+    def image_cache(self):
+        """勾选缓存时返回共享的图片缓存"""
+        if not self.cache_check.isChecked():
+            return None
+        if self.cache is None:
+            try:
+                self.cache = ImageCache(default_cache_dir())
+            except Exception as e:
+                logging.warning(f"无法打开图片缓存: {str(e)}")
+                return None
+        return self.cache
+
+    def start_compression(self):
+        if not self.input_files:
+            QMessageBox.warning(self, "错误", "请先选择要压缩的文件")
+            return
+        
+        if not self.output_dir:
+            QMessageBox.warning(self, "错误", "请选择输出目录")
+            return
+        
+        input_path = self.input_files[0]
+        filename = os.path.basename(input_path)
+        output_path = os.path.join(self.output_dir, f"compressed_{filename}")
+        
+        workers = self.workers_spin.value()
+        
+        self.compression_thread = CompressionThread(input_path, output_path,
+                                                    self.compression_options(), workers,
+                                                    cache=self.image_cache(),
+                                                    metrics=self.metrics)
+        self.compression_thread.progress_updated.connect(self.update_progress)
+        self.compression_thread.finished_signal.connect(self.compression_finished)
+        
+        self.set_controls_enabled(False)
+        self.compression_thread.start()
+
+    def start_batch_compression(self):
+        if not self.input_files:
+            QMessageBox.warning(self, "错误", "请先选择要压缩的文件")
+            return
+        
+        if not self.output_dir:
+            QMessageBox.warning(self, "错误", "请选择输出目录")
+            return
+        
+        # 勾选“输出到原文件所在目录”时每个文件输出到各自的目录
+        jobs = []
+        for input_path in self.input_files:
+            output_dir = (os.path.dirname(input_path) if self.same_dir_check.isChecked()
+                          else self.output_dir)
+            filename = os.path.basename(input_path)
+            jobs.append((input_path, os.path.join(output_dir, f"compressed_{filename}")))
+        
+        concurrency = min(self.concurrency_spin.value(), len(jobs))
+        workers = self.workers_spin.value()
+        
+        for i in range(self.file_list.count()):
+            item = self.file_list.item(i)
+            item.setIcon(QIcon.fromTheme("x-office-document"))
+            item.setForeground(QBrush(QColor("#333333")))
+            item.setToolTip("")
+        
+        cache = self.image_cache()
+        self.batch_cache_stats = cache.stats() if cache is not None else None
+        self.batch_scheduler = BatchScheduler(
+            jobs, self.compression_options(), workers, concurrency, cache, self, self.metrics)
+        self.batch_scheduler.progress_updated.connect(self.update_progress)
+        self.batch_scheduler.file_finished.connect(self.batch_file_finished)
+        self.batch_scheduler.finished_signal.connect(self.batch_finished)
+        
+        self.set_controls_enabled(False)
+        self.batch_scheduler.start()
+
+    def batch_file_finished(self, path, success, message):
+        """在文件列表中标记单个文档的结果"""
+        for i in range(self.file_list.count()):
+            item = self.file_list.item(i)
+            if item.text() != path:
+                continue
+            if success:
+                item.setIcon(QIcon.fromTheme("dialog-ok"))
+                item.setForeground(QBrush(QColor("#388e3c")))
+            else:
+                item.setIcon(QIcon.fromTheme("dialog-error"))
+                item.setForeground(QBrush(QColor("#d32f2f")))
+            item.setToolTip(message)
+
+    def batch_finished(self, succeeded, failed):
+        canceled = self.batch_scheduler is not None and self.batch_scheduler.canceled
+        self.batch_scheduler = None
+        self.set_controls_enabled(True)
+        self.progress_bar.setValue(0)
+        
+        summary = f"批量压缩完成：成功 {succeeded} 个，失败 {failed} 个"
+        if canceled:
+            summary = f"批量压缩已取消：成功 {succeeded} 个，失败 {failed} 个"
+        elif failed:
+            summary += "（失败原因见文件列表提示）"
+        if self.batch_cache_stats is not None and self.cache is not None:
+            stats = self.cache.stats()
+            summary += (f"，图片缓存命中 {stats['hits'] - self.batch_cache_stats['hits']} 次，"
+                        f"未命中 {stats['misses'] - self.batch_cache_stats['misses']} 次")
+        self.status_label.setText(summary)
+
+    def cancel_compression(self):
+        # 线程结束后由 compression_finished 或 batch_finished 恢复控件
+        if self.compression_thread and self.compression_thread.isRunning():
+            self.compression_thread.canceled = True
+            self.status_label.setText("正在取消...")
+            self.cancel_btn.setEnabled(False)
+        
+        if self.batch_scheduler and self.batch_scheduler.is_running():
+            self.batch_scheduler.cancel()
+            self.status_label.setText("正在取消...")
+            self.cancel_btn.setEnabled(False)
+
+    def update_progress(self, value, text):
+        self.progress_bar.setValue(value)
+        self.status_label.setText(text)
+
+    def compression_finished(self, success, message):
+        canceled = self.compression_thread is not None and self.compression_thread.canceled
+        if not success and canceled:
+            self.status_label.setText("操作已取消")
+        elif success:
+            # 成功消息
+            msg = QMessageBox(self)
+            msg.setIcon(QMessageBox.Information)
+            msg.setWindowTitle("成功")
+            msg.setText(message)
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.setStyleSheet("""
+                QMessageBox {
+                    background-color: white;
+                }
+                QMessageBox QLabel {
+                    color: #333;
+                }
+            """)
+            msg.exec_()
+        else:
+            # 错误消息
+            msg = QMessageBox(self)
+            msg.setIcon(QMessageBox.Warning)
+            msg.setWindowTitle("错误")
+            msg.setText(message)
+            msg.setStandardButtons(QMessageBox.Ok)
+            msg.setStyleSheet("""
+                QMessageBox {
+                    background-color: white;
+                }
+                QMessageBox QLabel {
+                    color: #333;
+                }
+            """)
+            msg.exec_()
+        
+        self.set_controls_enabled(True)
+        self.progress_bar.setValue(0)
+
+    def set_controls_enabled(self, enabled):
+        self.drop_area.setEnabled(enabled)
+        self.clear_btn.setEnabled(enabled)
+        self.remove_btn.setEnabled(enabled)
+        self.quality_spin.setEnabled(enabled)
+        self.workers_spin.setEnabled(enabled)
+        self.memory_spin.setEnabled(enabled)
+        self.concurrency_spin.setEnabled(enabled)
+        self.cache_check.setEnabled(enabled)
+        self.dedup_check.setEnabled(enabled)
+        self.palette_check.setEnabled(enabled)
+        self.dpi_spin.setEnabled(enabled)
+        self.target_spin.setEnabled(enabled)
+        self.same_dir_check.setEnabled(enabled)
+        self.select_dir_btn.setEnabled(enabled)
+        self.compress_btn.setEnabled(enabled)
+        self.batch_btn.setEnabled(enabled)
+        self.cancel_btn.setEnabled(not enabled)
+
+    def is_busy(self):
+        if self.compression_thread and self.compression_thread.isRunning():
+            return True
+        return bool(self.batch_scheduler and self.batch_scheduler.is_running())
+
+    def closeEvent(self, event):
+        if self.is_busy():
+            # 确认对话框
+            msg = QMessageBox(self)
+            msg.setIcon(QMessageBox.Question)
+            msg.setWindowTitle("确认退出")
+            msg.setText("压缩正在进行中，确定要退出吗？")
+            msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+            msg.setDefaultButton(QMessageBox.No)
+            msg.setStyleSheet("""
+                QMessageBox {
+                    background-color: white;
+                }
+                QMessageBox QLabel {
+                    color: #333;
+                }
+            """)
+            
+            reply = msg.exec_()
+            
+            if reply == QMessageBox.Yes:
+                # 取消后线程很快结束，等它们退出再关闭窗口
+                if self.compression_thread and self.compression_thread.isRunning():
+                    self.compression_thread.canceled = True
+                    self.compression_thread.wait()
+                if self.batch_scheduler:
+                    self.batch_scheduler.cancel()
+                    self.batch_scheduler.wait()
+                    self.batch_scheduler.shutdown()
+                event.accept()
+            else:
+                event.ignore()
+        else:
+            event.accept()
+
+def run_gui(argv=None, metrics=None):
+    """启动图形界面，返回退出码；metrics 为可选的 Metrics"""
+    app = QApplication(sys.argv if argv is None else argv)
+    
+    # 设置应用信息
+    app.setApplicationName("WordCompressor")
+    app.setApplicationDisplayName(f"Word文档压缩工具 v{VERSION}")
+    app.setApplicationVersion(VERSION)
+    
+    # 创建并显示主窗口
+    window = MainWindow(metrics)
+    window.show()
+    
+    return app.exec_()
+
+if __name__ == "__main__":
+    setup_logging()
+    sys.exit(run_gui())
@@ -0,0 +1,499 @@
+import os
+import sys
+import copy
+import json
+import time
+import shutil
+import signal
+import asyncio
+import logging
+import secrets
+import argparse
+import tempfile
+import http
+import urllib.parse
+import concurrent.futures
+
+from DocOptimizer import (VERSION, COPY_CHUNK_SIZE, CompressionCanceled, CompressionOptions,
+                          DocumentCompressor, ImageCache, MemoryBudget, create_process_pool,
+                          options_from_args, quality_value, size_value, ssim_value)
+
+DOCX_TYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+DEFAULT_MAX_UPLOAD = 1024 ** 3
+HEADER_LIMIT = 64 * 1024
+# 读取请求头和每块请求体的超时，防止慢速客户端长期占用名额
+HEADER_TIMEOUT = 30
+BODY_TIMEOUT = 60
+# 任务模式的结果保留时间，过期后删除
+RESULT_TTL = 3600
+CLEANUP_INTERVAL = 60
+RETRY_AFTER = 5
+
+class HttpError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class Request:
+    def __init__(self, method, path, query, headers, reader):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.reader = reader
+        # 响应已经开始发送后出错只能断开连接
+        self.responded = False
+
+class Job:
+    """一个压缩任务：上传的文档、输出文件、压缩器和状态
+
+    status 依次为 queued、running，最后为 done、failed 或 canceled。
+    """
+
+    def __init__(self, job_id, input_path, output_path, compressor, filename):
+        self.id = job_id
+        self.input_path = input_path
+        self.output_path = output_path
+        self.compressor = compressor
+        self.filename = filename
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.future = None
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        result = None
+        if self.result is not None:
+            result = {key: value for key, value in self.result.to_dict().items()
+                      if key not in ('input', 'output')}
+        return {'id': self.id, 'status': self.status, 'filename': self.filename,
+                'created': round(self.created, 3),
+                'finished': round(self.finished, 3) if self.finished else None,
+                'result': result, 'error': self.error}
+
+    def remove_files(self):
+        for path in (self.input_path, self.output_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+class CompressionService:
+    """基于 asyncio 的本地 HTTP 压缩服务
+
+    POST /compress 上传文档并在同一个响应中返回压缩后的文档；POST /jobs 上传后立即
+    返回任务编号，之后用 GET /jobs/<id> 查询状态、GET /jobs/<id>/result 下载结果、
+    DELETE /jobs/<id> 取消或删除。查询参数 quality、dpi、target_size、png_palette、
+    min_ssim、metadata、thumbnail、dedup 覆盖默认的压缩参数（png_palette=0 表示不做
+    调色板量化，min_ssim=0 表示保持原格式）。上传和下载都按块
+    在临时文件和连接之间传递，不在内存中保存整个文档。
+    正在上传、排队和压缩的任务总数达到 max_pending 时返回 429。
+    """
+
+    def __init__(self, options=None, workers=1, concurrency=1, max_pending=4,
+                 max_upload=DEFAULT_MAX_UPLOAD, spool_dir=None, cache=None, metrics=None,
+                 verify=True):
+        self.options = options or CompressionOptions()
+        self.workers = max(1, workers)
+        self.concurrency = max(1, concurrency)
+        self.max_pending = max(1, max_pending)
+        self.max_upload = max_upload
+        self.spool_dir = tempfile.mkdtemp(prefix='docoptimizer-', dir=spool_dir)
+        self.cache = cache
+        self.metrics = metrics
+        self.verify = verify
+        self.executor = create_process_pool(self.workers)
+        self.threads = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix='DocOptimizer-service')
+        self.memory = None
+        if self.options.memory_limit:
+            self.memory = MemoryBudget(self.options.memory_limit)
+        self.jobs = {}
+        # 同步压缩（POST /compress）的任务不在 jobs 中，关闭服务时也要取消
+        self.sync_jobs = set()
+        # 占用名额的请求数，只在事件循环线程中修改
+        self.active = 0
+        self.server = None
+        self.cleanup_task = None
+
+    async def start(self, host='127.0.0.1', port=8000):
+        self.server = await asyncio.start_server(self.handle, host, port, limit=HEADER_LIMIT)
+        self.cleanup_task = asyncio.ensure_future(self.cleanup())
+        return self.server
+
+    def shutdown(self):
+        """取消未完成的压缩，结束压缩线程和进程池
+
+        完成回调要投递到事件循环中，必须在事件循环关闭前调用；可以重复调用，也可以在
+        其他线程中调用。
+        """
+        task, self.cleanup_task = self.cleanup_task, None
+        if task is not None and not task.get_loop().is_closed():
+            task.get_loop().call_soon_threadsafe(task.cancel)
+        for job in list(self.jobs.values()) + list(self.sync_jobs):
+            job.compressor.canceled = True
+        self.threads.shutdown(wait=True, cancel_futures=True)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        """结束压缩并删除临时文件"""
+        self.shutdown()
+        shutil.rmtree(self.spool_dir, ignore_errors=True)
+
+    async def cleanup(self):
+        """定期删除过期的任务结果"""
+        while True:
+            await asyncio.sleep(CLEANUP_INTERVAL)
+            now = time.time()
+            for job in list(self.jobs.values()):
+                if job.finished and now - job.finished > RESULT_TTL:
+                    self.remove_job(job)
+
+    def remove_job(self, job):
+        self.jobs.pop(job.id, None)
+        job.remove_files()
+
+    async def handle(self, reader, writer):
+        request = None
+        try:
+            request = await asyncio.wait_for(self.read_request(reader), HEADER_TIMEOUT)
+            await self.dispatch(request, writer)
+        except HttpError as e:
+            if request is None or not request.responded:
+                await self.send_json(writer, e.status, {'error': e.message}, e.headers)
+        except asyncio.TimeoutError:
+            if request is None or not request.responded:
+                await self.send_json(writer, 408, {'error': "请求超时"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logging.exception(f"处理请求失败: {str(e)}")
+            if request is not None and not request.responded:
+                await self.send_json(writer, 500, {'error': str(e)})
+        finally:
+            try:
+                writer.close()
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def read_request(self, reader):
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "请求头过大")
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, _ = lines[0].split(' ', 2)
+        except ValueError:
+            raise HttpError(400, "无效的请求行")
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        return Request(method.upper(), urllib.parse.unquote(url.path), query, headers, reader)
+
+    async def dispatch(self, request, writer):
+        parts = [part for part in request.path.split('/') if part]
+        if request.method == 'GET' and parts in ([], ['health']):
+            await self.send_json(writer, 200, self.health(), request=request)
+        elif request.method == 'POST' and parts == ['compress']:
+            await self.compress_sync(request, writer)
+        elif request.method == 'POST' and parts == ['jobs']:
+            await self.compress_async(request, writer)
+        elif len(parts) in (2, 3) and parts[0] == 'jobs':
+            job = self.jobs.get(parts[1])
+            if job is None:
+                raise HttpError(404, "任务不存在")
+            if request.method == 'GET' and len(parts) == 2:
+                await self.send_json(writer, 200, job.to_dict(), request=request)
+            elif request.method == 'GET' and parts[2:] == ['result']:
+                if job.status in ('queued', 'running'):
+                    raise HttpError(409, "任务尚未完成", {'Retry-After': str(RETRY_AFTER)})
+                if job.status != 'done':
+                    raise HttpError(422, job.error or "压缩失败")
+                await self.send_result(request, writer, job)
+            elif request.method == 'DELETE' and len(parts) == 2:
+                job.compressor.canceled = True
+                if job.status in ('queued', 'running'):
+                    # 压缩结束后再删除文件
+                    job.status = 'canceled'
+                    job.future.add_done_callback(lambda future: self.remove_job(job))
+                else:
+                    self.remove_job(job)
+                await self.send_json(writer, 200, job.to_dict(), request=request)
+            else:
+                raise HttpError(405, "不支持的请求方法")
+        else:
+            raise HttpError(404, "路径不存在")
+
+    def health(self):
+        states = [job.status for job in self.jobs.values()]
+        return {'version': VERSION, 'active': self.active, 'capacity': self.max_pending,
+                'queued': states.count('queued'), 'running': states.count('running'),
+                'finished': len(states) - states.count('queued') - states.count('running')}
+
+    def request_options(self, query):
+        """在默认压缩参数上应用请求中的查询参数"""
+        options = copy.copy(self.options)
+        try:
+            if 'quality' in query:
+                options.quality = quality_value(query['quality'])
+            if 'dpi' in query:
+                options.dpi = int(query['dpi']) or None
+                if options.dpi is not None and options.dpi < 0:
+                    raise ValueError(f"无效的分辨率: {query['dpi']}")
+            if 'target_size' in query:
+                options.target_size = size_value(query['target_size']) or None
+            if 'png_palette' in query:
+                options.png_palette = float(query['png_palette']) or None
+            if 'min_ssim' in query:
+                options.min_ssim = (ssim_value(query['min_ssim'])
+                                    if float(query['min_ssim']) else None)
+            for name, choices in (('metadata', ('strip', 'keep')),
+                                  ('thumbnail', ('keep', 'shrink', 'remove'))):
+                if name in query:
+                    if query[name] not in choices:
+                        raise ValueError(f"无效的 {name}: {query[name]}")
+                    setattr(options, name, query[name])
+            if 'dedup' in query:
+                options.dedup = query['dedup'].lower() not in ('0', 'false', 'no', 'off')
+        except (ValueError, argparse.ArgumentTypeError) as e:
+            raise HttpError(400, str(e))
+        return options
+
+    def admit(self):
+        if self.active >= self.max_pending:
+            raise HttpError(429, "服务繁忙，请稍后重试", {'Retry-After': str(RETRY_AFTER)})
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+
+    async def receive_job(self, request, writer):
+        """接收上传的文档并创建任务，调用前必须已经占用名额"""
+        options = self.request_options(request.query)
+        length = request.headers.get('content-length')
+        if length is not None and not length.isdigit():
+            raise HttpError(400, "无效的 Content-Length")
+        chunked = 'chunked' in request.headers.get('transfer-encoding', '').lower()
+        if length is None and not chunked:
+            raise HttpError(411, "缺少 Content-Length")
+        if length is not None and not chunked and int(length) > self.max_upload:
+            raise HttpError(413, "上传的文档过大")
+        # 客户端等待 100 Continue 时，在被拒绝的情况下不会发送请求体
+        if request.headers.get('expect', '').lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+
+        job_id = secrets.token_hex(16)
+        input_path = os.path.join(self.spool_dir, f'{job_id}.docx')
+        output_path = os.path.join(self.spool_dir, f'{job_id}.out.docx')
+        size = 0
+        try:
+            with open(input_path, 'wb') as f:
+                chunks = (self.read_chunked(request.reader) if chunked else
+                          self.read_body(request.reader, int(length)))
+                async for chunk in chunks:
+                    size += len(chunk)
+                    if size > self.max_upload:
+                        raise HttpError(413, "上传的文档过大")
+                    f.write(chunk)
+            if not size:
+                raise HttpError(400, "上传的文档为空")
+        except BaseException:
+            try:
+                os.remove(input_path)
+            except OSError:
+                pass
+            raise
+
+        filename = os.path.basename(request.query.get('filename', '')) or 'document.docx'
+        compressor = DocumentCompressor(input_path, output_path, options, self.workers,
+                                        executor=self.executor, cache=self.cache,
+                                        metrics=self.metrics, memory=self.memory,
+                                        verify=self.verify)
+        job = Job(job_id, input_path, output_path, compressor, filename)
+        job.future = asyncio.get_running_loop().run_in_executor(self.threads, self.run_job, job)
+        return job
+
+    async def read_body(self, reader, length):
+        remaining = length
+        while remaining:
+            chunk = await asyncio.wait_for(reader.read(min(remaining, COPY_CHUNK_SIZE)),
+                                           BODY_TIMEOUT)
+            if not chunk:
+                raise HttpError(400, "请求体不完整")
+            remaining -= len(chunk)
+            yield chunk
+
+    async def read_chunked(self, reader):
+        while True:
+            line = await asyncio.wait_for(reader.readline(), BODY_TIMEOUT)
+            try:
+                size = int(line.split(b';', 1)[0], 16)
+            except ValueError:
+                raise HttpError(400, "无效的分块编码")
+            if not size:
+                # 跳过结尾的 trailer
+                while (await asyncio.wait_for(reader.readline(), BODY_TIMEOUT)).strip():
+                    pass
+                return
+            async for chunk in self.read_body(reader, size):
+                yield chunk
+            await asyncio.wait_for(reader.readexactly(2), BODY_TIMEOUT)
+
+    def run_job(self, job):
+        """在线程池中压缩文档"""
+        if job.compressor.canceled:
+            job.finished = time.time()
+            return
+        job.status = 'running'
+        try:
+            job.result = job.compressor.compress()
+        except CompressionCanceled as e:
+            job.status = 'canceled'
+            job.error = str(e)
+        except Exception as e:
+            logging.warning(f"文档压缩失败: {job.filename} - {str(e)}")
+            job.error = str(e)
+        if job.status != 'canceled':
+            job.status = 'done' if job.result is not None else 'failed'
+        job.finished = time.time()
+
+    async def compress_sync(self, request, writer):
+        self.admit()
+        job = None
+        try:
+            job = await self.receive_job(request, writer)
+            self.sync_jobs.add(job)
+            await job.future
+            if job.status != 'done':
+                raise HttpError(422, job.error or "压缩失败")
+            await self.send_result(request, writer, job)
+        finally:
+            if job is None or job.future.done():
+                if job is not None:
+                    self.sync_jobs.discard(job)
+                    job.remove_files()
+                self.release()
+            else:
+                # 请求被中断时压缩仍在线程中进行，结束后再清理
+                job.compressor.canceled = True
+                job.future.add_done_callback(lambda future: self.finish_sync(job))
+
+    def finish_sync(self, job):
+        self.sync_jobs.discard(job)
+        job.remove_files()
+        self.release()
+
+    async def compress_async(self, request, writer):
+        self.admit()
+        try:
+            job = await self.receive_job(request, writer)
+        except BaseException:
+            self.release()
+            raise
+        self.jobs[job.id] = job
+        # 任务模式的名额在压缩结束时释放，结果保留到被删除或过期
+        job.future.add_done_callback(lambda future: self.release())
+        location = f'/jobs/{job.id}'
+        await self.send_json(writer, 202, job.to_dict(), {'Location': location}, request)
+
+    async def send_result(self, request, writer, job):
+        result = job.result
+        stem, ext = os.path.splitext(job.filename)
+        filename = urllib.parse.quote(f'compressed_{stem}{ext or ".docx"}')
+        headers = {
+            'Content-Type': DOCX_TYPE,
+            'Content-Length': str(os.path.getsize(job.output_path)),
+            'Content-Disposition': f"attachment; filename*=UTF-8''{filename}",
+            'X-Original-Size': str(result.orig_size),
+            'X-Compressed-Size': str(result.comp_size),
+            'X-Compression-Ratio': f'{result.ratio:.2f}',
+        }
+        if result.chosen_quality is not None:
+            headers['X-Quality'] = str(result.chosen_quality)
+        self.send_head(writer, 200, headers, request)
+        with open(job.output_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                writer.write(chunk)
+                await writer.drain()
+
+    def send_head(self, writer, status, headers, request=None):
+        if request is not None:
+            request.responded = True
+        lines = [f'HTTP/1.1 {status} {http.HTTPStatus(status).phrase}',
+                 f'Server: DocOptimizer/{VERSION}', 'Connection: close']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    async def send_json(self, writer, status, data, headers=None, request=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_head(writer, status, dict(headers or {}, **{
+            'Content-Type': 'application/json; charset=utf-8',
+            'Content-Length': str(len(body))}), request)
+        writer.write(body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+def parse_address(text):
+    """解析 [HOST:]PORT，默认只监听本机"""
+    host, _, port = text.rpartition(':')
+    return host.strip('[]') or '127.0.0.1', int(port)
+
+async def serve(service, host, port):
+    server = await service.start(host, port)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stopping.set)
+            except (NotImplementedError, AttributeError, ValueError):
+                # Windows 上由 KeyboardInterrupt 结束
+                pass
+        address = ', '.join(f'{sock.getsockname()[0]}:{sock.getsockname()[1]}'
+                            for sock in server.sockets)
+        logging.info(f"压缩服务已启动: {address}")
+        print(f"压缩服务已启动: http://{address}/", flush=True)
+        await stopping.wait()
+    finally:
+        server.close()
+        # 在事件循环关闭前结束压缩线程和进程池，任务的完成回调仍能投递到循环中
+        await loop.run_in_executor(None, service.shutdown)
+
+def run_service(args, metrics=None):
+    """按命令行参数运行 HTTP 压缩服务，返回进程退出码"""
+    try:
+        host, port = parse_address(args.serve)
+    except ValueError:
+        print(f"无效的监听地址: {args.serve}", file=sys.stderr)
+        return 2
+    cache = None
+    if args.cache:
+        cache = ImageCache(args.cache, args.cache_size * 1024 ** 2)
+    options = options_from_args(args)
+    service = CompressionService(options, args.workers, args.jobs,
+                                 args.max_pending or max(1, args.jobs) * 2, args.max_upload,
+                                 args.spool_dir, cache, metrics, args.verify)
+    try:
+        asyncio.run(serve(service, host, port))
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"无法启动压缩服务: {str(e)}", file=sys.stderr)
+        return 2
+    finally:
+        service.close()
+    return 0
@@ -0,0 +1,383 @@
+"""DocOptimizer 性能基准
+
+离线生成可复现的合成 .docx 语料，在独立子进程中按不同配置运行压缩引擎，
+以 JSON 输出吞吐量、峰值内存、压缩率和各阶段耗时，并可与上次的结果比较。
+
+    python benchmark.py -o results.json
+    python benchmark.py --large --workers 1,4 --compare results.json
+    python benchmark.py --huge --cases huge --workers 4 --repeat 1 --verify
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import fnmatch
+import zipfile
+import argparse
+import platform
+import statistics
+import subprocess
+
+from PIL import Image, ImageDraw
+
+import DocOptimizer
+
+# 生成器行为变化时递增，使旧的语料重新生成
+CORPUS_VERSION = 1
+DEFAULT_CORPUS_DIR = os.path.join('bench', 'corpus')
+EMU_PER_INCH = 914400
+# 图片在文档中的显示宽度（英寸）
+DISPLAY_WIDTH = 6
+
+# 语料规格：名称、随机种子，以及 (图片类型, 数量, 宽, 高) 列表
+# duplicates 为重复引用已有图片数据的份数，embeddings 为嵌入对象的字节数列表，
+# paragraphs 为额外的正文段落数；large 标记的语料只在 --large 时生成，huge 标记的
+# 语料超过 4GB、需要 Zip64，只在 --huge 时生成
+CORPORA = (
+    {'name': 'photos', 'seed': 1, 'images': [('photo', 12, 1600, 1200)]},
+    {'name': 'screenshots', 'seed': 2, 'images': [('screenshot', 20, 1280, 800)]},
+    {'name': 'bitmaps', 'seed': 3, 'images': [('bitmap', 6, 1024, 768)]},
+    {'name': 'mixed', 'seed': 4,
+     'images': [('photo', 10, 2000, 1500), ('screenshot', 10, 1440, 900), ('bitmap', 4, 800, 600)]},
+    {'name': 'duplicates', 'seed': 5, 'duplicates': 40,
+     'images': [('photo', 4, 1200, 900), ('screenshot', 4, 1024, 768)]},
+    {'name': 'icons', 'seed': 6, 'images': [('screenshot', 300, 64, 64)]},
+    {'name': 'large-photos', 'seed': 7, 'large': True, 'images': [('photo', 60, 4000, 3000)]},
+    {'name': 'large-bitmaps', 'seed': 8, 'large': True, 'images': [('bitmap', 24, 3000, 2000)]},
+    {'name': 'huge', 'seed': 9, 'huge': True, 'images': [('photo', 300, 4000, 3000)],
+     'embeddings': [4608 * 1024 ** 2, 512 * 1024 ** 2], 'paragraphs': 200000},
+)
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Default Extension="bmp" ContentType="image/bmp"/>{defaults}'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>')
+ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>')
+IMAGE_RELATIONSHIP = ('<Relationship Id="rId{id}" Target="media/{name}" '
+                      'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"/>')
+EMBEDDING_RELATIONSHIP = ('<Relationship Id="rId{id}" Target="embeddings/{name}" '
+                          'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/oleObject"/>')
+EMBEDDING_CONTENT_TYPE = ('<Default Extension="bin" '
+                          'ContentType="application/vnd.openxmlformats-officedocument.oleObject"/>')
+DRAWING = ('<w:p><w:r><w:drawing><wp:inline><wp:extent cx="{cx}" cy="{cy}"/>'
+           '<wp:docPr id="{id}" name="Picture {id}"/><a:graphic><a:graphicData '
+           'uri="http://schemas.openxmlformats.org/drawingml/2006/picture"><pic:pic>'
+           '<pic:blipFill><a:blip r:embed="rId{id}"/></pic:blipFill>'
+           '<pic:spPr><a:xfrm><a:ext cx="{cx}" cy="{cy}"/></a:xfrm></pic:spPr>'
+           '</pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing></w:r></w:p>')
+DOCUMENT = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<w:body>{body}</w:body></w:document>')
+PARAGRAPH = '<w:p><w:r><w:t>{text}</w:t></w:r></w:p>'
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consectetur', 'adipiscing', 'elit',
+         'sed', 'do', 'eiusmod', 'tempor', 'incididunt', 'ut', 'labore', 'magna')
+
+def photo_image(rng, width, height):
+    """类似照片的图片：平滑的大尺度色彩变化叠加细微噪点"""
+    small = (max(2, width // 64), max(2, height // 64))
+    base = Image.frombytes('RGB', small, rng.randbytes(small[0] * small[1] * 3))
+    base = base.resize((width, height), Image.BICUBIC)
+    grain = Image.frombytes('L', (width, height), rng.randbytes(width * height))
+    return Image.blend(base, grain.convert('RGB'), 0.12)
+
+def screenshot_image(rng, width, height):
+    """类似屏幕截图的图片：大面积纯色、窗口边框和成行的文字块"""
+    img = Image.new('RGB', (width, height), (250, 250, 250))
+    draw = ImageDraw.Draw(img)
+    accent = tuple(rng.randrange(40, 200) for _ in range(3))
+    draw.rectangle((0, 0, width, max(4, height // 16)), fill=accent)
+    sidebar = width // 5
+    draw.rectangle((0, height // 16, sidebar, height), fill=(236, 238, 242))
+    line_height = max(3, height // 40)
+    for top in range(height // 10, height - line_height, line_height * 2):
+        left = sidebar + line_height
+        while left < width - line_height:
+            word = rng.randrange(2, 12) * line_height // 2
+            draw.rectangle((left, top, min(width, left + word), top + line_height // 2 + 1),
+                           fill=(60, 60, 60))
+            left += word + line_height
+    # 截图中通常还有一小块照片或图表
+    if width >= 256 and height >= 256:
+        inset = (width // 4, height // 4)
+        img.paste(photo_image(rng, *inset), (width - inset[0] - line_height, height // 8))
+    return img
+
+def bitmap_image(rng, width, height):
+    """未压缩的 BMP，内容一半照片一半截图"""
+    img = photo_image(rng, width, height)
+    img.paste(screenshot_image(rng, width // 2, height), (width // 2, 0))
+    return img
+
+GENERATORS = {
+    'photo': (photo_image, '.jpeg', {'format': 'JPEG', 'quality': 95}),
+    'screenshot': (screenshot_image, '.png', {'format': 'PNG'}),
+    'bitmap': (bitmap_image, '.bmp', {'format': 'BMP'}),
+}
+
+def corpus_path(directory, spec):
+    return os.path.join(directory, f"{spec['name']}-v{CORPUS_VERSION}.docx")
+
+def build_corpus(path, spec):
+    """按规格生成一个合成文档；同一规格总是生成相同的内容"""
+    rng = random.Random(spec['seed'])
+    media = []
+    for kind, count, width, height in spec['images']:
+        generate, ext, save_args = GENERATORS[kind]
+        for _ in range(count):
+            out = io.BytesIO()
+            generate(rng, width, height).save(out, **save_args)
+            media.append((f'image{len(media) + 1}{ext}', out.getvalue(), (width, height)))
+    unique = len(media)
+    for _ in range(spec.get('duplicates', 0)):
+        name, data, size = media[rng.randrange(unique)]
+        media.append((f'image{len(media) + 1}{os.path.splitext(name)[1]}', data, size))
+
+    rels = []
+    body = []
+    for number, (name, _, (width, height)) in enumerate(media, 1):
+        cx = DISPLAY_WIDTH * EMU_PER_INCH
+        rels.append(IMAGE_RELATIONSHIP.format(id=number, name=name))
+        body.append(DRAWING.format(id=number, cx=cx, cy=cx * height // width))
+        body.append(PARAGRAPH.format(text=' '.join(rng.choice(WORDS) for _ in range(80))))
+    embeddings = [(f'oleObject{number}.bin', size)
+                  for number, size in enumerate(spec.get('embeddings', ()), 1)]
+    for number, (name, _) in enumerate(embeddings, len(media) + 1):
+        rels.append(EMBEDDING_RELATIONSHIP.format(id=number, name=name))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    temp_path = path + '.tmp'
+    with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr('[Content_Types].xml', CONTENT_TYPES.format(
+            defaults=EMBEDDING_CONTENT_TYPE if embeddings else ''))
+        zipf.writestr('_rels/.rels', ROOT_RELS)
+        # 正文和嵌入对象分块写入，生成的大文档不需要整个放在内存中
+        head, tail = DOCUMENT.split('{body}')
+        with zipf.open('word/document.xml', 'w') as stream:
+            stream.write(head.encode('utf-8'))
+            for part in body:
+                stream.write(part.encode('utf-8'))
+            for _ in range(spec.get('paragraphs', 0)):
+                text = ' '.join(rng.choice(WORDS) for _ in range(80))
+                stream.write(PARAGRAPH.format(text=text).encode('utf-8'))
+            stream.write(tail.encode('utf-8'))
+        zipf.writestr('word/_rels/document.xml.rels',
+                      '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                      '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                      + ''.join(rels) + '</Relationships>')
+        for name, data, _ in media:
+            zipf.writestr('word/media/' + name, data)
+        # 嵌入对象是随机数据，按原样存储，超过 4GB 时写入 Zip64 记录
+        for name, size in embeddings:
+            info = zipfile.ZipInfo('word/embeddings/' + name)
+            with zipf.open(info, 'w', force_zip64=size > zipfile.ZIP64_LIMIT) as stream:
+                for offset in range(0, size, DocOptimizer.COPY_CHUNK_SIZE):
+                    stream.write(rng.randbytes(min(DocOptimizer.COPY_CHUNK_SIZE, size - offset)))
+    os.replace(temp_path, path)
+
+def ensure_corpus(directory, specs):
+    """生成缺少的语料文件，返回 [(规格, 路径)]"""
+    corpus = []
+    for spec in specs:
+        path = os.path.abspath(corpus_path(directory, spec))
+        if not os.path.exists(path):
+            print(f"生成语料 {spec['name']} ...", file=sys.stderr)
+            build_corpus(path, spec)
+        corpus.append((spec, path))
+    return corpus
+
+def peak_rss():
+    """本进程和已结束子进程各自的峰值常驻内存（MB），平台不支持时为 None"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # Linux 上单位为 KB，macOS 上为字节
+    unit = 1 if sys.platform == 'darwin' else 1024
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    # Linux 的 ru_maxrss 会跨 exec 继承父进程的峰值，VmHWM 只统计本进程
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    rss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return (rss / 1024 ** 2,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 1024 ** 2)
+
+def run_one(path, config):
+    """在当前进程中压缩一次，返回测量结果"""
+    events = []
+    metrics = DocOptimizer.Metrics(events.append)
+    options = DocOptimizer.CompressionOptions(quality=config['quality'], dpi=config['dpi'])
+    output_path = path + '.out.docx'
+    with zipfile.ZipFile(path) as src:
+        images = sum(1 for info in src.infolist() if DocOptimizer.is_image_entry(info))
+
+    start = time.perf_counter()
+    result = DocOptimizer.compress_document(path, output_path, options, config['workers'],
+                                            metrics=metrics)
+    elapsed = time.perf_counter() - start
+    # 校验输出中每个条目的 CRC，不计入耗时
+    if config.get('verify'):
+        with zipfile.ZipFile(output_path) as zipf:
+            bad = zipf.testzip()
+        if bad is not None:
+            raise zipfile.BadZipFile(f"输出条目 CRC 校验失败: {bad}")
+    os.remove(output_path)
+
+    # 引擎在文档完成时发出的事件中带有各阶段累计耗时
+    stages = next(event['stages'] for event in events if event['event'] == 'document')
+    rss, worker_rss = peak_rss()
+    megabytes = result.orig_size / 1024 ** 2
+    return {
+        'input_bytes': result.orig_size,
+        'output_bytes': result.comp_size,
+        'ratio': round(result.ratio, 2),
+        'images': images,
+        'seconds': round(elapsed, 4),
+        'mb_per_s': round(megabytes / elapsed, 3),
+        'images_per_s': round(images / elapsed, 3),
+        'peak_rss_mb': rss and round(rss, 1),
+        'peak_worker_rss_mb': worker_rss and round(worker_rss, 1),
+        'stages': {name: round(value, 4) for name, value in sorted(stages.items())},
+    }
+
+def run_isolated(path, config):
+    """在新的子进程中运行一次，使峰值内存互不影响"""
+    command = [sys.executable, os.path.abspath(__file__), '--run-one', path,
+               '--config', json.dumps(config)]
+    completed = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+    return json.loads(completed.stdout)
+
+def median_run(runs):
+    """多次运行中取耗时中位数的一次，吞吐量按它计算"""
+    runs = sorted(runs, key=lambda run: run['seconds'])
+    run = dict(runs[len(runs) // 2])
+    run['runs'] = len(runs)
+    run['seconds_min'] = runs[0]['seconds']
+    run['seconds_stdev'] = round(statistics.pstdev(r['seconds'] for r in runs), 4)
+    return run
+
+def case_key(case):
+    config = case['config']
+    return f"{case['corpus']}/w{config['workers']}/q{config['quality']}/dpi{config['dpi'] or 0}"
+
+def compare(results, baseline, threshold):
+    """与基准结果比较，打印变化并返回退化的用例数"""
+    if baseline.get('corpus_version') != results['corpus_version']:
+        print("语料版本不同，结果不可比较", file=sys.stderr)
+        return 0
+    previous = {case_key(case): case for case in baseline['results']}
+    regressions = 0
+    for case in results['results']:
+        old = previous.get(case_key(case))
+        if old is None:
+            continue
+        speed = (case['mb_per_s'] - old['mb_per_s']) / old['mb_per_s'] * 100
+        size = (case['output_bytes'] - old['output_bytes']) / max(1, old['output_bytes']) * 100
+        flags = []
+        if speed < -threshold:
+            flags.append('变慢')
+        if size > threshold / 10:
+            flags.append('变大')
+        regressions += bool(flags)
+        print(f"{case_key(case):40} 速度 {speed:+6.1f}%  大小 {size:+6.2f}%  {' '.join(flags)}",
+              file=sys.stderr)
+    return regressions
+
+def int_list(text):
+    return [int(value) for value in text.split(',') if value]
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="DocOptimizer 性能基准")
+    parser.add_argument('--corpus-dir', default=DEFAULT_CORPUS_DIR, help="语料目录，默认 bench/corpus")
+    parser.add_argument('--large', action='store_true', help="包含数百 MB 的大文档")
+    parser.add_argument('--huge', action='store_true',
+                        help="包含超过 4GB、需要 Zip64 的文档（生成和运行需要约 12GB 磁盘空间）")
+    parser.add_argument('--verify', action='store_true', help="每次运行后校验输出文档的 CRC")
+    parser.add_argument('--cases', default='*', help="只运行名称匹配该模式的语料")
+    parser.add_argument('--workers', type=int_list, default=[1, os.cpu_count() or 1],
+                        help="逗号分隔的图片进程数，默认 1 和 CPU 核数")
+    parser.add_argument('-q', '--quality', type=int_list, default=[75], help="逗号分隔的 JPEG 质量")
+    parser.add_argument('--dpi', type=int_list, default=[0], help="逗号分隔的目标 DPI，0 表示不缩放")
+    parser.add_argument('--repeat', type=int, default=3, help="每个配置运行的次数，取耗时中位数")
+    parser.add_argument('-o', '--output', help="把结果写入 JSON 文件")
+    parser.add_argument('--compare', metavar='JSON', help="与之前的结果比较，有退化时退出码为 1")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="判定变慢的吞吐量下降百分比，默认 10")
+    parser.add_argument('--generate-only', action='store_true', help="只生成语料")
+    parser.add_argument('--run-one', metavar='DOCX', help=argparse.SUPPRESS)
+    parser.add_argument('--config', help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.run_one:
+        print(json.dumps(run_one(args.run_one, json.loads(args.config))))
+        return 0
+
+    specs = [spec for spec in CORPORA
+             if (args.large or not spec.get('large')) and (args.huge or not spec.get('huge'))
+             and fnmatch.fnmatch(spec['name'], args.cases)]
+    corpus = ensure_corpus(args.corpus_dir, specs)
+    if args.generate_only:
+        return 0
+
+    results = {
+        'version': DocOptimizer.VERSION,
+        'corpus_version': CORPUS_VERSION,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': [],
+    }
+    for spec, path in corpus:
+        for workers in args.workers:
+            for quality in args.quality:
+                for dpi in args.dpi:
+                    config = {'workers': workers, 'quality': quality, 'dpi': dpi or None}
+                    if args.verify:
+                        config['verify'] = True
+                    runs = [run_isolated(path, config) for _ in range(max(1, args.repeat))]
+                    case = {'corpus': spec['name'], 'config': config, **median_run(runs)}
+                    results['results'].append(case)
+                    print(f"{case_key(case):40} {case['mb_per_s']:8.2f} MB/s "
+                          f"{case['images_per_s']:8.2f} 图片/s  压缩率 {case['ratio']:5.1f}%  "
+                          f"峰值内存 {case['peak_rss_mb']} MB", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+from PIL import Image
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '<Default Extension="bin" ContentType="application/vnd.openxmlformats-officedocument.oleObject"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>')
+PACKAGE_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="word/document.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>')
+DOCUMENT = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:body><w:p><w:r><w:t>Zip64</w:t></w:r></w:p></w:body></w:document>')
+DOCUMENT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="media/image1.jpeg" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"/>'
+    '<Relationship Id="rId2" Target="embeddings/oleObject1.bin" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/oleObject"/>'
+    '</Relationships>')
+
+
+def noise_jpeg(size=(256, 192), quality=95):
+    """随机噪声 JPEG，按默认质量重新编码后总会变小"""
+    img = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=quality)
+    return out.getvalue()
+
+
+def document_parts():
+    """最小的可用文档：正文引用一张图片和一个嵌入对象，{部件名: 数据}"""
+    return {
+        '[Content_Types].xml': CONTENT_TYPES,
+        '_rels/.rels': PACKAGE_RELS,
+        'word/document.xml': DOCUMENT,
+        'word/_rels/document.xml.rels': DOCUMENT_RELS,
+        'word/media/image1.jpeg': noise_jpeg(),
+        'word/embeddings/oleObject1.bin': b'\0' * 1024,
+    }
+
+
+@pytest.fixture
+def make_document(tmp_path):
+    """按 {部件名: 数据} 写出文档，默认为 document_parts()，返回路径"""
+    def make(parts=None, name='input.docx'):
+        path = tmp_path / name
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+            for part, data in (document_parts() if parts is None else parts).items():
+                zipf.writestr(part, data)
+        return str(path)
+    return make
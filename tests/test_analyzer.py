@@ -0,0 +1,40 @@
+import os
+import zipfile
+
+from DocOptimizer import PROBE_LIMIT, compress_document, read_header_data
+from DocOptimizerAnalyzer import analyze_documents
+from conftest import document_parts, noise_jpeg
+
+
+def test_read_header_data_stops_at_probe_limit(make_document):
+    parts = document_parts()
+    parts['word/media/image2.png'] = os.urandom(PROBE_LIMIT * 2)
+    with zipfile.ZipFile(make_document(parts)) as src:
+        header, data = read_header_data(src, src.getinfo('word/media/image1.jpeg'))
+        assert (header.format, header.width, header.height) == ('JPEG', 256, 192)
+        assert data == src.read('word/media/image1.jpeg')[:len(data)]
+        # 无法识别的条目最多读取 PROBE_LIMIT 字节
+        header, data = read_header_data(src, src.getinfo('word/media/image2.png'))
+        assert header is None and len(data) == PROBE_LIMIT
+
+
+def test_analyze_documents_ranks_by_estimated_savings(make_document, tmp_path):
+    small = make_document(name='small.docx')
+    parts = document_parts()
+    parts['word/media/image1.jpeg'] = noise_jpeg((640, 480))
+    large = make_document(parts, 'large.docx')
+    before = sorted(os.listdir(tmp_path))
+
+    records = analyze_documents([small, large])
+    assert [record['path'] for record in records] == [large, small]
+    assert [record['rank'] for record in records] == [1, 2]
+    assert sorted(os.listdir(tmp_path)) == before
+    for record in records:
+        assert record['error'] is None
+        assert record['images'] == record['jpeg'] == 1
+        # 估计值与实际压缩结果的误差在 20% 以内
+        output = str(tmp_path / 'output.docx')
+        actual = compress_document(record['path'], output).comp_size
+        os.remove(output)
+        assert record['estimated_savings'] > 0
+        assert abs(record['estimated_size'] - actual) < 0.2 * actual
@@ -0,0 +1,31 @@
+import os
+
+from DocOptimizer import compress_batch
+from conftest import document_parts, noise_jpeg
+
+
+def test_compress_batch_schedules_largest_first(make_document, tmp_path):
+    jobs = []
+    for name, size in (('small', (128, 96)), ('large', (640, 480)), ('medium', (320, 240))):
+        parts = document_parts()
+        parts['word/media/image1.jpeg'] = noise_jpeg(size)
+        jobs.append((make_document(parts, f'{name}.docx'), str(tmp_path / f'out-{name}.docx')))
+    broken = tmp_path / 'broken.docx'
+    broken.write_bytes(b'not a zip')
+    jobs.append((str(broken), str(tmp_path / 'out-broken.docx')))
+
+    finished = []
+    results = compress_batch(jobs, on_result=lambda result: finished.append(result.input_path))
+    # 结果与 jobs 顺序一致，失败的文档不影响其他文档
+    assert [result.input_path for result in results] == [job[0] for job in jobs]
+    assert [result.success for result in results] == [True, True, True, False]
+    assert results[3].error and not os.path.exists(jobs[3][1])
+    for result in results[:3]:
+        assert result.verified and result.comp_size < result.orig_size
+    # 单线程时按文件大小从大到小执行
+    assert finished == [jobs[1][0], jobs[2][0], jobs[0][0], jobs[3][0]]
+
+    # 多个文档同时压缩，共用同一个进程池
+    concurrent = compress_batch([(job[0], str(tmp_path / f'concurrent-{i}.docx'))
+                                 for i, job in enumerate(jobs[:3])], workers=2, concurrency=3)
+    assert all(result.verified for result in concurrent)
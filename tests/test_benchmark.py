@@ -0,0 +1,44 @@
+import zipfile
+
+import benchmark
+from DocOptimizer import verify_document
+
+TINY = {'name': 'tiny', 'seed': 1, 'duplicates': 1,
+        'images': [('photo', 1, 160, 120), ('screenshot', 1, 160, 100), ('bitmap', 1, 64, 48)]}
+
+
+def contents(path):
+    with zipfile.ZipFile(path) as zipf:
+        return {name: zipf.read(name) for name in zipf.namelist()}
+
+
+def test_build_corpus_is_deterministic(tmp_path):
+    first, second = str(tmp_path / 'first.docx'), str(tmp_path / 'second.docx')
+    benchmark.build_corpus(first, TINY)
+    benchmark.build_corpus(second, TINY)
+    parts = contents(first)
+    assert parts == contents(second)
+    media = {name: data for name, data in parts.items() if name.startswith('word/media/')}
+    assert sorted(media)[:3] == ['word/media/image1.jpeg', 'word/media/image2.png',
+                                 'word/media/image3.bmp']
+    # 重复的图片与已有的某张图片内容相同
+    duplicate = next(data for name, data in media.items() if name.startswith('word/media/image4'))
+    assert len(media) == 4 and list(media.values()).count(duplicate) == 2
+    assert verify_document(first) == []
+
+
+def test_run_one_and_compare(tmp_path, capsys):
+    path = str(tmp_path / 'tiny.docx')
+    benchmark.build_corpus(path, TINY)
+    config = {'workers': 1, 'quality': 75, 'dpi': 0, 'verify': True}
+    run = benchmark.run_one(path, config)
+    assert run['images'] == 4 and run['output_bytes'] < run['input_bytes']
+    assert run['seconds'] > 0 and 'write' in run['stages']
+
+    case = {'corpus': 'tiny', 'config': config, **run}
+    baseline = {'corpus_version': benchmark.CORPUS_VERSION, 'results': [case]}
+    slower = dict(case, mb_per_s=case['mb_per_s'] / 2)
+    larger = dict(case, output_bytes=case['output_bytes'] * 2)
+    assert benchmark.compare({**baseline, 'results': [case]}, baseline, 10) == 0
+    assert benchmark.compare({**baseline, 'results': [slower, larger]}, baseline, 10) == 2
+    assert '变慢' in capsys.readouterr().err
@@ -0,0 +1,41 @@
+import time
+import zipfile
+
+from DocOptimizer import ImageCache, compress_document
+
+
+def test_second_run_reuses_cached_images(make_document, tmp_path):
+    source = make_document()
+    cache = ImageCache(str(tmp_path / 'cache'))
+    first = compress_document(source, str(tmp_path / 'first.docx'), cache=cache)
+    assert (first.cache_hits, first.cache_misses) == (0, 1)
+
+    # 新的实例从磁盘上的缓存读取，结果与第一次完全相同
+    cache = ImageCache(str(tmp_path / 'cache'))
+    second = compress_document(source, str(tmp_path / 'second.docx'), cache=cache)
+    assert (second.cache_hits, second.cache_misses) == (1, 0)
+    assert second.verified
+    with zipfile.ZipFile(first.output_path) as a, zipfile.ZipFile(second.output_path) as b:
+        name = 'word/media/image1.jpeg'
+        assert a.read(name) == b.read(name)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = ImageCache(str(tmp_path), max_size=10)
+    keys = [ImageCache.make_key(data, ('.png', 75)) for data in (b'a', b'b', b'c')]
+    cache.put(keys[0], b'aaaa')
+    time.sleep(0.01)
+    cache.put(keys[1], b'bbbb')
+    time.sleep(0.01)
+    # 读取使第一项成为最近使用的，超出上限时淘汰第二项
+    assert cache.get(keys[0]) == b'aaaa'
+    time.sleep(0.01)
+    cache.put(keys[2], b'cccc')
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == b'aaaa' and cache.get(keys[2]) == b'cccc'
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'evictions': 1}
+
+    # 参数不同时键也不同
+    assert ImageCache.make_key(b'a', ('.png', 75)) != ImageCache.make_key(b'a', ('.png', 50))
+    # 上限变小时打开缓存即淘汰
+    assert ImageCache(str(tmp_path), max_size=4).stats()['evictions'] == 1
@@ -0,0 +1,60 @@
+import os
+import threading
+import time
+
+import pytest
+
+import DocOptimizer
+from DocOptimizer import (CompressionCanceled, DocumentCompressor, atomic_output,
+                          check_canceled)
+
+
+def test_atomic_output_replaces_only_on_success(tmp_path):
+    path = tmp_path / 'output.docx'
+    path.write_bytes(b'old')
+    with pytest.raises(RuntimeError):
+        with atomic_output(str(path)) as temp_path:
+            with open(temp_path, 'wb') as f:
+                f.write(b'partial')
+            raise RuntimeError('failed')
+    assert path.read_bytes() == b'old'
+    assert os.listdir(tmp_path) == ['output.docx']
+
+    with atomic_output(str(path)) as temp_path:
+        assert os.path.dirname(temp_path) == str(tmp_path)
+        with open(temp_path, 'wb') as f:
+            f.write(b'new')
+    assert path.read_bytes() == b'new'
+    assert os.listdir(tmp_path) == ['output.docx']
+
+
+def test_cancel_stops_running_image_and_keeps_output(make_document, tmp_path, monkeypatch):
+    started = threading.Event()
+
+    def endless(data, *settings):
+        # 只有检查点能让任务停下来
+        started.set()
+        while True:
+            check_canceled()
+            time.sleep(0.01)
+
+    monkeypatch.setattr(DocOptimizer, 'recompress_image_timed', endless)
+    source = make_document()
+    output = tmp_path / 'output.docx'
+    output.write_bytes(b'previous output')
+    compressor = DocumentCompressor(source, str(output))
+
+    def cancel():
+        started.wait(10)
+        compressor.canceled = True
+
+    thread = threading.Thread(target=cancel)
+    thread.start()
+    start = time.perf_counter()
+    with pytest.raises(CompressionCanceled):
+        compressor.compress()
+    thread.join()
+    assert time.perf_counter() - start < 5
+    # 已有的输出保持原样，也不会留下临时文件
+    assert output.read_bytes() == b'previous output'
+    assert sorted(os.listdir(tmp_path)) == ['input.docx', 'output.docx']
@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = '''
+import sys
+# 导入 PyQt5 时直接失败
+sys.modules['PyQt5'] = None
+import DocOptimizer
+code = DocOptimizer.main(sys.argv[1:])
+assert not any(name.startswith('PyQt5') for name in sys.modules if sys.modules[name] is not None)
+sys.exit(code)
+'''
+
+
+def test_cli_never_imports_pyqt5(make_document, tmp_path):
+    source = make_document()
+    output_dir = tmp_path / 'out'
+    env = dict(os.environ, PYTHONPATH=REPO)
+    process = subprocess.run(
+        [sys.executable, '-c', SCRIPT, source, '-o', str(output_dir), '-w', '1', '--log', '-'],
+        cwd=str(tmp_path), env=env, capture_output=True, text=True, timeout=60)
+    assert process.returncode == 0, process.stderr
+    output = output_dir / 'compressed_input.docx'
+    assert 0 < output.stat().st_size < os.path.getsize(source)
+
+    # 参数错误和没有文档时返回 2，同样不需要 PyQt5
+    process = subprocess.run([sys.executable, '-c', SCRIPT, str(tmp_path / 'missing')],
+                             cwd=str(tmp_path), env=env, capture_output=True, text=True,
+                             timeout=60)
+    assert process.returncode == 2
@@ -0,0 +1,68 @@
+import os
+import shutil
+import threading
+import time
+
+import DocOptimizerDaemon
+from DocOptimizerDaemon import JobQueue, WatchDaemon
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_daemon_compresses_each_version_once(make_document, tmp_path):
+    source = make_document()
+    inbox, outbox = tmp_path / 'in', tmp_path / 'out'
+    inbox.mkdir()
+    queue_path = str(tmp_path / 'queue.sqlite')
+
+    def run_daemon(until):
+        daemon = WatchDaemon([str(inbox)], str(outbox), JobQueue(queue_path), settle=0.1,
+                             poll_interval=0.1, polling=True)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            wait_for(lambda: until(daemon.queue.counts()))
+            time.sleep(0.5)
+            return daemon.queue.counts()
+        finally:
+            daemon.stop()
+            thread.join()
+
+    shutil.copy(source, inbox / 'report.docx')
+    counts = run_daemon(lambda counts: counts['done'] == 1)
+    assert counts == {'pending': 0, 'running': 0, 'done': 1, 'failed': 0}
+    output = outbox / 'compressed_report.docx'
+    assert output.stat().st_size < os.path.getsize(source)
+
+    # 重启后同一版本不再入队，修改后的文件作为新版本再压缩一次
+    os.remove(output)
+    counts = run_daemon(lambda counts: True)
+    assert counts['done'] == 1 and not output.exists()
+    shutil.copy(source, inbox / 'report.docx')
+    os.utime(inbox / 'report.docx', (time.time() + 10, time.time() + 10))
+    counts = run_daemon(lambda counts: counts['done'] == 2)
+    assert output.exists()
+
+
+def test_process_finishes_job_stopped_after_completion(make_document, tmp_path, monkeypatch):
+    source = make_document()
+    queue = JobQueue(str(tmp_path / 'queue.sqlite'))
+    queue.put(source, str(tmp_path / 'output.docx'), 1, 1)
+    daemon = WatchDaemon([str(tmp_path)], None, queue)
+    run_compressor = DocOptimizerDaemon.run_compressor
+
+    def stopped_late(compressor):
+        # stop() 在压缩刚完成、结果还没记录时取消压缩器
+        result = run_compressor(compressor)
+        compressor.canceled = True
+        return result
+
+    monkeypatch.setattr(DocOptimizerDaemon, 'run_compressor', stopped_late)
+    daemon.process(queue.claim(), None, None)
+    assert queue.counts() == {'pending': 0, 'running': 0, 'done': 1, 'failed': 0}
+    assert queue.claim() is None
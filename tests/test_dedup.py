@@ -0,0 +1,55 @@
+import zipfile
+
+import DocOptimizer
+from DocOptimizer import CompressionOptions, compress_document, find_duplicate_media
+from conftest import DOCUMENT_RELS, document_parts, noise_jpeg
+
+
+def duplicate_parts():
+    """image2 与 image1 内容相同，image3 不同"""
+    parts = document_parts()
+    parts['word/_rels/document.xml.rels'] = DOCUMENT_RELS.replace('</Relationships>', ''.join(
+        f'<Relationship Id="rId{i}" Target="media/image{i}.jpeg" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"/>'
+        for i in (3, 4)) + '</Relationships>')
+    parts['word/media/image3.jpeg'] = parts['word/media/image1.jpeg']
+    parts['word/media/image4.jpeg'] = noise_jpeg()
+    return parts
+
+
+def test_find_duplicate_media_hashes_only_candidates(make_document, monkeypatch):
+    hashed = []
+    read_chunks = DocOptimizer.read_chunks
+
+    def recording(src, info):
+        hashed.append(info.filename)
+        return read_chunks(src, info)
+
+    monkeypatch.setattr(DocOptimizer, 'read_chunks', recording)
+    with zipfile.ZipFile(make_document(duplicate_parts())) as src:
+        duplicates = find_duplicate_media(src, src.infolist())
+    assert duplicates == {'word/media/image3.jpeg': 'word/media/image1.jpeg'}
+    # 大小和 CRC 不同的部件不需要计算哈希
+    assert sorted(hashed) == ['word/media/image1.jpeg', 'word/media/image3.jpeg']
+
+
+def test_duplicates_share_one_part(make_document, tmp_path):
+    source = make_document(duplicate_parts())
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(source, output)
+    assert result.verified and result.duplicates == 1
+
+    with zipfile.ZipFile(output) as dst:
+        names = dst.namelist()
+        assert 'word/media/image3.jpeg' not in names
+        assert {'word/media/image1.jpeg', 'word/media/image4.jpeg'} <= set(names)
+        rels = dst.read('word/_rels/document.xml.rels').decode('utf-8')
+    # 指向重复部件的关系改为指向保留的部件
+    assert 'media/image3.jpeg' not in rels
+    assert rels.count('Target="media/image1.jpeg"') == 2
+
+    result = compress_document(source, str(tmp_path / 'kept.docx'),
+                               CompressionOptions(dedup=False))
+    assert result.duplicates == 0
+    with zipfile.ZipFile(result.output_path) as dst:
+        assert 'word/media/image3.jpeg' in dst.namelist()
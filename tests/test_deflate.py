@@ -0,0 +1,104 @@
+import concurrent.futures
+import io
+import os
+import zipfile
+import zlib
+
+import pytest
+
+import DocOptimizer
+from DocOptimizer import CompressionOptions, compress_document, deflate_part
+from conftest import DOCUMENT, document_parts
+
+
+@pytest.mark.parametrize('level', [1, 6, 'max'])
+def test_deflate_part_round_trip(level):
+    data = b''.join(b'<w:p><w:t>%d</w:t></w:p>' % number for number in range(50000))
+    stream = io.BytesIO(data)
+    out, size, crc, seconds = deflate_part(stream, level)
+    with out:
+        compressed = out.read()
+    assert stream.closed
+    assert len(compressed) == size < len(data)
+    assert crc == zlib.crc32(data)
+    assert zlib.decompress(compressed, -zlib.MAX_WBITS) == data
+    assert seconds >= 0
+
+
+def test_deflate_part_max_is_smallest():
+    data = bytes(range(256)) * 4096 + b'abcabcabd' * 100000
+    sizes = {}
+    for level in (1, 9, 'max'):
+        out, sizes[level], _, _ = deflate_part(io.BytesIO(data), level)
+        out.close()
+    assert sizes['max'] <= sizes[9] <= sizes[1]
+
+
+def test_deflate_part_spills_to_spool_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(DocOptimizer, 'STREAM_ENTRY_SIZE', 1024)
+    data = os.urandom(64 * 1024)
+    out, size, crc, _ = deflate_part(io.BytesIO(data), 6, str(tmp_path))
+    with out:
+        assert out._rolled
+        # 临时文件创建后随即删除，只能通过打开的描述符确认它位于 spool_dir 中
+        link = f'/proc/self/fd/{out.fileno()}'
+        if os.path.exists(link):
+            assert os.readlink(link).startswith(str(tmp_path))
+        assert zlib.decompress(out.read(), -zlib.MAX_WBITS) == data
+    assert crc == zlib.crc32(data)
+    assert not os.listdir(tmp_path)
+
+
+def test_deflate_part_closes_outputs_when_canceled():
+    class Stream(io.BytesIO):
+        def read(self, size=-1):
+            raise DocOptimizer.CompressionCanceled('canceled')
+
+    stream = Stream(b'data')
+    with pytest.raises(DocOptimizer.CompressionCanceled):
+        deflate_part(stream, 'max')
+    assert stream.closed
+
+
+def xml_document(tmp_path):
+    """正文很大、按最低级别压缩的文档"""
+    parts = document_parts()
+    paragraph = '<w:p><w:r><w:t>%d 段落的文字内容</w:t></w:r></w:p>'
+    body = ''.join(paragraph % number for number in range(20000))
+    parts['word/document.xml'] = DOCUMENT.replace('<w:body>', '<w:body>' + body)
+    path = str(tmp_path / 'input.docx')
+    with zipfile.ZipFile(path, 'w') as zipf:
+        for name, data in parts.items():
+            zipf.writestr(name, data, zipfile.ZIP_DEFLATED, 1)
+    return path
+
+
+def test_xml_level_redeflates_parts(tmp_path):
+    source = xml_document(tmp_path)
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(source, output, CompressionOptions(xml_level='max'))
+    assert result.verified
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(output) as dst:
+        before, after = src.getinfo('word/document.xml'), dst.getinfo('word/document.xml')
+        assert after.compress_size < before.compress_size
+        assert dst.read(after) == src.read(before)
+
+
+def test_thread_pool_only_with_xml_level(tmp_path, monkeypatch):
+    created = []
+
+    class Executor(concurrent.futures.ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            created.append(self)
+            super().__init__(*args, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, 'ThreadPoolExecutor', Executor)
+    source = xml_document(tmp_path)
+    counts = {}
+    for level in (None, 6):
+        del created[:]
+        compress_document(source, str(tmp_path / f'{level}.docx'),
+                          CompressionOptions(xml_level=level), workers=2)
+        counts[level] = len(created)
+    # 重新压缩 XML 时多一个压缩线程池，不重新压缩时不创建
+    assert counts[6] == counts[None] + 1
@@ -0,0 +1,62 @@
+import io
+import zipfile
+
+from PIL import Image
+
+from DocOptimizer import CompressionOptions, compress_document, measure_display_sizes
+from conftest import document_parts, noise_jpeg
+
+DRAWING = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<w:body><w:p><w:r><w:drawing><wp:inline><wp:extent cx="{cx}" cy="{cy}"/>'
+    '<a:graphic><a:graphicData><pic:pic><pic:blipFill><a:blip r:embed="rId1"/>{crop}'
+    '</pic:blipFill></pic:pic></a:graphicData></a:graphic></wp:inline></w:drawing>'
+    '</w:r></w:p></w:body></w:document>')
+
+
+def drawing_parts(cx, cy, crop=''):
+    """正文以 cx × cy EMU 显示一张 1024×768 的图片"""
+    parts = document_parts()
+    parts['word/document.xml'] = DRAWING.format(cx=cx, cy=cy, crop=crop)
+    parts['word/media/image1.jpeg'] = noise_jpeg((1024, 768))
+    return parts
+
+
+def image_size(path):
+    with zipfile.ZipFile(path) as zipf:
+        with Image.open(io.BytesIO(zipf.read('word/media/image1.jpeg'))) as img:
+            return img.size
+
+
+def test_measure_display_sizes_applies_crop(make_document):
+    # 2 × 1.5 英寸，左右各裁掉 25%，整张图片的显示宽度为 4 英寸
+    source = make_document(drawing_parts(2 * 914400, 1371600,
+                                         '<a:srcRect l="25000" r="25000"/>'))
+    with zipfile.ZipFile(source) as src:
+        sizes = measure_display_sizes(src, src.infolist(), 96)
+    assert sizes == {'word/media/image1.jpeg': (384, 144)}
+
+
+def test_dpi_downsamples_to_displayed_size(make_document, tmp_path):
+    # 1 × 0.75 英寸，96 DPI 下只需要 96 × 72 像素
+    source = make_document(drawing_parts(914400, 685800))
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(source, output, CompressionOptions(dpi=96))
+    assert result.verified
+    assert image_size(output) == (96, 72)
+
+    # 没有设置 DPI，或者显示尺寸无法确定时保持原始分辨率
+    compress_document(source, output)
+    assert image_size(output) == (1024, 768)
+    parts = drawing_parts(914400, 685800)
+    parts['word/document.xml'] = parts['word/document.xml'].replace(
+        '</w:body>', '<w:p><v:imagedata xmlns:v="urn:schemas-microsoft-com:vml" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+        'r:id="rId1"/></w:p></w:body>')
+    compress_document(make_document(parts, 'vml.docx'), output, CompressionOptions(dpi=96))
+    assert image_size(output) == (1024, 768)
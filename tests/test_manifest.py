@@ -0,0 +1,34 @@
+import os
+
+from DocOptimizer import CompressionOptions, Manifest, compress_batch
+from conftest import document_parts, noise_jpeg
+
+
+def test_incremental_batch_skips_unchanged_documents(make_document, tmp_path):
+    jobs = [(make_document(name=f'{name}.docx'), str(tmp_path / f'out-{name}.docx'))
+            for name in ('a', 'b')]
+    manifest_path = str(tmp_path / 'manifest.sqlite')
+
+    def run(options=None):
+        manifest = Manifest(manifest_path)
+        try:
+            return [result.unchanged for result in compress_batch(jobs, options,
+                                                                  manifest=manifest)]
+        finally:
+            manifest.close()
+
+    assert run() == [False, False]
+    assert run() == [True, True]
+
+    # 复制后内容相同、只有修改时间不同的输入按哈希判断仍未变化
+    os.utime(jobs[0][0], ns=(0, 0))
+    assert run() == [True, True]
+
+    # 输入内容、输出文件或压缩参数变化时重新压缩
+    parts = document_parts()
+    parts['word/media/image1.jpeg'] = noise_jpeg()
+    make_document(parts, 'a.docx')
+    os.remove(jobs[1][1])
+    assert run() == [False, False]
+    assert run(CompressionOptions(quality=50)) == [False, False]
+    assert run(CompressionOptions(quality=50)) == [True, True]
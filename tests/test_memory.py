@@ -0,0 +1,85 @@
+import io
+import struct
+import threading
+import zipfile
+import zlib
+
+from PIL import Image
+
+from DocOptimizer import CompressionOptions, MemoryBudget, compress_document
+from conftest import CONTENT_TYPES, DOCUMENT_RELS, document_parts, noise_jpeg
+
+
+def bomb_png(width, height):
+    """图片头声明 width × height 的 PNG，实际数据只有 1×1"""
+    out = io.BytesIO()
+    Image.new('RGB', (1, 1)).save(out, format='PNG')
+    data = bytearray(out.getvalue())
+    # IHDR 紧跟在 8 字节签名之后：长度、类型、宽、高……，最后是 CRC
+    data[16:24] = struct.pack('>II', width, height)
+    data[29:33] = struct.pack('>I', zlib.crc32(bytes(data[12:29])))
+    return bytes(data)
+
+
+def image_size(path, name='word/media/image1.jpeg'):
+    with zipfile.ZipFile(path) as zipf:
+        with Image.open(io.BytesIO(zipf.read(name))) as img:
+            return img.size
+
+
+def test_oversize_jpeg_is_downscaled_or_skipped(make_document, tmp_path):
+    parts = document_parts()
+    parts['word/media/image1.jpeg'] = noise_jpeg((2048, 1536), quality=50)
+    source = make_document(parts)
+    output = str(tmp_path / 'output.docx')
+
+    # 完整解码需要约 9MB 加上两份原始数据，缩小到上限以内再处理
+    result = compress_document(source, output, CompressionOptions(memory_limit=8 * 1024 ** 2))
+    assert result.verified and result.images_skipped == 0
+    width, height = image_size(output)
+    assert width < 2048 and abs(width / height - 4 / 3) < 0.01
+
+    result = compress_document(source, output, CompressionOptions(memory_limit=8 * 1024 ** 2,
+                                                                  oversize='skip'))
+    assert result.images_skipped == 1
+    assert image_size(output) == (2048, 1536)
+
+
+def test_decompression_bomb_is_never_decoded(make_document, tmp_path):
+    parts = document_parts()
+    parts['[Content_Types].xml'] = CONTENT_TYPES.replace(
+        '<Override ', '<Default Extension="png" ContentType="image/png"/><Override ')
+    parts['word/_rels/document.xml.rels'] = DOCUMENT_RELS.replace(
+        '</Relationships>',
+        '<Relationship Id="rId3" Target="media/image2.png" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"/>'
+        '</Relationships>')
+    parts['word/media/image2.png'] = bomb = bomb_png(60000, 60000)
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(make_document(parts), output,
+                               CompressionOptions(memory_limit=256 * 1024 ** 2))
+    # PNG 不能按比例解码，超出上限时保留原图；JPEG 照常压缩
+    assert result.verified and result.images_skipped == 1
+    with zipfile.ZipFile(output) as zipf:
+        assert zipf.read('word/media/image2.png') == bomb
+
+
+def test_memory_budget_waits_for_release():
+    budget = MemoryBudget(100)
+    budget.acquire(60)
+    acquired = threading.Event()
+
+    def acquire():
+        budget.acquire(60)
+        acquired.set()
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    assert not acquired.wait(0.2)
+    budget.release(60)
+    assert acquired.wait(5)
+    thread.join()
+    # 超过上限的单项在没有其他占用时也能运行
+    budget.release(60)
+    budget.acquire(500)
+    assert budget.used == 500
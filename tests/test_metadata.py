@@ -0,0 +1,69 @@
+import io
+import os
+import zipfile
+
+from PIL import Image, ImageCms
+
+from DocOptimizer import (THUMBNAIL_REL_TYPE, THUMBNAIL_SIZE, CompressionOptions,
+                          compress_document, recompress_image)
+from conftest import PACKAGE_RELS, document_parts
+
+EXIF_ORIENTATION = 0x0112
+EXIF_SOFTWARE = 0x0131
+
+
+def tagged_jpeg(size=(320, 240)):
+    """带 EXIF（方向为顺时针旋转 90°）和 sRGB ICC 配置文件的 JPEG"""
+    img = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+    exif = Image.Exif()
+    exif[EXIF_ORIENTATION] = 6
+    exif[EXIF_SOFTWARE] = 'camera'
+    icc = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+    out = io.BytesIO()
+    img.save(out, format='JPEG', quality=95, exif=exif, icc_profile=icc)
+    return out.getvalue()
+
+
+def test_strip_applies_orientation_and_drops_metadata():
+    data = tagged_jpeg()
+    with Image.open(io.BytesIO(recompress_image(data, '.jpeg', 75))) as img:
+        # 方向应用到像素上，EXIF 和 sRGB 配置文件都不再写入
+        assert img.size == (240, 320)
+        assert not img.info.get('exif') and not img.info.get('icc_profile')
+
+    with Image.open(io.BytesIO(recompress_image(data, '.jpeg', 75, metadata='keep'))) as img:
+        assert img.size == (320, 240)
+        exif = img.getexif()
+        assert (exif[EXIF_ORIENTATION], exif[EXIF_SOFTWARE]) == (6, 'camera')
+        assert img.info.get('icc_profile')
+
+
+def thumbnail_parts():
+    parts = document_parts()
+    parts['_rels/.rels'] = PACKAGE_RELS.replace(
+        '</Relationships>',
+        f'<Relationship Id="rId2" Target="docProps/thumbnail.jpeg" Type="{THUMBNAIL_REL_TYPE}"/>'
+        '</Relationships>')
+    parts['docProps/thumbnail.jpeg'] = tagged_jpeg((1024, 768))
+    return parts
+
+
+def test_thumbnail_is_shrunk_or_removed(make_document, tmp_path):
+    source = make_document(thumbnail_parts())
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(source, output, CompressionOptions(thumbnail='shrink'))
+    assert result.verified
+    with zipfile.ZipFile(output) as zipf:
+        with Image.open(io.BytesIO(zipf.read('docProps/thumbnail.jpeg'))) as img:
+            assert max(img.size) == THUMBNAIL_SIZE and not img.info.get('exif')
+
+    result = compress_document(source, output, CompressionOptions(thumbnail='remove'))
+    assert result.verified and result.removed_parts == ['docProps/thumbnail.jpeg']
+    with zipfile.ZipFile(output) as zipf:
+        assert 'docProps/thumbnail.jpeg' not in zipf.namelist()
+        assert 'thumbnail' not in zipf.read('_rels/.rels').decode('utf-8')
+
+    # 默认保留原样
+    compress_document(source, output)
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(output) as zipf:
+        assert zipf.read('docProps/thumbnail.jpeg') == src.read('docProps/thumbnail.jpeg')
@@ -0,0 +1,42 @@
+import json
+import zipfile
+
+import pytest
+
+from DocOptimizer import JsonLinesLog, Metrics, PrometheusMetrics, compress_document
+
+
+def test_compression_emits_structured_events(make_document, tmp_path):
+    log_path = str(tmp_path / 'metrics.jsonl')
+    prometheus = PrometheusMetrics()
+    metrics = Metrics(JsonLinesLog(log_path), prometheus)
+    source = make_document()
+    result = compress_document(source, str(tmp_path / 'output.docx'), metrics=metrics)
+    metrics.close()
+
+    with open(log_path, encoding='utf-8') as f:
+        events = [json.loads(line) for line in f]
+    assert [event['event'] for event in events] == ['image', 'document']
+    image, document = events
+    assert (image['name'], image['codec'], image['outcome']) == (
+        'word/media/image1.jpeg', 'JPEG', 'encoded')
+    assert image['bytes_out'] < image['bytes_in'] and image['quality'] == 75
+    assert {'read', 'decode', 'encode'} <= set(image['stages'])
+    assert (document['document'], document['bytes_out']) == (source, result.comp_size)
+    assert document['error'] is None and document['images'] == 1
+    assert {'read', 'write', 'verify'} <= set(document['stages'])
+
+    text = prometheus.render()
+    assert 'docoptimizer_documents_total{status="ok"} 1' in text
+    assert 'docoptimizer_images_total{codec="JPEG",outcome="encoded"} 1' in text
+    assert 'docoptimizer_document_seconds_count 1' in text
+
+
+def test_failed_document_emits_error(tmp_path):
+    events = []
+    broken = tmp_path / 'broken.docx'
+    broken.write_bytes(b'not a zip')
+    with pytest.raises(zipfile.BadZipFile):
+        compress_document(str(broken), str(tmp_path / 'output.docx'), metrics=Metrics(events.append))
+    assert [event['event'] for event in events] == ['document']
+    assert events[0]['error'] and events[0]['bytes_out'] == 0
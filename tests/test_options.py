@@ -0,0 +1,14 @@
+from DocOptimizer import build_parser, options_from_args
+
+
+def test_options_from_args_covers_every_option():
+    args = build_parser().parse_args([
+        '-q', '60', '--dpi', '150', '--target-size', '2MB', '--memory-limit', '512MB',
+        '--oversize', 'skip', '--png-palette', '--min-ssim', '0.98', '--metadata', 'keep',
+        '--thumbnail', 'remove', '--no-dedup', '--keep-orphans', '--xml-level', 'max'])
+    options = options_from_args(args)
+    assert vars(options) == {
+        'quality': 60, 'dedup': False, 'dpi': 150, 'target_size': 2 * 1024 ** 2,
+        'memory_limit': 512 * 1024 ** 2, 'oversize': 'skip', 'png_palette': 40.0,
+        'min_ssim': 0.98, 'metadata': 'keep', 'thumbnail': 'remove', 'prune_orphans': False,
+        'xml_level': 'max'}
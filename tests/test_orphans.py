@@ -0,0 +1,51 @@
+import zipfile
+
+from DocOptimizer import CompressionOptions, compress_document, find_orphan_parts
+from conftest import CONTENT_TYPES, DOCUMENT_RELS, document_parts, noise_jpeg
+
+
+def orphan_parts():
+    """image2 和它的 Override 没有被任何关系引用，另有一个指向不存在部件的 Override"""
+    parts = document_parts()
+    parts['[Content_Types].xml'] = CONTENT_TYPES.replace(
+        '<Override ', '<Override PartName="/word/media/image2.jpeg" ContentType="image/jpeg"/>'
+        '<Override PartName="/word/footer1.xml" ContentType="application/xml"/><Override ')
+    # 关系中的目标与部件名大小写不同时仍然可达
+    parts['word/_rels/document.xml.rels'] = DOCUMENT_RELS.replace(
+        'embeddings/oleObject1.bin', 'embeddings/OLEObject1.bin')
+    parts['word/media/image2.jpeg'] = noise_jpeg()
+    return parts
+
+
+def test_find_orphan_parts(make_document):
+    with zipfile.ZipFile(make_document(orphan_parts())) as src:
+        orphans, stale = find_orphan_parts(src, src.infolist())
+    assert orphans == {'word/media/image2.jpeg'}
+    assert stale == {'word/footer1.xml'}
+
+    # 关系文件无法解析时不移除任何部件
+    parts = orphan_parts()
+    parts['word/_rels/document.xml.rels'] = '<Relationships'
+    with zipfile.ZipFile(make_document(parts, 'broken.docx')) as src:
+        assert find_orphan_parts(src, src.infolist()) == (set(), set())
+
+
+def test_orphans_are_pruned(make_document, tmp_path):
+    source = make_document(orphan_parts())
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(source, output)
+    assert result.verified and result.removed_parts == ['word/media/image2.jpeg']
+    assert result.removed_bytes > len(orphan_parts()['word/media/image2.jpeg']) * 0.9
+    with zipfile.ZipFile(output) as zipf:
+        names = zipf.namelist()
+        content_types = zipf.read('[Content_Types].xml').decode('utf-8')
+    assert 'word/media/image2.jpeg' not in names
+    assert 'word/embeddings/oleObject1.bin' in names
+    # 移除的部件和不存在的部件的 Override 一起去掉
+    assert 'image2.jpeg' not in content_types and 'footer1.xml' not in content_types
+    assert '/word/document.xml' in content_types
+
+    result = compress_document(source, output, CompressionOptions(prune_orphans=False))
+    assert result.removed_parts == []
+    with zipfile.ZipFile(output) as zipf:
+        assert 'word/media/image2.jpeg' in zipf.namelist()
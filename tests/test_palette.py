@@ -0,0 +1,55 @@
+import io
+import os
+import random
+
+from PIL import Image, ImageChops, ImageDraw
+
+from DocOptimizer import DEFAULT_PALETTE_PSNR, palette_image, recompress_image
+
+
+def screenshot(size=(320, 200), colors=12):
+    """纯色块和文字组成的截图式图片，颜色不超过 colors 种"""
+    rng = random.Random(1)
+    palette = [tuple(rng.randrange(256) for _ in range(3)) for _ in range(colors)]
+    img = Image.new('RGB', size, palette[0])
+    draw = ImageDraw.Draw(img)
+    # 不做抗锯齿，文字不引入新的颜色
+    draw.fontmode = '1'
+    for _ in range(40):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.rectangle((x, y, x + rng.randrange(80), y + rng.randrange(40)),
+                       fill=rng.choice(palette))
+        draw.text((x, y), 'DocOptimizer', fill=rng.choice(palette))
+    return img
+
+
+def encode_png(img):
+    out = io.BytesIO()
+    img.save(out, format='PNG')
+    return out.getvalue()
+
+
+def test_palette_image_is_lossless_for_few_colors():
+    img = screenshot()
+    indexed = palette_image(img, DEFAULT_PALETTE_PSNR)
+    assert indexed.mode == 'P'
+    assert ImageChops.difference(indexed.convert('RGB'), img).getbbox() is None
+
+    # 颜色过多的照片式图片，以及达不到质量要求的量化都不转换
+    noise = Image.frombytes('RGB', (128, 128), os.urandom(128 * 128 * 3))
+    assert palette_image(noise, DEFAULT_PALETTE_PSNR) is None
+    gradient = Image.merge('RGB', [Image.linear_gradient('L').resize((256, 256)),
+                                   Image.linear_gradient('L').rotate(90).resize((256, 256)),
+                                   Image.new('L', (256, 256), 128)])
+    assert palette_image(gradient, 20).mode == 'P'
+    assert palette_image(gradient, 99) is None
+
+
+def test_recompress_png_with_palette():
+    data = encode_png(screenshot())
+    plain = recompress_image(data, '.png', 75)
+    quantized = recompress_image(data, '.png', 75, palette=DEFAULT_PALETTE_PSNR)
+    assert len(quantized) < len(plain)
+    with Image.open(io.BytesIO(plain)) as a, Image.open(io.BytesIO(quantized)) as b:
+        assert (a.mode, b.mode) == ('RGB', 'P')
+        assert ImageChops.difference(a.convert('RGB'), b.convert('RGB')).getbbox() is None
@@ -0,0 +1,50 @@
+import zipfile
+
+import DocOptimizer
+from DocOptimizer import CompressionPool, compress_document
+from conftest import DOCUMENT_RELS, document_parts, noise_jpeg
+
+
+def image_parts(count):
+    """正文引用 count 张噪声 JPEG 的文档"""
+    parts = document_parts()
+    relationships = ''.join(
+        f'<Relationship Id="rId{i + 10}" Target="media/image{i}.jpeg" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"/>'
+        for i in range(2, count + 1))
+    parts['word/_rels/document.xml.rels'] = DOCUMENT_RELS.replace(
+        '</Relationships>', relationships + '</Relationships>')
+    for i in range(1, count + 1):
+        parts[f'word/media/image{i}.jpeg'] = noise_jpeg()
+    return parts
+
+
+def test_workers_compress_images_in_process_pool(make_document, tmp_path, monkeypatch):
+    source = make_document(image_parts(4))
+    serial = str(tmp_path / 'serial.docx')
+    assert compress_document(source, serial).verified
+
+    pools = []
+
+    class RecordingPool(CompressionPool):
+        def __init__(self, workers):
+            super().__init__(workers)
+            self.workers = workers
+            self.submitted = []
+            pools.append(self)
+
+        def submit(self, fn, token, func, *args):
+            self.submitted.append(func.__name__)
+            return super().submit(fn, token, func, *args)
+
+    monkeypatch.setattr(DocOptimizer, 'CompressionPool', RecordingPool)
+    parallel = str(tmp_path / 'parallel.docx')
+    result = compress_document(source, parallel, workers=2)
+    assert result.error is None and result.verified
+    # 每张图片和输出校验都提交到进程池，结果与单进程压缩完全相同
+    assert [pool.workers for pool in pools] == [2]
+    assert pools[0].submitted == ['recompress_image_timed'] * 4 + ['verify_document']
+    with zipfile.ZipFile(serial) as first, zipfile.ZipFile(parallel) as second:
+        assert first.namelist() == second.namelist()
+        for name in first.namelist():
+            assert first.read(name) == second.read(name)
@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from DocOptimizer import CompressionCanceled, DocumentCompressor
+
+
+def test_read_ahead_is_bounded_and_ordered(make_document, tmp_path):
+    compressor = DocumentCompressor(make_document(), str(tmp_path / 'output.docx'))
+    produced = []
+
+    def produce(src):
+        for i in range(20):
+            produced.append(i)
+            yield i
+
+    with compressor.read_ahead(produce, 3) as items:
+        assert next(items) == 0
+        time.sleep(0.3)
+        # 队列满时读取线程等待：队列中 3 项，加上正在放入的一项
+        assert len(produced) <= 5
+        assert list(items) == list(range(1, 20))
+
+
+def test_read_ahead_raises_in_order(make_document, tmp_path):
+    compressor = DocumentCompressor(make_document(), str(tmp_path / 'output.docx'))
+
+    def produce(src):
+        # 读取线程中打开的是同一个输入文档
+        yield src.namelist()[0]
+        yield 1
+        raise ValueError('broken entry')
+
+    with compressor.read_ahead(produce, 4) as items:
+        assert next(items) == '[Content_Types].xml'
+        assert next(items) == 1
+        with pytest.raises(ValueError, match='broken entry'):
+            next(items)
+
+
+def test_read_ahead_stops_when_canceled(make_document, tmp_path):
+    compressor = DocumentCompressor(make_document(), str(tmp_path / 'output.docx'))
+    release = threading.Event()
+
+    def produce(src):
+        yield 0
+        release.wait(10)
+        yield 1
+
+    with compressor.read_ahead(produce, 2) as items:
+        assert next(items) == 0
+        threading.Timer(0.1, compressor.cancel).start()
+        start = time.perf_counter()
+        # 等待中的迭代器立即停止，不等读取线程产出下一项
+        with pytest.raises(CompressionCanceled):
+            next(items)
+        assert time.perf_counter() - start < 5
+        release.set()
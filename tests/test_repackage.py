@@ -0,0 +1,31 @@
+import os
+import zipfile
+
+from DocOptimizer import compress_document
+
+
+def test_compress_document_streams_entries(make_document, tmp_path, monkeypatch):
+    source = make_document()
+
+    def extractall(*args, **kwargs):
+        raise AssertionError('不应解压到临时目录')
+
+    monkeypatch.setattr(zipfile.ZipFile, 'extractall', extractall)
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(source, output)
+    assert result.error is None and result.verified
+    assert result.comp_size < result.orig_size
+    # 没有留下解压目录或临时文件
+    assert sorted(os.listdir(tmp_path)) == ['input.docx', 'output.docx']
+
+    with zipfile.ZipFile(source) as src, zipfile.ZipFile(output) as dst:
+        # 条目顺序与源文档一致，未改动的条目原样拷贝压缩后的数据
+        assert dst.namelist() == src.namelist()
+        for info in src.infolist():
+            copied = dst.getinfo(info.filename)
+            if info.filename.startswith('word/media/'):
+                assert copied.file_size < info.file_size
+                continue
+            assert (copied.compress_type, copied.CRC, copied.compress_size) == (
+                info.compress_type, info.CRC, info.compress_size)
+            assert dst.read(copied) == src.read(info)
@@ -0,0 +1,79 @@
+import asyncio
+import json
+import threading
+import time
+
+import DocOptimizerService
+from DocOptimizer import DocumentCompressor, check_canceled
+from DocOptimizerService import CompressionService
+
+
+async def request(port, method, path, body=b''):
+    """发送一个请求，返回 (状态码, 响应体)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n'
+                 f'Content-Length: {len(body)}\r\n\r\n'.encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, data = response.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), data
+
+
+def test_compress_sync_returns_document(make_document, tmp_path):
+    with open(make_document(), 'rb') as f:
+        body = f.read()
+
+    async def main():
+        service = CompressionService(spool_dir=str(tmp_path))
+        try:
+            server = await service.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            status, data = await request(port, 'POST', '/compress?quality=50', body)
+            server.close()
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, service.shutdown)
+        service.close()
+        return status, data
+
+    status, data = asyncio.run(main())
+    assert status == 200
+    assert data.startswith(b'PK') and len(data) < len(body)
+
+
+def test_shutdown_cancels_sync_compression(make_document, tmp_path, monkeypatch):
+    started = threading.Event()
+
+    class SlowCompressor(DocumentCompressor):
+        def compress_package(self):
+            started.set()
+            while True:
+                check_canceled()
+                time.sleep(0.01)
+
+    monkeypatch.setattr(DocOptimizerService, 'DocumentCompressor', SlowCompressor)
+    with open(make_document(), 'rb') as f:
+        body = f.read()
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        service = CompressionService(spool_dir=str(tmp_path))
+        server = await service.start('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        response = asyncio.ensure_future(request(port, 'POST', '/compress', body))
+        assert await loop.run_in_executor(None, started.wait, 5)
+        assert len(service.sync_jobs) == 1 and service.active == 1
+        server.close()
+        # 同步压缩没有登记在 jobs 中，shutdown 仍要取消它，而不是等它完成
+        start = time.perf_counter()
+        await asyncio.wait_for(loop.run_in_executor(None, service.shutdown), 5)
+        elapsed = time.perf_counter() - start
+        status, data = await response
+        assert service.cleanup_task is None
+        service.close()
+        return elapsed, status, json.loads(data), service
+
+    elapsed, status, error, service = asyncio.run(main())
+    assert elapsed < 1
+    assert status == 422 and error['error']
+    assert not service.sync_jobs and service.active == 0
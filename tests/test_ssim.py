@@ -0,0 +1,57 @@
+import io
+
+import numpy
+from PIL import Image, ImageFilter
+
+from DocOptimizer import luma_proxy, recompress_image, ssim, ssim_reference
+
+
+def photo(size=(480, 360)):
+    """平滑渐变加轻微噪声的照片式图片，颜色太多，不能无损转为调色板"""
+    rng = numpy.random.default_rng(1)
+    x = numpy.linspace(0, 255, size[0])
+    y = numpy.linspace(0, 255, size[1])[:, None]
+    pixels = numpy.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=2)
+    pixels += rng.normal(0, 2, pixels.shape)
+    return Image.fromarray(pixels.clip(0, 255).astype(numpy.uint8), 'RGB')
+
+
+def encode(img, format):
+    out = io.BytesIO()
+    img.save(out, format=format)
+    return out.getvalue()
+
+
+def image_format(data):
+    with Image.open(io.BytesIO(data)) as img:
+        return img.format
+
+
+def test_ssim_orders_distortions():
+    img = photo()
+    reference = luma_proxy(img)
+    assert ssim(reference, reference) == 1.0
+    slight = luma_proxy(img.filter(ImageFilter.GaussianBlur(0.5)))
+    strong = luma_proxy(img.filter(ImageFilter.GaussianBlur(3)))
+    assert 1.0 > ssim(reference, slight) > ssim(reference, strong)
+    # 预先计算的参考结果与直接比较相同
+    assert ssim(ssim_reference(reference), strong) == ssim(reference, strong)
+
+
+def test_min_ssim_selects_smallest_passing_encoding():
+    data = encode(photo(), 'PNG')
+    lossless = recompress_image(data, '.png', 75)
+    selected = recompress_image(data, '.png', 75, min_ssim=0.9)
+    # 照片式的 PNG 改为通过质量检查的 JPEG
+    assert image_format(selected) == 'JPEG' and len(selected) < len(lossless) / 2
+    with Image.open(io.BytesIO(selected)) as decoded:
+        assert ssim(luma_proxy(photo()), luma_proxy(decoded)) >= 0.9
+
+    # 下限过高时没有 JPEG 候选通过，保持无损编码
+    assert image_format(recompress_image(data, '.png', 75, min_ssim=0.99999)) == 'PNG'
+
+    # 有透明像素的图片不能改为 JPEG
+    transparent = photo().convert('RGBA')
+    transparent.putpixel((0, 0), (0, 0, 0, 0))
+    selected = recompress_image(encode(transparent, 'PNG'), '.png', 75, min_ssim=0.5)
+    assert image_format(selected) == 'PNG'
@@ -0,0 +1,52 @@
+import io
+import os
+import zipfile
+
+from PIL import Image
+
+import DocOptimizer
+from DocOptimizer import compress_document, entry_storage
+from conftest import CONTENT_TYPES, DOCUMENT_RELS, document_parts
+
+
+def test_entry_storage_policy():
+    assert entry_storage('word/media/image1.JPEG') == (zipfile.ZIP_STORED, None)
+    assert entry_storage('word/media/image2.png') == (zipfile.ZIP_STORED, None)
+    assert entry_storage('word/document.xml') == (zipfile.ZIP_DEFLATED, 9)
+    assert entry_storage('word/_rels/document.xml.rels') == (zipfile.ZIP_DEFLATED, 9)
+    assert entry_storage('word/media/image3.bmp') == (zipfile.ZIP_DEFLATED, 6)
+
+
+def test_recompressed_media_is_stored(make_document, tmp_path):
+    output = str(tmp_path / 'output.docx')
+    assert compress_document(make_document(), output).verified
+    with zipfile.ZipFile(output) as dst:
+        assert dst.getinfo('word/media/image1.jpeg').compress_type == zipfile.ZIP_STORED
+        assert dst.getinfo('word/document.xml').compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_larger_output_keeps_original(make_document, tmp_path, monkeypatch):
+    # 纯色 BMP 原条目压缩后只有几百字节
+    img = Image.new('RGB', (512, 512), (200, 30, 30))
+    out = io.BytesIO()
+    img.save(out, format='BMP')
+    parts = document_parts()
+    parts['[Content_Types].xml'] = CONTENT_TYPES.replace(
+        '<Override ', '<Default Extension="bmp" ContentType="image/bmp"/><Override ')
+    parts['word/_rels/document.xml.rels'] = DOCUMENT_RELS.replace(
+        'media/image1.jpeg', 'media/image1.bmp')
+    del parts['word/media/image1.jpeg']
+    parts['word/media/image1.bmp'] = out.getvalue()
+    source = make_document(parts)
+
+    # 编码结果比原图小，但无法再压缩，写入后整个文档反而变大
+    def incompressible(data, *settings):
+        return os.urandom(len(data) // 2), {}
+
+    monkeypatch.setattr(DocOptimizer, 'recompress_image_timed', incompressible)
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(source, output)
+    assert result.kept_original and result.comp_size == result.orig_size
+    with open(source, 'rb') as a, open(output, 'rb') as b:
+        assert a.read() == b.read()
+    assert sorted(os.listdir(tmp_path)) == ['input.docx', 'output.docx']
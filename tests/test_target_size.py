@@ -0,0 +1,53 @@
+import io
+import zipfile
+
+import DocOptimizer
+from DocOptimizer import MIN_TARGET_QUALITY, CompressionOptions, compress_document
+from PIL import Image
+from conftest import CONTENT_TYPES, DOCUMENT_RELS, document_parts, noise_jpeg
+
+
+def png_parts():
+    """正文引用一张噪声 JPEG 和一张未压缩的渐变 PNG，PNG 重新压缩后缩小到几 KB"""
+    img = Image.linear_gradient('L').resize((1024, 1024)).convert('RGB')
+    out = io.BytesIO()
+    img.save(out, format='PNG', compress_level=0)
+    parts = document_parts()
+    parts['[Content_Types].xml'] = CONTENT_TYPES.replace(
+        '<Override ', '<Default Extension="png" ContentType="image/png"/><Override ')
+    parts['word/_rels/document.xml.rels'] = DOCUMENT_RELS.replace(
+        '</Relationships>',
+        '<Relationship Id="rId3" Target="media/image2.png" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"/>'
+        '</Relationships>')
+    parts['word/media/image1.jpeg'] = noise_jpeg((512, 384))
+    parts['word/media/image2.png'] = out.getvalue()
+    return parts
+
+
+def test_target_size_counts_recompressed_png(tmp_path, monkeypatch):
+    source = str(tmp_path / 'input.docx')
+    with zipfile.ZipFile(source, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for name, data in png_parts().items():
+            # 直接存储 PNG，原条目比目标大小大得多
+            zipf.writestr(name, data, zipfile.ZIP_STORED if name.endswith('.png') else None)
+    target = 70000
+    with zipfile.ZipFile(source) as src:
+        assert src.getinfo('word/media/image2.png').compress_size > 10 * target
+
+    encoded = []
+    recompress_image_timed = DocOptimizer.recompress_image_timed
+
+    def counting(data, ext, *settings):
+        encoded.append(ext)
+        return recompress_image_timed(data, ext, *settings)
+
+    monkeypatch.setattr(DocOptimizer, 'recompress_image_timed', counting)
+    result = compress_document(source, str(tmp_path / 'output.docx'),
+                               CompressionOptions(target_size=target))
+    assert result.error is None and result.verified
+    # PNG 按压缩后的大小计入预算，JPEG 不会降到最低质量
+    assert result.chosen_quality > MIN_TARGET_QUALITY + 10
+    assert result.comp_size <= target * 1.03
+    # 估算时压缩过的 PNG 在写入时直接复用
+    assert sorted(encoded) == ['.jpeg', '.png']
@@ -0,0 +1,124 @@
+import io
+import zipfile
+
+import pytest
+from PIL import Image
+
+import DocOptimizer
+from DocOptimizer import CompressionOptions, compress_document, verify_document
+from conftest import CONTENT_TYPES, document_parts
+
+
+def source_state(path):
+    """校验输出时与源文档比较用的 (source_parts, dangling)，与 check_output 相同"""
+    with zipfile.ZipFile(path) as zipf:
+        infos = zipf.infolist()
+        return ({info.filename.lower(): (info.CRC, info.compress_size) for info in infos},
+                DocOptimizer.find_dangling_parts(zipf, infos))
+
+
+def bitmap_parts():
+    """正文引用一张 BMP 的文档，BMP 有 Override，按 --min-ssim 会转换为 PNG"""
+    img = Image.new('RGB', (256, 256), (40, 90, 160))
+    out = io.BytesIO()
+    img.save(out, format='BMP')
+    parts = document_parts()
+    del parts['word/media/image1.jpeg']
+    parts['word/_rels/document.xml.rels'] = parts['word/_rels/document.xml.rels'].replace(
+        'media/image1.jpeg', 'media/image1.bmp')
+    parts['[Content_Types].xml'] = CONTENT_TYPES.replace(
+        '<Override ', '<Default Extension="png" ContentType="image/png"/>'
+        '<Override PartName="/word/media/image1.bmp" ContentType="image/bmp"/><Override ')
+    parts['word/media/image1.bmp'] = out.getvalue()
+    return parts
+
+
+def test_verify_document_accepts_valid_document(make_document):
+    assert verify_document(make_document()) == []
+
+
+def test_verify_document_requires_content_types(make_document):
+    parts = document_parts()
+    del parts['[Content_Types].xml']
+    assert verify_document(make_document(parts)) == ['缺少 [Content_Types].xml']
+
+
+def test_verify_document_reports_broken_parts(make_document):
+    parts = document_parts()
+    parts['word/document.xml'] = parts['word/document.xml'][:-20]
+    parts['word/media/image1.jpeg'] = b'\x89PNG\r\n\x1a\n' + bytes(64)
+    del parts['word/embeddings/oleObject1.bin']
+    problems = verify_document(make_document(parts))
+    # 问题按条目在压缩包中的顺序报告
+    assert len(problems) == 3
+    assert problems[0].startswith('word/document.xml: ')
+    assert problems[1] == 'word/_rels/document.xml.rels: 关系目标不存在 embeddings/oleObject1.bin'
+    assert problems[2].startswith('word/media/image1.jpeg: 图片数据与内容类型')
+
+
+def test_verify_document_reports_missing_content_type(make_document):
+    parts = document_parts()
+    parts['word/settings.dat'] = b'settings'
+    assert verify_document(make_document(parts)) == ['word/settings.dat: 没有内容类型']
+
+
+def test_verify_document_tolerates_source_problems(make_document):
+    # 源文档中本来就缺少的关系目标和内容类型不算输出的问题
+    parts = document_parts()
+    del parts['word/embeddings/oleObject1.bin']
+    parts['word/settings.dat'] = b'settings'
+    path = make_document(parts)
+    assert verify_document(path, *source_state(path)) == []
+
+
+def test_verify_document_checks_copied_data_range(make_document):
+    parts = document_parts()
+    path = make_document(parts)
+    with zipfile.ZipFile(path) as zipf:
+        source_parts = {info.filename.lower(): (info.CRC, info.compress_size)
+                        for info in zipf.infolist()}
+        info = zipf.getinfo('word/embeddings/oleObject1.bin')
+    # 原样拷贝的条目不解压，只检查数据范围：压缩后大小超出中央目录时报告数据不完整
+    with open(path, 'rb') as f:
+        archive = bytearray(f.read())
+    offset = archive.index(b'PK\x01\x02')
+    while not archive[offset + 46:].startswith(info.filename.encode()):
+        offset = archive.index(b'PK\x01\x02', offset + 4)
+    # 中央目录项中压缩后大小的位置
+    archive[offset + 20:offset + 24] = len(archive).to_bytes(4, 'little')
+    with open(path, 'wb') as f:
+        f.write(archive)
+    source_parts[info.filename.lower()] = (info.CRC, len(archive))
+    assert verify_document(path, source_parts) == [
+        'word/embeddings/oleObject1.bin: 压缩数据不完整']
+
+
+def test_verify_document_reports_targets_left_by_renames(make_document):
+    # 源文档没有悬空目标；输出中 BMP 改名为 PNG，但关系和 Override 仍指向旧部件名
+    parts = bitmap_parts()
+    source = make_document(parts, 'source.docx')
+    out = io.BytesIO()
+    Image.open(io.BytesIO(parts.pop('word/media/image1.bmp'))).save(out, format='PNG')
+    parts['word/media/image1.png'] = out.getvalue()
+    output = make_document(parts, 'output.docx')
+    assert verify_document(output, *source_state(source)) == [
+        '[Content_Types].xml: Override 指向不存在的部件 /word/media/image1.bmp',
+        'word/_rels/document.xml.rels: 关系目标不存在 media/image1.bmp']
+
+
+def test_compress_rejects_output_with_renamed_target(make_document, tmp_path, monkeypatch):
+    source = make_document(bitmap_parts())
+    output = str(tmp_path / 'output.docx')
+    options = CompressionOptions(min_ssim=0.99)
+    result = compress_document(source, output, options)
+    assert result.verified
+    with zipfile.ZipFile(output) as zipf:
+        assert 'word/media/image1.png' in zipf.namelist()
+
+    # 改名后关系文件和内容类型没有跟着改写时，校验拒绝输出
+    monkeypatch.setattr(DocOptimizer, 'rewrite_relationships', lambda data, *args: data)
+    monkeypatch.setattr(DocOptimizer, 'rewrite_content_types', lambda data, *args: data)
+    output = str(tmp_path / 'broken.docx')
+    with pytest.raises(RuntimeError, match='输出文档校验失败'):
+        compress_document(source, output, options)
+    assert not (tmp_path / 'broken.docx').exists()
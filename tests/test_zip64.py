@@ -0,0 +1,170 @@
+import io
+import os
+import shutil
+import struct
+import tracemalloc
+import zipfile
+import zlib
+
+import pytest
+
+from DocOptimizer import (COPY_CHUNK_SIZE, clone_zipinfo, compress_document, copy_raw_entry,
+                          entry_data_range, map_archive, read_entry)
+from conftest import document_parts
+
+HUGE_NAME = 'word/embeddings/oleObject1.bin'
+# 超过 4GB，之后的条目偏移也超过 32 位
+HUGE_SIZE = 4 * 1024 ** 3 + 8 * 1024 ** 2
+
+
+def zeros_crc(size):
+    zeros, crc = bytes(16 * 1024 * 1024), 0
+    for pos in range(0, size, len(zeros)):
+        crc = zlib.crc32(zeros[:min(len(zeros), size - pos)], crc)
+    return crc
+
+
+def test_clone_zipinfo_keeps_entry_fields():
+    info = zipfile.ZipInfo('word/media/image1.jpeg', (2020, 5, 17, 12, 30, 10))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.CRC = 0x12345678
+    info.compress_size = 1000
+    info.file_size = 5000
+    info.external_attr = 0o644 << 16
+    info.create_system = 3
+    info.comment = b'comment'
+    info.flag_bits = 0x08 | 0x800
+
+    zinfo = clone_zipinfo(info)
+    assert zinfo is not info
+    for field in ('filename', 'date_time', 'compress_type', 'CRC', 'compress_size',
+                  'file_size', 'external_attr', 'create_system', 'comment'):
+        assert getattr(zinfo, field) == getattr(info, field)
+    # 大小写在本地文件头中，去掉数据描述符标志，其他标志保留
+    assert zinfo.flag_bits == 0x800
+
+
+@pytest.fixture(scope='module')
+def huge_document(tmp_path_factory):
+    """超过 4GB 的稀疏文档：存储方式的大嵌入对象只写本地文件头，数据是文件空洞
+
+    大条目之后写入正文、关系和图片，它们的偏移需要 Zip64。测试还要写出同样大小的
+    输出，磁盘空间不足时跳过。
+    """
+    directory = tmp_path_factory.mktemp('zip64')
+    if shutil.disk_usage(directory).free < 3 * HUGE_SIZE:
+        pytest.skip('磁盘空间不足以写出 Zip64 输出')
+    path = str(directory / 'huge.docx')
+    parts = document_parts()
+    del parts[HUGE_NAME]
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        zipf.writestr('[Content_Types].xml', parts.pop('[Content_Types].xml'))
+        zinfo = zipfile.ZipInfo(HUGE_NAME, (2024, 1, 1, 0, 0, 0))
+        zinfo.compress_type = zipfile.ZIP_STORED
+        zinfo.file_size = zinfo.compress_size = HUGE_SIZE
+        zinfo.CRC = zeros_crc(HUGE_SIZE)
+        zinfo.header_offset = zipf.fp.tell()
+        zipf.fp.write(zinfo.FileHeader(True))
+        # 跳过数据留下空洞，读出来是零
+        zipf.fp.seek(HUGE_SIZE, os.SEEK_CUR)
+        zipf.filelist.append(zinfo)
+        zipf.NameToInfo[HUGE_NAME] = zinfo
+        zipf.start_dir = zipf.fp.tell()
+        for name, data in parts.items():
+            zipf.writestr(name, data)
+    return path
+
+
+def assert_zip64(path):
+    """检查 Zip64 中央目录结束记录和大条目的 Zip64 本地文件头，并用 testzip 校验 CRC"""
+    with open(path, 'rb') as f:
+        f.seek(-(zipfile.sizeEndCentDir64Locator + zipfile.sizeEndCentDir), os.SEEK_END)
+        locator = struct.unpack(zipfile.structEndArchive64Locator,
+                                f.read(zipfile.sizeEndCentDir64Locator))
+        assert locator[0] == zipfile.stringEndArchive64Locator
+        f.seek(locator[2])
+        record = struct.unpack(zipfile.structEndArchive64, f.read(zipfile.sizeEndCentDir64))
+        assert record[0] == zipfile.stringEndArchive64
+        # 中央目录位于 4GB 之后
+        assert record[9] > 0xFFFFFFFF
+
+    with zipfile.ZipFile(path) as zipf:
+        info = zipf.getinfo(HUGE_NAME)
+        assert info.file_size == info.compress_size == HUGE_SIZE
+        assert all(other.header_offset > 0xFFFFFFFF for other in zipf.infolist()
+                   if other.filename.startswith('word/') and other is not info)
+        with open(path, 'rb') as f:
+            f.seek(info.header_offset)
+            header = struct.unpack(zipfile.structFileHeader, f.read(zipfile.sizeFileHeader))
+            f.seek(header[10], os.SEEK_CUR)
+            extra = f.read(header[11])
+        assert header[0] == zipfile.stringFileHeader
+        assert header[8] == header[9] == 0xFFFFFFFF
+        assert struct.unpack('<HHQQ', extra[:20]) == (1, 16, HUGE_SIZE, HUGE_SIZE)
+        assert zipf.testzip() is None
+
+
+def test_source_map_slices_past_4gb(huge_document):
+    with zipfile.ZipFile(huge_document) as src, map_archive(huge_document) as source:
+        assert source is not None
+        assert len(source) == os.path.getsize(huge_document)
+        for info in src.infolist():
+            if info.filename == HUGE_NAME:
+                continue
+            assert info.header_offset > 0xFFFFFFFF or info.filename == '[Content_Types].xml'
+            assert read_entry(src, info, source) == src.read(info)
+
+        start, end = entry_data_range(src, src.getinfo(HUGE_NAME), source)
+        assert end - start == HUGE_SIZE
+        assert source.read(end - 16, end) == bytes(16)
+        # 切片按块给出，最后一块是剩余部分
+        chunks = [(type(chunk), len(chunk))
+                  for chunk in source.chunks(end - 3 * COPY_CHUNK_SIZE - 5, end)]
+        assert chunks == [(memoryview, COPY_CHUNK_SIZE)] * 3 + [(memoryview, 5)]
+
+
+class RecordingFile(io.FileIO):
+    """记录每次写入大小的输出文件"""
+
+    def __init__(self, path):
+        super().__init__(path, 'w+b')
+        self.sizes = []
+
+    def write(self, data):
+        self.sizes.append(len(data))
+        return super().write(data)
+
+
+@pytest.mark.parametrize('mapped', [True, False], ids=['mapped', 'file'])
+def test_copy_raw_entry_streams_huge_entry(huge_document, tmp_path, mapped):
+    output = str(tmp_path / 'copy.docx')
+    with zipfile.ZipFile(huge_document) as src, map_archive(huge_document) as source:
+        with RecordingFile(output) as f, zipfile.ZipFile(f, 'w') as dst:
+            tracemalloc.start()
+            try:
+                for info in src.infolist():
+                    copy_raw_entry(src, dst, info, source if mapped else None)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    # 大条目按块写出，任何时候都不会整个读入内存
+    assert max(f.sizes) <= COPY_CHUNK_SIZE
+    assert f.sizes.count(COPY_CHUNK_SIZE) == HUGE_SIZE // COPY_CHUNK_SIZE
+    assert peak < 8 * COPY_CHUNK_SIZE
+    assert_zip64(output)
+
+
+def test_compress_document_writes_zip64(huge_document, tmp_path):
+    output = str(tmp_path / 'output.docx')
+    result = compress_document(huge_document, output)
+    assert result.error is None
+    assert result.verified
+    assert not result.kept_original
+    assert result.comp_size < result.orig_size
+    assert_zip64(output)
+    with zipfile.ZipFile(huge_document) as src, zipfile.ZipFile(output) as dst:
+        source, copied = src.getinfo(HUGE_NAME), dst.getinfo(HUGE_NAME)
+        assert (copied.CRC, copied.compress_size) == (source.CRC, source.compress_size)
+        image = 'word/media/image1.jpeg'
+        assert dst.getinfo(image).file_size < src.getinfo(image).file_size
+        assert set(dst.namelist()) == set(src.namelist())